@@ -1,3 +1,14 @@
 # __init__.py
-from .superAgent import SuperAgent
-from .strategist import Strategist
+# The agents and their roles are imported on first use, so importing a
+# submodule (e.g. agents.helpers) does not load all roles.
+_EXPORTS = {
+    "SuperAgent": ".superAgent",
+    "Strategist": ".strategist",
+}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        import importlib
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,169 @@
+from .superAgent import SuperAgent
+from .strategist import Strategist
+from .helpers.asyncServer import AsyncServer
+
+from queue import Queue
+import asyncio
+
+
+class AsyncSuperAgent(AsyncServer, SuperAgent):
+    """
+    SuperAgent that runs as a task in a shared asyncio event loop instead of
+    in its own thread. Receiving and sending are coroutines, so the loop
+    switches to other agents while an agent waits for the server.
+    """
+
+    async def play(self, strategist=None, barrier=None):
+        """
+        Coroutine that runs the agent until the server says bye.
+
+        parameters
+        ----------
+        strategist: Strategist
+            The strategist that merges the graphs. If None, the agent plays
+            without the strategist.
+        barrier: StepBarrier
+            The barrier on which the agents wait for each other's belief
+            updates before merging.
+        """
+        while True:
+            # Receive a message.
+            msg = await self.receive_msg()
+
+            if msg is None:
+                self.close_socket()
+                return
+
+            # Parse the response.
+            if msg["type"] == "request-action":
+                self.start_step(msg)
+                self.update_beliefs(msg)
+
+                # Merge when all agents updated their beliefs (or when the
+                # others take too long).
+                if strategist:
+                    with self.profiler.phase('sync_strategist'):
+                        await barrier.wait(msg["content"]["step"],
+                                           min(barrier.timeout,
+                                               self.time_left() -
+                                               self.min_planning_time))
+                        strategist.merge(self)
+
+                # Give the other agents the chance to merge before acting.
+                await asyncio.sleep(0)
+
+                await self.send_request(self.select_action(msg))
+                self.finish_step(msg)
+
+            elif msg["type"] == "sim-start":
+                pass
+            elif msg["type"] == "sim-end":
+                pass
+            elif msg["type"] == "bye":
+                self.close_socket()
+                return
+            else:
+                print(f"Unknown message from the server: {msg['type']}")
+
+
+class StepBarrier(object):
+    """
+    Barrier on which agents in the same event loop wait until all agents
+    reached the same step, or until the timeout expires.
+    """
+    def __init__(self, parties, timeout=1.0):
+        """
+        Arguments
+        ---------
+        parties: int
+            The number of agents that take part.
+        timeout: float
+            The maximum number of seconds an agent waits for the others.
+        """
+        self.parties = parties
+        self.timeout = timeout
+        self._arrived = {}
+        self._events = {}
+
+        # The latest step of which the barrier released the agents, agents
+        # that arrive late for it do not wait.
+        self._released = -1
+
+    async def wait(self, step, timeout=None):
+        """
+        Wait until all agents arrived at the given step. Returns False if
+        the timeout expired first or if the barrier of the step was released
+        before the agent arrived.
+
+        Arguments
+        ---------
+        step: int
+            The step of the arriving agent.
+        timeout: float
+            The maximum number of seconds to wait, by default the timeout of
+            the barrier.
+        """
+        if step <= self._released:
+            return False
+        self._released = max(self._released, step - 1)
+
+        if step not in self._events:
+            # Forget the barriers of older steps, which releases the agents
+            # that are still waiting on them.
+            for old_step in [s for s in self._events if s < step]:
+                self._events[old_step].set()
+                del self._events[old_step], self._arrived[old_step]
+            self._events[step] = asyncio.Event()
+            self._arrived[step] = 0
+
+        event = self._events[step]
+        self._arrived[step] += 1
+        if self._arrived[step] >= self.parties:
+            self._released = step
+            event.set()
+            return True
+
+        try:
+            await asyncio.wait_for(event.wait(), max(
+                self.timeout if timeout is None else timeout, 0))
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+async def run_team(names, pw="1", use_strategist=True, barrier_timeout=1.0,
+                   strategist=None, agent_class=AsyncSuperAgent):
+    """
+    Connect the agents with the given names and run them all in the current
+    event loop.
+
+    Arguments
+    ---------
+    names: list of str
+        The usernames of the agents.
+    pw: str
+        The password of the agents.
+    use_strategist: bool
+        If the graphs of the agents should be merged by a strategist.
+    barrier_timeout: float
+        The maximum number of seconds an agent waits for the others before
+        merging.
+    strategist: Strategist
+        The strategist to use. By default a new strategist is created.
+    agent_class: type
+        The class of the agents, a subclass of AsyncSuperAgent.
+    """
+    agents = [agent_class(name, pw) for name in names]
+    await asyncio.gather(*[agent.connect_socket() for agent in agents])
+    await asyncio.gather(*[agent.authorize_socket() for agent in agents])
+
+    barrier = None
+    if use_strategist:
+        if not strategist:
+            strategist = Strategist("Strategist", [Queue(), Queue()])
+        for agent in agents:
+            strategist.register(agent)
+        barrier = StepBarrier(len(agents), barrier_timeout)
+
+    await asyncio.gather(*[agent.play(strategist, barrier)
+                           for agent in agents])
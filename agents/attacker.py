@@ -1,41 +1,37 @@
-from .helpers import Agent
-from keras.models import load_model
-from keras import metrics
-import tensorflow as tf
-import os
+from .helpers.modelService import ModelService
+from .role import Role
 import random
 import time
 
 
-def root_mean_squared_error(y_true, y_pred):
-    return K.sqrt(K.mean(K.square(y_pred - y_true)))
+class Attacker(Role):
+    # Start loading the shared model as soon as an agent acts as attacker,
+    # instead of on the first prediction. Agents that never attack do not
+    # load it (nor NumPy or TensorFlow).
+    preload_model = True
 
-
-class Attacker(Agent):
-
-    def __init__(self, user, pw, print_json):
-        super().__init__(user, pw, print_json)
+    def __init__(self, agent):
+        super().__init__(agent)
 
         # Create and seed a random object
         self.local_random = random.Random()
-        seed = int(''.join(str(ord(c)) for c in user))
+        seed = int(''.join(str(ord(c)) for c in agent._user))
         self.local_random.seed(seed)
 
-        # Load model
-        prefix = os.path.dirname(os.path.abspath(__file__)) + "/"
-        self.model = load_model(prefix + "model/t1-n=3", compile=False)
-        self.model.compile(loss=root_mean_squared_error, optimizer="rmsprop")
-        # Run a dummy predict to initialize fully
-        self.model.predict([[[0, 0], [0, 0], [0, 0]]])
-        print("Model compiled")
+        # The model is loaded once and shared by all agents.
+        self.model_service = ModelService.instance()
 
-        # Store enemies path
+        # Store enemies path and the ticket of its prediction
         self.enemy_path = []
+        self.enemy_prediction = None
 
     def get_intention(self):
         """
         Gets intentions of this type of agent.
         """
+        if self.preload_model:
+            self.model_service.preload()
+
         percept_area = self.percept_area()
         classifications = self.classify_nodes(percept_area)
 
@@ -48,6 +44,12 @@ class Attacker(Agent):
 
             print(self.enemy_path)
 
+            # Predict the complete path together with the paths of the
+            # other attackers
+            if len(self.enemy_path) == 3 and not self._standing_still():
+                self.enemy_prediction = \
+                    self.model_service.submit(self.enemy_path)
+
             # Only follow agent if he is more than 2 blocks away
             if self.distance(self.current_location(), builder_loc) > 3:
 
@@ -59,19 +61,23 @@ class Attacker(Agent):
         elif len(self.enemy_path) == 3:
             # Hard code prediction in case enemy is standing still since model
             # is not trained for that
-            if (self.enemy_path[0] == self.enemy_path[1] and
-               self.enemy_path[0] == self.enemy_path[2]):
+            if self._standing_still():
                 prediction = self.enemy_path[0]
 
             else:
                 t = time.time()
-                prediction = self.model.predict([self.enemy_path])[0]
+                if self.enemy_prediction is None:
+                    self.enemy_prediction = \
+                        self.model_service.submit(self.enemy_path)
+                prediction = \
+                    self.model_service.result(self.enemy_prediction)
                 print("Time required for prediction:", time.time() - t)
 
             # Round and convert predictions to integers
             prediction = [int(round(p)) for p in prediction]
 
             self.enemy_path = []
+            self.enemy_prediction = None
 
             my_coords = self.current_location()
 
@@ -82,6 +88,13 @@ class Attacker(Agent):
 
         return self.move_randomly()
 
+    def _standing_still(self):
+        """
+        Reasoning: Returns True if the enemy did not move along its path
+        """
+        return (self.enemy_path[0] == self.enemy_path[1] and
+                self.enemy_path[0] == self.enemy_path[2])
+
     def skip_action(self):
         intentions = [self.skip]
         args = [tuple()]
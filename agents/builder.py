@@ -1,13 +1,12 @@
-from .helpers import Agent
-from .helpers import BDIAgent
+from .role import Role
+from .helpers.tourPlanner import TourPlanner
 from collections import defaultdict
-import numpy as np
 
 
-class Builder(Agent, BDIAgent):
-    def __init__(self, user, pw, print_json=False):
-        Agent.__init__(self, user, pw, print_json)
-        BDIAgent.__init__(self)
+class Builder(Role):
+    def __init__(self, agent):
+        super().__init__(agent)
+        self.tour_planner = TourPlanner()
 
     def get_intention(self):
         if not hasattr(self, 'ready'):
@@ -42,9 +41,6 @@ class Builder(Agent, BDIAgent):
         task: dict
             The selected task.
         """
-        # TODO: Find the most efficient path going past
-        # the taskboard and dispensers to the goal.
-
         # Get the required blocks from the task.
         required = self._required_blocks(task)
 
@@ -60,22 +56,24 @@ class Builder(Agent, BDIAgent):
 
         # Create and return the new intentions
         intentions = [self.get_task, self.get_blocks, self.submit_task]
-        args = [(task['name'],), (required,), (task['name'], required)]
+        args = [(task['name'], required), (required,),
+                (task['name'], required)]
         contexts = [tuple(), tuple(), tuple()]
         descriptions = ["getTask", "getBlocks", "submitTask"]
         primitives = [False, False, False]
 
         return intentions, args, contexts, descriptions, primitives
 
-    def get_task(self, task_name):
+    def get_task(self, task_name, required):
         """
-        Return intentions to navigate to the nearest
-        taskboard and accept the given task.
+        Return intentions to navigate to the taskboard on the cheapest
+        route past the required dispensers to a goal and accept the given
+        task.
         """
-        # Find the nearest taskboard.
-        taskboard = self._get_nearest_taskboard()
-        if not taskboard:
+        tour = self._plan_tour(required, taskboard=True)
+        if not tour or not tour.taskboard:
             return tuple()
+        taskboard = tour.taskboard
 
         # Return new intentions.
         return ([self.nav_to, self.accept],
@@ -86,19 +84,17 @@ class Builder(Agent, BDIAgent):
 
     def get_blocks(self, required):
         """
-        Return intentions to navigate to the nearest
-        required dispensers and request required blocks.
+        Return intentions to navigate to the required dispensers, in the
+        order of the cheapest route to a goal, and request required blocks.
         """
+        tour = self._plan_tour(required)
+        if not tour:
+            return tuple()
+
         intentions, args, contexts, \
             descriptions, primitives = [], [], [], [], []
-        for block_type, required_blocks in required.items():
-            # Find the nearest dispensers.
-            dispenser = self._get_nearest_dispenser(block_type)
-
-            if not dispenser:
-                return tuple()
-
-            n_blocks = len(required_blocks)
+        for block_type, dispenser in tour.dispensers:
+            n_blocks = len(required[block_type])
             # Add navigation to dispenser and
             # retrieval of blocks to intentions.
             intentions += [self.nav_to] + \
@@ -117,9 +113,10 @@ class Builder(Agent, BDIAgent):
         Return intentions to navigate to the nearest goal state
         and submit the attached blocks.
         """
-        goal = self._get_nearest_goal()
-        if not goal:
+        tour = self._plan_tour({})
+        if not tour or not tour.goal:
             return tuple()
+        goal = tour.goal
 
         return (
             [self.nav_to, self.turn_and_submit],
@@ -182,14 +179,12 @@ class Builder(Agent, BDIAgent):
             # Block is on opposite side, rotate twice.
             return [('cw',), ('cw',)]
         elif rel_from[0] == 0:
-            if sum(np.array(rel_from) +
-                   np.array(rel_to[::-1])):
+            if sum(rel_from) + sum(rel_to):
                 return [('ccw',)]
             else:
                 return [('cw',)]
         else:
-            if sum(np.array(rel_from) +
-                   np.array(rel_to[::-1])):
+            if sum(rel_from) + sum(rel_to):
                 return [('cw',)]
             else:
                 return [('ccw')]
@@ -202,55 +197,32 @@ class Builder(Agent, BDIAgent):
                 (requirement['x'], requirement['y']))
         return required
 
-    def _get_nearest_dispenser(self, block_type):
+    def _plan_tour(self, required, taskboard=False):
         """
-        Returns the nearest dispenser (using manhattan distance)
-        or None if there is no known dispenser of the given type.
+        Returns the cheapest tour from the current location past a
+        dispenser of every required block type to a goal, starting at a
+        taskboard if required, or None if no tour is known. Raises
+        DeadlineExceeded if planning did not finish before the deadline.
 
         Arguments
         ---------
-        block_type: str
-            The type of blocks the dispenser dispenses, e.g. 'b0'.
-        """
-        if block_type in self.beliefs.things['dispensers'] and \
-                self.beliefs.things['dispensers'][block_type]:
-            return min(self.beliefs.things['dispensers'][block_type],
-                       key=lambda x: self._manhattan_distance(x,
-                       self.beliefs.get_current(self._user_id).location))
-        return None
-
-    def _get_nearest_taskboard(self):
-        """
-        Returns the nearest taskboard (using manhattan distance)
-        or None if there is no known taskboard.
+        required: dict
+            The required blocks by block type.
+        taskboard: bool
+            If the tour starts at a taskboard.
         """
-
-        if self.beliefs.things['taskboards']:
-            return min(self.beliefs.things['taskboards'],
-                       key=lambda x: self._manhattan_distance(x,
-                       self.beliefs.get_current(self._user_id).location))
-        return None
-
-    def _get_nearest_goal(self):
-        """
-        Returns the nearest taskboard (using manhattan distance)
-        or None if there is no known taskboard.
-        """
-
-        if self.beliefs.things['goals']:
-            return min(self.beliefs.things['goals'],
-                       key=lambda x: self._manhattan_distance(x,
-                       self.beliefs.get_current(self._user_id).location))
-        return None
-
-    @staticmethod
-    def _manhattan_distance(coords1, coords2):
-        return sum(abs(np.array(coords1, dtype=int) -
-                       np.array(coords2, dtype=int)))
+        things = self.beliefs.things
+        dispensers = {block_type: things['dispensers'].get(block_type, [])
+                      for block_type in required}
+        return self.tour_planner.plan(
+            self.beliefs, self.beliefs.get_current(self._user_id).location,
+            things['taskboards'] if taskboard else (), dispensers,
+            things['goals'], self.deadline)
 
 
 if __name__ == "__main__":
-    a_list = []
-    for i in range(1, 2):
-        a_list.append(Builder(f"agentA{i}", "1"))
-        a_list[-1].start()
+    # Run with python3 -m agents.builder
+    from .superAgent import SuperAgent
+
+    agent = SuperAgent("agentA1", "1", role='builder')
+    agent.start()
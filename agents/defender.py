@@ -1,7 +1,7 @@
-from .helpers import Agent
+from .role import Role
 
 
-class Defender(Agent):
+class Defender(Role):
 
     def get_intention(self):
         """
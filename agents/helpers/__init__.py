@@ -2,3 +2,12 @@
 from .agent import Agent
 from .BDIAgent import BDIAgent
 from .server import Server
+
+
+def __getattr__(name):
+    # GridGraph is imported on first use, so NumPy is only loaded by agents
+    # that store their beliefs in arrays.
+    if name == "GridGraph":
+        from .gridGraph import GridGraph
+        return GridGraph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
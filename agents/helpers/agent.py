@@ -2,19 +2,36 @@ from collections import deque
 from functools import partial
 import heapq
 import math
+import time
 
 if __name__ == "__main__":
     from server import Server
     from graph import graph
+    from profiler import NULL_PROFILER
 else:
     from .server import Server
     from .graph import Graph
+    from .profiler import NULL_PROFILER
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when there is no time left to plan before the deadline of the
+    current step.
+    """
+    pass
 
 
 class Agent(Server):
     """
     Super class that can perform all primitive agent functionality
     """
+    # The class used for the beliefs, e.g. GridGraph for the array backend.
+    belief_class = Graph
+    # Navigate with the distance fields shared through the beliefs when no
+    # blocks are attached.
+    shared_fields = True
+
     def __init__(self, user, pw, print_json=False):
         """
         Store some information about the agent and the socket so we can
@@ -33,7 +50,12 @@ class Agent(Server):
         self.last_action_move = None
         self.dstar = None
         self.steps = None
-        self.beliefs = Graph(self._user_id)
+        self.beliefs = self.belief_class(self._user_id)
+
+        # The goal of the last navigation and the local time (in seconds)
+        # before which the action of the current step must be selected.
+        self.nav_goal = None
+        self.deadline = None
 
     def nav_to(self, goal, agent_id, adjacent=False):
         """
@@ -52,16 +74,44 @@ class Agent(Server):
 
         Returns the action.
         If at goal location or no path is possible, returns None.
+        Raises DeadlineExceeded if the deadline passed before a path was
+        found.
         """
 
-        # Initialize or update
-        if not self.dstar or self.dstar.goal != goal:
-            self.dstar = DStarLite(self.beliefs, goal, agent_id)
-        else:
-            self.dstar.update(self.beliefs)
+        new_loc = None
+        curr_loc = self.beliefs.get_current(agent_id).location
+        self.nav_goal = goal
+
+        # Without attached blocks every agent follows the same field
+        if self.shared_fields and not self.beliefs.attached:
+            field = self.beliefs.get_distance_field(goal)
+            new_loc = field.next_step(curr_loc, blocked=self._is_blocked,
+                                      deadline=self.deadline)
+
+            # D* Lite is not updated while the field is followed, so it is
+            # planned anew when it is needed again. If all neighbours are
+            # blocked, D* Lite tries to find a way around, and is kept for
+            # as long as they stay blocked.
+            if new_loc is not None:
+                self.dstar = None
+
+        if new_loc is None and curr_loc != goal:
+            if self.deadline and time.time() > self.deadline:
+                raise DeadlineExceeded()
+
+            # Initialize or update. A search stopped by the deadline
+            # continues in the next step.
+            if not self.dstar or self.dstar.goal != goal:
+                self.dstar = DStarLite(self.beliefs, goal, agent_id,
+                                       profiler=self.profiler,
+                                       deadline=self.deadline)
+                if self.dstar.searching:
+                    raise DeadlineExceeded()
+            else:
+                self.dstar.update(self.beliefs, deadline=self.deadline)
 
-        # Get the new direction
-        new_loc = self.dstar.move_to_goal()
+            # Get the new direction
+            new_loc = self.dstar.move_to_goal()
 
         # Check if path is impossible or already at goal location
         if not new_loc:
@@ -71,8 +121,6 @@ class Agent(Server):
         if adjacent and new_loc == goal:
             return None
 
-        curr_loc = self.beliefs.get_current(agent_id).location
-
         direction = self.beliefs.get_direction(agent_id, new_loc)
 
         if self.beliefs.nodes[new_loc]._is_obstacle():
@@ -87,6 +135,42 @@ class Agent(Server):
             action = self.move(direction)
             return action
 
+    def _is_blocked(self, location):
+        """
+        Returns True if the location is occupied by a block or an entity
+        in the current step.
+        """
+        return location in self.beliefs.nodes and \
+            self.beliefs.nodes[location]._is_thing(
+                self.beliefs.get_step(), self.current_location(), [])
+
+    def fallback_action(self):
+        """
+        Returns a cheap action for when there is no time left to plan:
+        one step along the previous plan to the last navigation goal,
+        without updating the plan, or skip.
+        """
+        curr_loc = self.current_location()
+        goal, new_loc = self.nav_goal, None
+
+        if goal is not None and curr_loc != goal:
+            field = self.beliefs.get_distance_field(goal, create=False)
+            if field and not self.beliefs.attached:
+                new_loc = field.next_step(curr_loc, blocked=self._is_blocked,
+                                          expand=False)
+            elif self.dstar and self.dstar.goal == goal and \
+                    not self.dstar.searching and \
+                    self.dstar.g(curr_loc) != float('inf'):
+                new_loc = self.dstar.lowest_cost_neighbour(curr_loc)
+
+        # Only move to known, free locations.
+        if new_loc is None or new_loc not in self.beliefs.nodes or \
+                self.beliefs.nodes[new_loc]._is_obstacle() or \
+                self._is_blocked(new_loc):
+            return self.skip()
+
+        return self.move(self.beliefs.get_direction(self._user_id, new_loc))
+
     def current_node(self):
         """
         Returns the node object on which the agent is currently located
@@ -323,9 +407,12 @@ class Agent(Server):
 
 
 class DStarLite(object):
-    def __init__(self, beliefs, goal, agent_id):
+    def __init__(self, beliefs, goal, agent_id, profiler=NULL_PROFILER,
+                 deadline=None):
         """
-        Find the path to the goal location from the current position
+        Find the path to the goal location from the current position. If
+        the deadline passes first, the search continues in the next update
+        and searching stays True.
 
         parameters
         ----------
@@ -333,25 +420,130 @@ class DStarLite(object):
             Instance of the current beliefs
         goal: tuple
             Goal x and y coordinates
+        profiler: StepProfiler
+            Measures the time spent in compute_shortest_path.
+        deadline: float
+            The local time (in seconds) at which the search stops.
+        """
+        self.profiler = profiler
+        self.agent_id = agent_id
+        self.goal = goal
+        try:
+            self.initialise(beliefs, deadline)
+        except DeadlineExceeded:
+            pass
+
+    def initialise(self, beliefs, deadline=None):
         """
+        Plan the path from scratch.
 
+        parameters
+        ----------
+        beliefs: object
+            Instance of the current beliefs
+        deadline: float
+            The local time (in seconds) at which the search stops.
+        """
         # Init the beliefs
         self.beliefs = beliefs
-        self.obstacle_cost = 32 * math.e ** (-0.008 * self.beliefs.energy)
 
         self.back_pointers = {}
         self.G_VALS = {}
         self.RHS_VALS = {}
         self.Km = 0
-        self.agent_id = agent_id
-        self.position = beliefs.get_current(agent_id).location
-        self.goal = goal
+        self.position = beliefs.get_current(self.agent_id).location
+        self.last_node = self.position
+
+        # The end of the terrain change log of the beliefs that is taken
+        # into account. Other agents sharing the beliefs also log changes.
+        _, self._changes_mark = beliefs.get_terrain_changes()
+
+        # Cost of entering a node based on its terrain ({node: cost code})
+        # and if nodes are occupied by a thing in the current step.
+        self._terrain_costs = {}
+        self._occupied = {}
+        self._attached = None
+        self._dimensions = (beliefs.width, beliefs.height)
+        self.refresh_costs()
+
         self.queue = PriorityQueue()
         self.queue.put(self.goal, self.calculate_key(self.goal))
         self.back_pointers[self.goal] = None
 
         # Create initial path to goal
-        self.compute_shortest_path()
+        self.compute_shortest_path(deadline)
+
+    def refresh_costs(self, changed=()):
+        """
+        Recompute the per-update cost information: the obstacle cost, the
+        agent's footprint (its location and attached blocks) and the costs
+        which are invalidated by changed nodes.
+
+        parameters
+        ----------
+        changed: iterable of tuples
+            The nodes of which the terrain changed since the last update.
+        """
+        self.obstacle_cost = 32 * math.e ** (-0.008 * self.beliefs.energy)
+        self._costs = (1, self.obstacle_cost, float('inf'))
+        self._attached_locs = {(self.position[0] + att[0],
+                                self.position[1] + att[1])
+                               for att in self.beliefs.attached}
+        self._occupied = {}
+
+        # The terrain costs depend on whether blocks are attached and on the
+        # coordinate system of the beliefs.
+        dimensions = (self.beliefs.width, self.beliefs.height)
+        if bool(self.beliefs.attached) != self._attached or \
+                dimensions != self._dimensions:
+            self._terrain_costs = {}
+            self._attached = bool(self.beliefs.attached)
+            self._dimensions = dimensions
+
+        # A changed node also changes the surrounding obstacle count of its
+        # neighbours.
+        for x, y in changed:
+            for dx in range(-1, 2):
+                for dy in range(-1, 2):
+                    self._terrain_costs.pop(
+                        self.beliefs.modulate((x + dx, y + dy)), None)
+
+    def is_occupied(self, node):
+        """
+        Returns True if the node contains a block or entity in the current
+        step, which is not the agent itself or attached to the agent.
+
+        parameters
+        ----------
+        node: tuple
+            x and y coordinate of the node
+        """
+        if node not in self._occupied:
+            self._occupied[node] = node in self.beliefs.nodes and \
+                self.beliefs.nodes[node]._is_thing(self.beliefs.step,
+                                                   self.position,
+                                                   self._attached_locs)
+        return self._occupied[node]
+
+    def terrain_cost(self, node):
+        """
+        Returns the cost of entering the node based on its terrain.
+
+        parameters
+        ----------
+        node: tuple
+            x and y coordinate of the node
+        """
+        if node not in self._terrain_costs:
+            code = 0
+            if node in self.beliefs.nodes:
+                if self._attached:
+                    if self.beliefs.nodes[node]._is_exp_obstacle():
+                        code = 2
+                elif self.beliefs.nodes[node]._is_obstacle():
+                    code = 1
+            self._terrain_costs[node] = code
+        return self._costs[self._terrain_costs[node]]
 
     def transition_cost(self, from_node, to_node):
         """
@@ -364,36 +556,17 @@ class DStarLite(object):
         to_node: tuple
             x and y coordinate of second node
         """
+        if self.is_occupied(from_node) or self.is_occupied(to_node):
+            return float('inf')
 
-        curr_loc = self.beliefs.get_current(self.agent_id).location
-
-        attached_locs = [(curr_loc[0] + att[0], curr_loc[1] + att[1]) for att
-                         in self.beliefs.attached]
-
-        for node in [from_node, to_node]:
-            if node in self.beliefs.nodes and \
-                    self.beliefs.nodes[node]._is_thing(self.beliefs.step,
-                                                       curr_loc,
-                                                       attached_locs):
-                return float('inf')
-
-        if len(self.beliefs.attached):
-            if to_node in self.beliefs.nodes and \
-                    self.beliefs.nodes[to_node]._is_exp_obstacle():
-                return float('inf')
-        else:
-            if to_node in self.beliefs.nodes and \
-                    self.beliefs.nodes[to_node]._is_obstacle():
-                return 32 * math.e ** (-0.008 * self.beliefs.energy)
-
-        return 1
+        return self.terrain_cost(to_node)
 
     def neighbors(self, id):
         (x, y) = id
-        results = [(x + 1, y), (x, y - 1), (x - 1, y), (x, y + 1)]
+        results = self.beliefs.get_neighbours(id)
         if (x + y) % 2 == 0:
             results.reverse()  # aesthetics
-        return [self.beliefs.modulate(coords) for coords in results]
+        return results
 
     def calculate_rhs(self, node):
         lowest_cost_neighbour = self.lowest_cost_neighbour(node)
@@ -453,11 +626,31 @@ class DStarLite(object):
     def update_nodes(self, nodes):
         [self.update_node(n) for n in nodes]
 
-    def compute_shortest_path(self):
+    def compute_shortest_path(self, deadline=None):
+        """
+        Search until the path from the position is known. Raises
+        DeadlineExceeded if the deadline passed first, the search continues
+        where it stopped in the next call.
+
+        parameters
+        ----------
+        deadline: float
+            The local time (in seconds) at which the search stops.
+        """
+        with self.profiler.phase('compute_shortest_path'):
+            return self._compute_shortest_path(deadline)
+
+    def _compute_shortest_path(self, deadline=None):
+        self.searching = True
         last_nodes = deque(maxlen=10)
-        while len(self.queue.elements) and \
+        iterations = 0
+        while len(self.queue) and \
                 (self.queue.first_key() < self.calculate_key(self.position) or
                  self.rhs(self.position) != self.g(self.position)):
+            iterations += 1
+            if deadline and iterations % 256 == 0 and \
+                    time.time() > deadline:
+                raise DeadlineExceeded()
             k_old = self.queue.first_key()
             node = self.queue.pop()
             last_nodes.append(node)
@@ -473,6 +666,7 @@ class DStarLite(object):
                 self.G_VALS[node] = float('inf')
                 self.update_nodes(self.neighbors(node) + [node])
 
+        self.searching = False
         return self.back_pointers.copy(), self.G_VALS.copy()
 
     def move_to_goal(self):
@@ -491,60 +685,97 @@ class DStarLite(object):
         else:
             return None
 
-    def update(self, beliefs):
+    def update(self, beliefs, deadline=None):
         """
-        Update the path if necessary.
+        Update the path if necessary, and continue a search that was
+        stopped by a deadline. Raises DeadlineExceeded if the deadline
+        passed before the path was known.
 
         parameters
         ----------
         beliefs: object
             The updated beliefs instance.
+        deadline: float
+            The local time (in seconds) at which the search stops.
         """
-        # Update observations
-        self.beliefs = beliefs
-        self.obstacle_cost = 32 * math.e ** (-0.008 * self.beliefs.energy)
+        # The terrain changes observed by all agents sharing the beliefs.
+        changed, self._changes_mark = \
+            beliefs.get_terrain_changes(self._changes_mark)
+
+        # Plan again if the beliefs were replaced or changed as a whole
+        # (e.g. by merging) or if blocks were attached or detached, the
+        # costs and paths are no longer valid.
+        if beliefs is not self.beliefs or changed is None or \
+                bool(beliefs.attached) != self._attached:
+            self.initialise(beliefs, deadline)
+            return
+
         self.position = beliefs.get_current(self.agent_id).location
-        new_obs = [obs for sublist in beliefs.new_obs.values()
-                   for obs in sublist]
+        self.refresh_costs(changed)
+        new_obs = changed + beliefs.new_obs['agents']
 
         # Update the path if there are new observations
-        if new_obs:
+        if new_obs or self.searching:
             self.Km += self.heuristic(self.last_node, self.position)
-            attached_locs = [(self.position[0] + att[0], self.position[1] +
-                             att[1]) for att in self.beliefs.attached]
+            self.last_node = self.position
+            # The cost of entering a changed node is part of its own rhs.
             self.update_nodes({node for obs in new_obs
-                              for node in self.neighbors(obs)
-                              if (node not in self.beliefs.nodes or not
-                                  self.beliefs.nodes[node]._is_thing(
-                                      self.beliefs.step, self.position,
-                                      attached_locs))})
+                              for node in self.neighbors(obs) + [obs]
+                              if not self.is_occupied(node)})
 
-            self.compute_shortest_path()
+            self.compute_shortest_path(deadline)
 
 
 class PriorityQueue:
+    """
+    Binary heap with lazy deletion. Every node has at most one valid entry,
+    which is found through entry_finder, so put and delete take O(log n)
+    and first_key O(1) (amortized).
+    """
     def __init__(self):
         self.elements = []
+        self.entry_finder = {}
+
+    def __len__(self):
+        return len(self.entry_finder)
 
     def empty(self):
-        return len(self.elements) == 0
+        return len(self.entry_finder) == 0
 
     def put(self, item, priority):
-        heapq.heappush(self.elements, (priority, item))
+        self.delete(item)
+
+        # Rebuild the heap if it mostly contains deleted entries.
+        if len(self.elements) > 2 * len(self.entry_finder) + 64:
+            self.elements = list(self.entry_finder.values())
+            heapq.heapify(self.elements)
+
+        entry = [priority, item, True]
+        self.entry_finder[item] = entry
+        heapq.heappush(self.elements, entry)
 
     def pop(self):
-        item = heapq.heappop(self.elements)
-        return item[1]
+        self._remove_deleted()
+        _, item, _ = heapq.heappop(self.elements)
+        del self.entry_finder[item]
+        return item
 
     def first_key(self):
-        return heapq.nsmallest(1, self.elements)[0][0]
+        self._remove_deleted()
+        return self.elements[0][0]
 
     def delete(self, node):
-        self.elements = [e for e in self.elements if e[1] != node]
-        heapq.heapify(self.elements)
+        entry = self.entry_finder.pop(node, None)
+        if entry:
+            # Mark as deleted, it is removed once it reaches the top.
+            entry[2] = False
+
+    def _remove_deleted(self):
+        while self.elements and not self.elements[0][2]:
+            heapq.heappop(self.elements)
 
     def __iter__(self):
-        for _, node in self.elements:
+        for node in self.entry_finder:
             yield node
 
 
@@ -0,0 +1,75 @@
+import asyncio
+
+from .server import FrameReader
+
+
+class AsyncServer(object):
+    """
+    Mixin for Server subclasses which replaces the blocking socket with
+    asyncio streams. The agent connects in the event loop instead of while
+    initialising and receive_msg and send_request become coroutines.
+    """
+    connect_on_init = False
+
+    async def connect_socket(self):
+        """
+        Open the stream connection with the server.
+        """
+        self._reader = FrameReader()
+        self._stream_writer = None
+
+        # Connect to server.
+        try:
+            self._stream_reader, self._stream_writer = \
+                await asyncio.open_connection(self.host, self.port)
+        # In case of error throw error message
+        except ConnectionRefusedError:
+            print("Could not connect to port")
+            return
+
+    async def authorize_socket(self):
+        """
+        Authorize the connection by sending auth-request to server
+        """
+        # Create and send authentication request.
+        await self.send_request(self._auth_request())
+
+        # Parse response.
+        self._check_auth_response(await self.receive_msg())
+
+    def close_socket(self):
+        """
+        Disconnects the stream from the server.
+        """
+        if self._stream_writer:
+            self._stream_writer.close()
+            self._stream_writer = None
+        self.close_record()
+        self.profiler.close()
+
+    async def send_request(self, request):
+        """
+        Takes request as input and sends binary-encoded json block to server.
+
+        parameters
+        ----------
+        request: dict
+            The request to send to the server.
+        """
+        with self.profiler.phase('send_request'):
+            self._stream_writer.write(self._encode_request(request))
+            await self._stream_writer.drain()
+
+    async def receive_msg(self):
+        """
+        Returns message from server, if no message is received return None.
+        The time spent in receiving includes waiting for the server.
+        """
+        with self.profiler.phase('receive_msg'):
+            while not self._reader.pending():
+                data = await self._stream_reader.read(self._reader.chunk_size)
+                if not data:
+                    return None
+                self._reader.feed(data)
+
+        return self._decode_msg(self._reader.read_frame())
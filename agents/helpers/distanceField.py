@@ -0,0 +1,222 @@
+from collections import defaultdict
+import heapq
+import math
+import time
+
+
+class DistanceField(object):
+    """
+    Distances from every cell to a goal, computed with a reverse Dijkstra
+    search over the beliefs. The field is stored in the graph, so all agents
+    that share the graph and navigate to the same goal read their next step
+    from the same field. The search is resumed only as far as needed to
+    answer a query and is repaired incrementally when the terrain changes.
+    """
+    def __init__(self, beliefs, goals, energy=None, max_expansions=200000):
+        """
+        Arguments
+        ---------
+        beliefs: Graph
+            The graph the field is computed on.
+        goals: tuple or iterable of tuples
+            The goal cell, or multiple goal cells in which case the distance
+            to the nearest goal is computed.
+        energy: int
+            The energy of the agents that use the field, which determines
+            the cost of clearing obstacles. By default the energy of the
+            beliefs.
+        max_expansions: int
+            The maximum number of cells expanded for a single query.
+        """
+        if isinstance(goals, tuple) and len(goals) == 2 and \
+                isinstance(goals[0], int):
+            goals = [goals]
+
+        self.beliefs = beliefs
+        self.goals = frozenset(goals)
+        self.max_expansions = max_expansions
+        if energy is None:
+            energy = beliefs.energy
+        self.obstacle_cost = 32 * math.e ** (-0.008 * energy)
+        self.version = beliefs.version
+
+        self.dist = {goal: 0 for goal in self.goals}
+        self.parent = {goal: None for goal in self.goals}
+        self.children = defaultdict(set)
+        self.queue = [(0, goal) for goal in self.goals]
+        heapq.heapify(self.queue)
+
+    def cost(self, node):
+        """
+        Returns the cost of entering the node.
+        """
+        if node in self.beliefs.nodes and \
+                self.beliefs.nodes[node]._is_obstacle():
+            return self.obstacle_cost
+        return 1
+
+    def neighbors(self, node):
+        return self.beliefs.get_neighbours(node)
+
+    def _set(self, node, dist, parent):
+        """
+        Set the distance and parent of the node and queue it.
+        """
+        old_parent = self.parent.get(node)
+        if old_parent is not None:
+            self.children[old_parent].discard(node)
+        if parent is not None:
+            self.children[parent].add(node)
+        self.dist[node] = dist
+        self.parent[node] = parent
+        heapq.heappush(self.queue, (dist, node))
+
+    def _settled(self, node):
+        return node in self.dist and \
+            (not self.queue or self.queue[0][0] >= self.dist[node])
+
+    def _expand_until(self, node, deadline=None):
+        """
+        Continue the search until the distance of the node is final, or
+        until the (local) deadline in seconds passed.
+        """
+        expansions = 0
+        while not self._settled(node) and self.queue and \
+                expansions < self.max_expansions:
+            if deadline and expansions % 256 == 0 and \
+                    time.time() > deadline:
+                return
+            dist, current = heapq.heappop(self.queue)
+
+            # Skip outdated entries.
+            if self.dist.get(current) != dist:
+                continue
+
+            expansions += 1
+            cost = self.cost(current)
+            for neighbor in self.neighbors(current):
+                if dist + cost < self.dist.get(neighbor, float('inf')):
+                    self._set(neighbor, dist + cost, current)
+
+    def distance(self, node, deadline=None):
+        """
+        Returns the cost of the cheapest path from the node to the (nearest)
+        goal. If the deadline passed first, the cost may be too high.
+
+        Arguments
+        ---------
+        node: (int, int)
+            The start location.
+        deadline: float
+            The local time in seconds at which the search is stopped.
+        """
+        self._expand_until(node, deadline)
+        return self.dist.get(node, float('inf'))
+
+    def nearest_goal(self, node):
+        """
+        Returns the goal at the end of the cheapest path from the node, or
+        None if no path is known.
+
+        Arguments
+        ---------
+        node: (int, int)
+            The start location.
+        """
+        self._expand_until(node)
+        if node not in self.dist:
+            return None
+        while self.parent[node] is not None:
+            node = self.parent[node]
+        return node
+
+    def next_step(self, position, blocked=None, deadline=None, expand=True):
+        """
+        Returns the neighbour of the position on the cheapest path to the
+        goal, or None if the position is a goal, all neighbours are blocked
+        or the deadline passed before the distance of the position was
+        known. If the neighbours on the cheapest paths are blocked, the
+        cheapest path through one of the other neighbours is taken.
+
+        Arguments
+        ---------
+        position: (int, int)
+            The current location of the agent.
+        blocked: function
+            Returns True for neighbours that can not be entered right now,
+            e.g. because they are occupied by an entity.
+        deadline: float
+            The local time in seconds at which the search is stopped.
+        expand: bool
+            If False, only the distances computed before are used.
+        """
+        if position in self.goals:
+            return None
+
+        if expand:
+            self._expand_until(position, deadline)
+            if not self._settled(position):
+                return None
+
+        free = [neighbor for neighbor in self.neighbors(position)
+                if not (blocked and blocked(neighbor))]
+        best = self._cheapest(free)
+        if best is None and expand:
+            # The distances of the other neighbours may not be known yet
+            # when the search stopped at the position.
+            for neighbor in free:
+                self._expand_until(neighbor, deadline)
+            best = self._cheapest(free)
+        return best
+
+    def _cheapest(self, neighbors):
+        """
+        Returns the neighbour with the cheapest known path to the goal, or
+        None if no path is known.
+        """
+        best, best_cost = None, float('inf')
+        for neighbor in neighbors:
+            cost = self.cost(neighbor) + \
+                self.dist.get(neighbor, float('inf'))
+            if cost < best_cost:
+                best, best_cost = neighbor, cost
+        return best
+
+    def repair(self, changed):
+        """
+        Repair the field after the terrain of the given cells changed.
+
+        Arguments
+        ---------
+        changed: list of tuples
+            The cells that became an obstacle or became empty.
+        """
+        self.version = self.beliefs.version
+        for node in changed:
+            if node not in self.dist:
+                continue
+
+            # Entering the node became more expensive, the distances of all
+            # cells whose path leads through it are no longer valid.
+            invalid = []
+            stack = list(self.children.pop(node, ()))
+            while stack:
+                child = stack.pop()
+                invalid.append(child)
+                stack.extend(self.children.pop(child, ()))
+            for child in invalid:
+                del self.dist[child], self.parent[child]
+
+            # Reopen the invalidated cells from their valid neighbours.
+            for child in invalid:
+                for neighbor in self.neighbors(child):
+                    if neighbor in self.dist:
+                        dist = self.dist[neighbor] + self.cost(neighbor)
+                        if dist < self.dist.get(child, float('inf')):
+                            self._set(child, dist, neighbor)
+
+            # Entering the node may also have become cheaper.
+            dist = self.dist[node] + self.cost(node)
+            for neighbor in self.neighbors(node):
+                if dist < self.dist.get(neighbor, float('inf')):
+                    self._set(neighbor, dist, node)
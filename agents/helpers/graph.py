@@ -1,16 +1,66 @@
 import json
+import sys
+import time
+from types import MappingProxyType
+
+if __name__ == "__main__":
+    from distanceField import DistanceField
+else:
+    from .distanceField import DistanceField
+
+
+# Coordinates of the cells in the local vision relative to the agent.
+VISION_OFFSETS = [(x, y) for x in range(-5, 6) for y in range(-5, 6)
+                  if abs(x) + abs(y) < 6]
+
+# Coordinates of the neighbour in every direction relative to a node.
+DIRECTION_OFFSETS = {'n': (0, -1), 'e': (1, 0), 's': (0, 1), 'w': (-1, 0)}
+
+# The same offsets in the order in which the planners expand neighbours.
+NEIGHBOUR_OFFSETS = ((1, 0), (0, -1), (-1, 0), (0, 1))
+
+# Terrain types are stored as codes, code 0 means the node does not exist.
+TERRAIN = ['', 'empty', 'obstacle', 'goal']
+TERRAIN_CODES = {terrain: code for code, terrain in enumerate(TERRAIN)}
+OBSTACLE = TERRAIN_CODES['obstacle']
+
+# Things of nodes without things.
+EMPTY_THINGS = MappingProxyType({})
+
+# Every distinct thing is stored once, and shared by all nodes.
+_interned_things = {}
+
+
+def intern_thing(thing):
+    """
+    Return the shared copy of a thing (type, details).
+    """
+    try:
+        return _interned_things[thing]
+    except KeyError:
+        thing = tuple(sys.intern(part) if isinstance(part, str) else part
+                      for part in thing)
+        return _interned_things.setdefault(thing, thing)
 
 
 class Node(object):
     """
     Create a node used in the graph and store information about its terrain
-    and activity.
+    and activity. Graphs contain many nodes, so a node only stores slots:
+    the terrain is stored as an integer code, things are only stored for
+    nodes which contain any and equal things share a single tuple.
     """
-    def __init__(self, location, terrain='empty', step=0, things={},
-                 north=None, east=None, south=None, west=None):
+    __slots__ = ('location', 'surr_obstacles', '_terrain', '_step',
+                 '_things')
+
+    # Number of most recent steps of which the things are kept (None keeps
+    # all steps). The most recent observation of a static thing is kept too.
+    thing_history = 10
+    static_things = ('dispenser', 'taskboard')
+
+    def __init__(self, location, terrain='empty', step=0, things={}):
         """
         Initialise the node and create attribute with default values.
-        Terrain and step get combined into a tuple for easier use
 
         Arguments
         ---------
@@ -24,22 +74,14 @@ class Node(object):
         things: {step:thing}
             A dictionary containing a list of things (value) in the node
             (entities, blocks, dispensers, markers) on a certain step (key).
-        north, east, south, west: Node
-            The node to the corresponding direction of this node.
         """
         self.location = location
         self.surr_obstacles = 0
-        self.terrain = (terrain, step)
-        if things == {}:
-            self.things = {}
-        else:
-            self.things = things
-        self.directions = {
-            'n': north,
-            'e': east,
-            's': south,
-            'w': west
-        }
+        self._terrain = TERRAIN_CODES[terrain]
+        self._step = step
+        self._things = None
+        for thing_step, objects in things.items():
+            self.add_things(thing_step, list(objects))
 
     def __str__(self):
         """
@@ -47,42 +89,47 @@ class Node(object):
         """
         node = f'Node object\n- Location : {self.location}\n'
         node += f'- Terrain  : {self.terrain[0]} (at step {self.terrain[1]})\n'
-        if self.things == {}:
+        if not self.things:
             node += '- Things   : None'
         else:
             node += '- Things   :'
-            for i, thing in enumerate(sorted(self.things.items())):
+            for i, (step, things) in enumerate(sorted(self.things.items())):
                 if i:
                     node += f'\n{" "*13}'
-                    node += f'step {thing[0]}: {str(thing[1]).strip("[]")}'
+                    node += f'step {step}: {str(list(things)).strip("[]")}'
                 else:
-                    node += f' step {thing[0]}: {str(thing[1]).strip("[]")}'
+                    node += f' step {step}: {str(list(things)).strip("[]")}'
 
-        for direction in self.directions.items():
-            if direction[0] == 'n':
-                if direction[1]:
-                    node += f'\n- North    : {direction[1].get_location()}'
-                else:
-                    node += f'\n- North    : None'
+        return node+'\n'
 
-            elif direction[0] == 'e':
-                if direction[1]:
-                    node += f'\n- East     : {direction[1].get_location()}'
-                else:
-                    node += f'\n- East     : None'
+    @property
+    def terrain(self):
+        """
+        The terrain of the node as a tuple (str, int).
+        """
+        return (TERRAIN[self._terrain], self._step)
 
-            elif direction[0] == 's':
-                if direction[1]:
-                    node += f'\n- South    : {direction[1].get_location()}'
-                else:
-                    node += f'\n- South    : None'
+    @terrain.setter
+    def terrain(self, terrain):
+        self._terrain = TERRAIN_CODES[terrain[0]]
+        self._step = terrain[1]
 
-            elif direction[0] == 'w':
-                if direction[1]:
-                    node += f'\n- West     : {direction[1].get_location()}'
-                else:
-                    node += f'\n- West     : None'
-        return node+'\n'
+    @property
+    def things(self):
+        """
+        The things in the node as a dictionary {step: tuple of things}.
+        """
+        if self._things is None:
+            return EMPTY_THINGS
+        return self._things
+
+    def _writable_things(self):
+        """
+        Return the dictionary of things which add_things can change.
+        """
+        if self._things is None:
+            self._things = {}
+        return self._things
 
     def get_location(self):
         """
@@ -114,12 +161,13 @@ class Node(object):
     def get_things(self, step=-1):
         """
         Return the all the things in a node on a specific step.
-        If a step is given, return a list of tuples where the first element of
-        the tuple is the type of thing and the second is a detail of the thing.
+        If a step is given, return a tuple of tuples where the first element
+        of the tuple is the type of thing and the second is a detail of the
+        thing.
 
-        If no step is given, all things from every step are returned as a list
-        of tuples. Where the first element is the step and the second is the
-        list of things from that step.
+        If no step is given, all things from every retained step are returned
+        as a list of tuples. Where the first element is the step and the
+        second is the tuple of things from that step.
 
         Arguments
         ---------
@@ -128,73 +176,78 @@ class Node(object):
             Default is -1.
         """
         if step >= 0:
-            if step in self.things.keys():
-                return self.things[step]
-            else:
-                return []
+            return self.things.get(step, ())
         else:
             return sorted(self.things.items())
 
     def add_things(self, step, objects):
         """
-        Add things to the node at a specific step and store it in a list.
+        Add things to the node at a specific step and store them in a tuple.
         It also removes any duplicates.
 
         Arguments
         ---------
         objects: tuple or list
-            the objects can either be a single thing or a list of things.
+            the objects can either be a single thing or a list (or tuple) of
+            things.
         step: int
             The step on which the things need to be added.
         """
-        if step in self.things:
-            if isinstance(objects, list):
-                self.things[step].extend(objects)
-            elif isinstance(objects, tuple):
-                self.things[step].append(objects)
-        else:
-            if isinstance(objects, list) and objects:
-                self.things[step] = objects
-            elif isinstance(objects, tuple):
-                self.things[step] = [objects]
+        # A single thing is a tuple which starts with the type of the thing.
+        if isinstance(objects, tuple) and objects and \
+                isinstance(objects[0], str):
+            objects = (objects,)
+        if not objects:
+            return
 
-        if step in self.things:
-            self.things[step] = list(dict.fromkeys(self.things[step]))
+        things = self._writable_things()
+        things[step] = tuple(dict.fromkeys(
+            things.get(step, ()) + tuple(map(intern_thing, objects))))
+
+        if self.thing_history and len(things) > self.thing_history:
+            self._evict_things()
+
+    def _evict_things(self):
+        """
+        Remove the things of the oldest steps, such that the things of the
+        last thing_history steps remain. The most recent step on which a
+        static thing (dispenser or taskboard) was observed is kept as well.
+        """
+        steps = sorted(self.things)
+        keep = set(steps[-self.thing_history:])
+        for step in reversed(steps):
+            if any(thing[0] in self.static_things
+                   for thing in self.things[step]):
+                keep.add(step)
+                break
+
+        for step in steps:
+            if step not in keep:
+                del self.things[step]
 
     def get_direction(self, width=None, height=None, direction=None):
         """
-        Return the node in the specified direction. If no direction is provided
-        a list of all neighbours is returned.
+        Return the location of the neighbour in the specified direction. If no
+        direction is provided a list of all neighbours is returned. The
+        neighbours are derived from the coordinates and the dimensions of the
+        map, if known.
 
         Arguments
         ---------
+        width, height: int
+            The dimensions of the map, None if unknown.
         direction: str
             The direction of the requested node (n, e, s, w).
         """
         x, y = self.location
         if direction:
-            if self.directions[direction]:
-                return self.directions[direction].location
-
-            elif height:
-                if direction == 'n':
-                    if y == 0:
-                        return (x, height - 1)
-                    return (x, y-1)
-                if direction == 's':
-                    if y == height - 1:
-                        return (x, 0)
-                    return (x, y+1)
-
-            elif width:
-                if direction == 'w':
-                    if x == 0:
-                        return (width - 1, y)
-                    return (x-1, y)
-                if direction == 'e':
-                    if x == width - 1:
-                        return (0, y)
-                    return (x+1, y)
+            dx, dy = DIRECTION_OFFSETS[direction]
+            x, y = x + dx, y + dy
+            if width:
+                x = x % width
+            if height:
+                y = y % height
+            return (x, y)
 
         else:
             return [self.get_direction(width=width, height=height,
@@ -206,23 +259,6 @@ class Node(object):
                     self.get_direction(width=width, height=height,
                                        direction='w')]
 
-    def add_direction(self, north=None, east=None, south=None, west=None):
-        """
-        Add a node to the current node in a given direction.
-
-        Arguments
-        ---------
-        nort, east, south, west: Node
-        """
-        if isinstance(north, Node):
-            self.directions['n'] = north
-        if isinstance(east, Node):
-            self.directions['e'] = east
-        if isinstance(south, Node):
-            self.directions['s'] = south
-        if isinstance(west, Node):
-            self.directions['w'] = west
-
     def _is_obstacle(self):
         """
         Determine if a node is an obstacle block.
@@ -234,14 +270,10 @@ class Node(object):
             The location of the agent itself.
         """
         # check for obstacles
-        if self.terrain[0] == 'obstacle':
-            return True
-        return False
+        return self._terrain == OBSTACLE
 
     def _is_exp_obstacle(self):
-        if self.terrain[0] == 'obstacle' or self.surr_obstacles:
-            return True
-        return False
+        return self._terrain == OBSTACLE or bool(self.surr_obstacles)
 
     def _is_thing(self, step, agent_location, attached,
                   things=['block', 'entity']):
@@ -279,6 +311,17 @@ class Graph(object):
     Create a graph used by the agents to help naviagate and store information
     about the environment.
     """
+    # Maximum number of distance fields kept at the same time.
+    max_distance_fields = 32
+
+    # The obstacle costs of the distance fields depend on the energy, which
+    # is rounded down to a multiple of energy_bucket. Every bucket has its
+    # own fields.
+    energy_bucket = 50
+
+    # Maximum length of the terrain change log, after which it is restarted.
+    max_terrain_changes = 100000
+
     def __init__(self, agent_id):
         """
         Initialise the graph and create a dictionary to store the nodes based
@@ -292,10 +335,8 @@ class Graph(object):
         self.width = None
         self.height = None
 
-        for x in range(-5, 6):
-            for y in range(-5, 6):
-                if abs(x) + abs(y) < 6:
-                    self.nodes[(x, y)] = Node((x, y))
+        for x, y in VISION_OFFSETS:
+            self.nodes[(x, y)] = Node((x, y))
 
         self.current = {agent_id: self.nodes[(0, 0)]}
         self.things = {'goals': [], 'dispensers': {}, 'taskboards': []}
@@ -304,16 +345,26 @@ class Graph(object):
         self.attached = []
         self.energy = 300
 
-        for node in self.nodes.values():
-            x, y = node.location
-            if (x, y-1) in self.nodes.keys():
-                node.add_direction(north=self.nodes[(x, y-1)])
-            if (x+1, y) in self.nodes.keys():
-                node.add_direction(east=self.nodes[(x+1, y)])
-            if (x, y+1) in self.nodes.keys():
-                node.add_direction(south=self.nodes[(x, y+1)])
-            if (x-1, y) in self.nodes.keys():
-                node.add_direction(west=self.nodes[(x-1, y)])
+        # The location and vision of every agent in the previous update.
+        self._last_vision = {}
+
+        # The step of the latest update of every agent.
+        self.agent_steps = {}
+
+        # Distance fields shared by the agents using this graph, by goal.
+        # The version is increased every time the terrain changes.
+        self.distance_fields = {}
+        self.version = 0
+
+        # The cells whose terrain changed, in the order of the updates of all
+        # agents sharing the graph, so every planner can repair its path.
+        # The log is restarted (with a new epoch) when the terrain or the
+        # coordinates changed as a whole, e.g. by a merge.
+        self.terrain_changes = []
+        self.terrain_epoch = 0
+
+        # The duration and node counts of the last merge into this graph.
+        self.merge_stats = None
 
     def __str__(self):
         """
@@ -347,16 +398,35 @@ class Graph(object):
         """
         self.update_current(msg, agent_id)
         self.update_step(msg['content']['step'])
+        self.agent_steps[agent_id] = msg['content']['step']
         if self._agent_moved(msg):
             for new_node in self.get_new_node_locations(msg, agent_id):
                 if new_node not in self.nodes:
                     self.nodes[new_node] = Node(new_node, step=self.get_step())
-                self.add_neighbours(self.nodes[new_node])
 
         new_obstacles, new_empty = [], []
         step = self.get_step()
         vision = self.get_vision(msg, agent_id)
-        for node in self.get_local_node_locations(agent_id):
+        location = self.get_current(agent_id).location
+
+        # If the agent saw the same area in the previous update, only the
+        # nodes of which the vision changed need to be checked. The other
+        # nodes in vision only need to be marked as seen in this step.
+        if agent_id in self._last_vision and \
+                self._last_vision[agent_id][0] == location:
+            _, last_vision, local_index = self._last_vision[agent_id]
+            changed = self._changed_vision(vision, last_vision, local_index)
+            for node in vision:
+                if node in local_index and node not in changed:
+                    self.nodes[node].set_terrain(vision[node]['terrain'], step)
+                    self.nodes[node].add_things(step, vision[node]['things'])
+            local_nodes = sorted(changed, key=local_index.get)
+        else:
+            local_nodes = self.get_local_node_locations(agent_id)
+            local_index = {node: i for i, node in enumerate(local_nodes)}
+        self._last_vision[agent_id] = (location, vision, local_index)
+
+        for node in local_nodes:
             if self.nodes[node].get_terrain()[0] == 'obstacle':
                 # check for new empty spots
                 if node not in vision or vision[node]['terrain'] == 'empty':
@@ -389,11 +459,73 @@ class Graph(object):
         self.new_obs = {'obstacles': new_obstacles, 'empty': new_empty,
                         'agents': self.get_new_agent_locations(vision,
                                                                agent_id)}
+        if new_obstacles or new_empty:
+            self.log_terrain_changes(new_obstacles + new_empty)
         self.tasks = msg["content"]["percept"]["tasks"]
         self.attached = [tuple(x) for x in
                          msg["content"]["percept"]["attached"]]
         self.energy = msg["content"]["percept"]["energy"]
 
+    def update_remote(self, msg, agent_id):
+        """
+        Update the graph with the message of an agent that plays in another
+        process, e.g. when the graph is shared by agents in multiple
+        processes. Messages of steps that are already in the graph are
+        skipped, and the observations of the agents using this graph (new
+        obstacles, tasks, attached blocks and energy) are kept.
+
+        Arguments
+        ---------
+        msg: dict
+            The request-action message of the other agent.
+        agent_id: int
+            The id of the other agent.
+        """
+        if msg['content']['step'] <= self.agent_steps.get(agent_id, -1):
+            return
+        step, new_obs, tasks = self.step, self.new_obs, self.tasks
+        attached, energy = self.attached, self.energy
+        self.update(msg, agent_id)
+        self.step = max(step, self.step)
+        self.new_obs, self.tasks = new_obs, tasks
+        self.attached, self.energy = attached, energy
+
+    def __getstate__(self):
+        """
+        The distance fields are not sent to other processes, they are
+        created again when needed.
+        """
+        state = self.__dict__.copy()
+        state['distance_fields'] = {}
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restart the terrain change log, the planners of the other process
+        can not repair their paths with it.
+        """
+        self.__dict__.update(state)
+        self.terrain_changes = []
+        self.terrain_epoch += 1
+
+    @staticmethod
+    def _changed_vision(vision, last_vision, local_index):
+        """
+        Return the set of local nodes of which the vision changed since the
+        previous update of the agent.
+
+        Arguments
+        ---------
+        vision, last_vision: dict
+            The processed perceptual information of the current and previous
+            update.
+        local_index: dict
+            The nodes in the agent's local vision and their index.
+        """
+        return {node for node in vision.keys() | last_vision.keys()
+                if node in local_index and
+                vision.get(node) != last_vision.get(node)}
+
     def add_thing(self, thing, location):
         """
         Adds given thing to self.things.
@@ -443,9 +575,10 @@ class Graph(object):
         if self._agent_moved(msg):
             prev_direction = msg['content']['percept']['lastActionParams'][0]
             self.current[agent_id] = \
-                self.nodes[self.get_current(agent_id).
-                           get_direction(width=self.width, height=self.height,
-                                         direction=prev_direction)]
+                self.get_node(self.get_current(agent_id).
+                              get_direction(width=self.width,
+                                            height=self.height,
+                                            direction=prev_direction))
 
     def update_step(self, step):
         """
@@ -454,32 +587,6 @@ class Graph(object):
         """
         self.step = step
 
-    def add_neighbours(self, node):
-        """
-        Connect node to neighbouring nodes if it doesn't already have a node in
-        that direction.
-        """
-        x, y = node.location
-        if self.modulate((x, y-1)) in self.nodes and \
-                node.directions['n'] is None:
-            node.add_direction(north=self.nodes[self.modulate((x, y-1))])
-            self.nodes[self.modulate((x, y-1))].add_direction(south=node)
-
-        if self.modulate((x+1, y)) in self.nodes and \
-                node.directions['e'] is None:
-            node.add_direction(east=self.nodes[self.modulate((x+1, y))])
-            self.nodes[self.modulate((x+1, y))].add_direction(west=node)
-
-        if self.modulate((x, y+1)) in self.nodes and \
-                node.directions['s'] is None:
-            node.add_direction(south=self.nodes[self.modulate((x, y+1))])
-            self.nodes[self.modulate((x, y+1))].add_direction(north=node)
-
-        if self.modulate((x-1, y)) in self.nodes and \
-                node.directions['w'] is None:
-            node.add_direction(west=self.nodes[self.modulate((x-1, y))])
-            self.nodes[self.modulate((x-1, y))].add_direction(east=node)
-
     def get_vision(self, msg, agent_id):
         """
         Process the percept information from the message and create
@@ -542,7 +649,6 @@ class Graph(object):
             return self.nodes[location]
         else:
             self.nodes[location] = Node(location, step=self.get_step())
-            self.add_neighbours(self.nodes[location])
             return self.nodes[location]
 
     def get_new_agent_locations(self, vision, agent_id):
@@ -604,12 +710,9 @@ class Graph(object):
             cx, cy = offset
         else:
             cx, cy = self.get_current(agent_id).location
-        nodes = []
-        for x in range(-5, 6):
-            for y in range(-5, 6):
-                if abs(x) + abs(y) < 6:
-                    nodes.append(self.modulate((x + cx, y + cy)))
-        return nodes
+        if not self.width and not self.height:
+            return [(x + cx, y + cy) for x, y in VISION_OFFSETS]
+        return [self.modulate((x + cx, y + cy)) for x, y in VISION_OFFSETS]
 
     def get_local_agent_locations(self, agent_id, team='A'):
         """
@@ -649,6 +752,28 @@ class Graph(object):
 
         return local_things
 
+    def get_local_observation(self, agent_id, team='A'):
+        """
+        Return what the agent observes in its local vision in the current
+        step, with coordinates relative to the agent: the locations of the
+        agents of the team (excluding itself) and a dictionary of the
+        terrain and things of every location.
+
+        Arguments
+        ---------
+        team: str
+            The team's name.
+        """
+        cx, cy = self.get_current(agent_id).location
+        agents, cells = [], {}
+        for x, y in VISION_OFFSETS:
+            node = self.nodes[self.modulate((x + cx, y + cy))]
+            things = frozenset(node.get_things(step=self.step))
+            cells[(x, y)] = (node.get_terrain()[0], things)
+            if (x, y) != (0, 0) and ('entity', team) in things:
+                agents.append((x, y))
+        return agents, cells
+
     def get_new_node_locations(self, msg, agent_id):
         """
         Get coordinates of the new nodes relative to the root node.
@@ -681,6 +806,78 @@ class Graph(object):
 
         return nodes
 
+    def get_distance_field(self, goals, create=True):
+        """
+        Returns the distance field of the goal for the current energy, which
+        is created if it does not exist yet. The least recently used field
+        is dropped if there are more than max_distance_fields.
+
+        Arguments
+        ---------
+        goals: tuple or iterable of tuples
+            The goal location, or multiple goal locations.
+        create: bool
+            If False, None is returned if the field does not exist.
+        """
+        energy = self.energy // self.energy_bucket * self.energy_bucket
+        key = (goals if isinstance(goals, tuple) else frozenset(goals),
+               energy)
+        field = self.distance_fields.pop(key, None)
+        if field is None:
+            if not create:
+                return None
+            field = DistanceField(self, goals, energy)
+            while len(self.distance_fields) >= self.max_distance_fields:
+                del self.distance_fields[next(iter(self.distance_fields))]
+        self.distance_fields[key] = field
+        return field
+
+    def clear_distance_fields(self):
+        """
+        Remove all distance fields and restart the terrain change log, e.g.
+        when the coordinates changed.
+        """
+        self.distance_fields = {}
+        self.version += 1
+        self.terrain_changes = []
+        self.terrain_epoch += 1
+
+    def log_terrain_changes(self, changed):
+        """
+        Register cells whose terrain changed: repair the distance fields and
+        add the cells to the terrain change log.
+
+        Arguments
+        ---------
+        changed: list of tuples
+            The cells that became an obstacle or became empty.
+        """
+        self.version += 1
+        for field in self.distance_fields.values():
+            field.repair(changed)
+
+        if len(self.terrain_changes) + len(changed) > \
+                self.max_terrain_changes:
+            self.terrain_changes = []
+            self.terrain_epoch += 1
+        self.terrain_changes.extend(changed)
+
+    def get_terrain_changes(self, mark=None):
+        """
+        Returns the cells whose terrain changed since the mark, or None if
+        the log was restarted since then, and the mark of the current end of
+        the log.
+
+        Arguments
+        ---------
+        mark: (int, int)
+            A mark returned by a previous call, None for no changes yet.
+        """
+        current = (self.terrain_epoch, len(self.terrain_changes))
+        if mark is None or mark[0] != self.terrain_epoch:
+            return None, current
+        return self.terrain_changes[mark[1]:], current
+
     def get_step(self):
         return self.step
 
@@ -719,6 +916,25 @@ class Graph(object):
         else:
             return ''
 
+    def get_neighbours(self, location):
+        """
+        Return the locations of the four neighbours of a location (east,
+        north, west, south). The neighbours are derived from the coordinates
+        and the known dimensions, nodes do not store them.
+
+        Arguments
+        ---------
+        location: (int, int)
+            The location of which the neighbours are requested.
+        """
+        x, y = location
+        width, height = self.width, self.height
+        if width and height:
+            return [((x + dx) % width, (y + dy) % height)
+                    for dx, dy in NEIGHBOUR_OFFSETS]
+        return [self.modulate((x + dx, y + dy))
+                for dx, dy in NEIGHBOUR_OFFSETS]
+
     def modulate(self, location):
         """
         Apply the width and height of the map as a modulo to the coordinates.
@@ -738,56 +954,32 @@ class Graph(object):
     def apply_dimensions_to_graph(self):
         """
         Apply the dimensions (width and height) to the nodes in the graph.
-        This way the agents knows when it has looped the map.
+        This way the agents knows when it has looped the map. Both dimensions
+        are applied in a single pass over the nodes.
         """
         current_locations = []
         for agent in self.current:
             current_locations.append((agent, self.get_current(agent).location))
 
-        for node in list(self.nodes):
-            if self.modulate(node) != node:
-                if self.modulate(node) in self.nodes:
-                    if self.nodes[self.modulate(node)].get_terrain()[1] < \
-                            self.nodes[node].get_terrain()[1]:
-                        self.nodes[self.modulate(node)].\
-                            set_terrain(*self.nodes[node].get_terrain())
-
-                    for things in self.nodes[node].get_things():
-                        self.nodes[self.modulate(node)].add_things(*things)
-
-                    del self.nodes[node]
-
-                else:
-                    x, y = node
-                    self.nodes[self.modulate((x, y))] = self.nodes[node]
-                    del self.nodes[((x, y))]
-                    self.nodes[self.modulate((x, y))].\
-                        set_location(self.modulate((x, y)))
-
-        for x, y in self.nodes:
-            if self.modulate((x, y-1)) in self.nodes:
-                self.nodes[self.modulate((x, y))].\
-                    add_direction(north=self.nodes[self.modulate((x, y-1))])
-                self.nodes[self.modulate((x, y-1))].\
-                    add_direction(south=self.nodes[self.modulate((x, y))])
-
-            if self.modulate((x+1, y)) in self.nodes:
-                self.nodes[self.modulate((x, y))].\
-                    add_direction(east=self.nodes[self.modulate((x+1, y))])
-                self.nodes[self.modulate((x+1, y))].\
-                    add_direction(west=self.nodes[self.modulate((x, y))])
-
-            if self.modulate((x, y+1)) in self.nodes:
-                self.nodes[self.modulate((x, y))].\
-                    add_direction(south=self.nodes[self.modulate((x, y+1))])
-                self.nodes[self.modulate((x, y+1))].\
-                    add_direction(north=self.nodes[self.modulate((x, y))])
-
-            if self.modulate((x-1, y)) in self.nodes:
-                self.nodes[self.modulate((x, y))].\
-                    add_direction(west=self.nodes[self.modulate((x-1, y))])
-                self.nodes[self.modulate((x-1, y))].\
-                    add_direction(east=self.nodes[self.modulate((x, y))])
+        # The coordinates of the previous visions are no longer valid.
+        self._last_vision = {}
+        self.clear_distance_fields()
+
+        # Only the nodes outside the bounds of the map have to be folded.
+        width, height = self.width, self.height
+        outside = [(x, y) for x, y in self.nodes
+                   if (width and not 0 <= x < width) or
+                   (height and not 0 <= y < height)]
+
+        for location in outside:
+            target = self.modulate(location)
+            if target in self.nodes:
+                self._combine_nodes(self.nodes[target], self.nodes[location])
+                del self.nodes[location]
+            else:
+                self.nodes[target] = self.nodes[location]
+                del self.nodes[location]
+                self.nodes[target].set_location(target)
 
         # Update current
         for agent, location in current_locations:
@@ -812,6 +1004,57 @@ class Graph(object):
         for i, location in enumerate(self.attached):
             self.attached[i] = self.modulate(location)
 
+    def _merge_nodes(self, other, rx, ry):
+        """
+        Add the nodes of another graph, translated by (rx, ry), to this
+        graph. Nodes that are new to this graph are moved in bulk. For nodes
+        that exist in both graphs the most recent terrain is kept and the
+        things are combined.
+
+        Arguments
+        ---------
+        other: Graph
+            The graph whose nodes are added.
+        rx, ry: int
+            The translation from the coordinates of the other graph to the
+            coordinates of this graph.
+        """
+        translated = {self.modulate((x + rx, y + ry)): node
+                      for (x, y), node in other.nodes.items()}
+
+        # Nodes of the other graph can coincide when only this graph knows
+        # the dimensions.
+        if len(translated) < len(other.nodes):
+            translated = {}
+            for (x, y), node in other.nodes.items():
+                location = self.modulate((x + rx, y + ry))
+                if location in translated:
+                    self._combine_nodes(translated[location], node)
+                else:
+                    translated[location] = node
+
+        overlap = translated.keys() & self.nodes.keys()
+        new = {location: node for location, node in translated.items()
+               if location not in overlap}
+        for location, node in new.items():
+            node.set_location(location)
+        self.nodes.update(new)
+
+        for location in overlap:
+            self._combine_nodes(self.nodes[location], translated[location])
+
+    @staticmethod
+    def _combine_nodes(node, other):
+        """
+        Combine the information of another node at the same location into
+        the node.
+        """
+        if node.get_terrain()[1] < other.get_terrain()[1]:
+            node.set_terrain(*other.get_terrain())
+
+        for things in other.get_things():
+            node.add_things(*things)
+
     def print_local(self, agent_id, all=False):
         """
         Print the map as represented by the beliefs.
@@ -886,7 +1129,7 @@ class Graph(object):
         return False
 
 
-def merge_graphs(g1, agent1, g2, agent2, offset):
+def merge_graphs(g1, agent1, g2, agent2, offset, translation=None):
     """
     Merge two graphs. The second graph (g2) will adopt the coordinate system
     from the first graph (g1).
@@ -899,59 +1142,36 @@ def merge_graphs(g1, agent1, g2, agent2, offset):
         The id's of the two agent to which g1 and g2 belong respectively.
     offset: (int, int)
         The location of the second agent from the perspective of the first.
+    translation: (int, int)
+        Translates coordinates of g2 to coordinates of g1. If given, it is
+        used instead of the offset, e.g. when the translation was computed
+        from the locations of the agents in an earlier step.
     """
-    g1_x, g1_y = g1.get_current(agent1).location
-    g2_x, g2_y = g2.get_current(agent2).location
+    start = time.perf_counter()
+    n_nodes = (len(g1.nodes), len(g2.nodes))
 
-    rx, ry = g1_x + offset[0] - g2_x, g1_y + offset[1] - g2_y
+    if translation is not None:
+        rx, ry = translation
+    else:
+        g1_x, g1_y = g1.get_current(agent1).location
+        g2_x, g2_y = g2.get_current(agent2).location
+        rx, ry = g1_x + offset[0] - g2_x, g1_y + offset[1] - g2_y
 
     temp = []
     for agent in g2.current:
         temp.append((agent, g2.get_current(agent).location))
 
-    for x, y in g2.nodes:
-        new_x, new_y = g1.modulate((x + rx, y + ry))
-        if (new_x, new_y) in g1.nodes:
-            # Get the most up-to-date terrain information
-            if g1.nodes[(new_x, new_y)].get_terrain()[1] < \
-                    g2.nodes[(x, y)].get_terrain()[1]:
-                g1.nodes[(new_x, new_y)].\
-                    set_terrain(*g2.nodes[(x, y)].get_terrain())
-
-            for things in g2.nodes[(x, y)].get_things():
-                g1.nodes[(new_x, new_y)].add_things(*things)
+    g1._merge_nodes(g2, rx, ry)
 
-        else:
-            g1.nodes[(new_x, new_y)] = g2.nodes[(x, y)]
-            g1.nodes[(new_x, new_y)].set_location((new_x, new_y))
-
-            if g1.modulate((new_x, new_y-1)) in g1.nodes:
-                g1.nodes[(new_x, new_y)].add_direction(
-                    north=g1.nodes[g1.modulate((new_x, new_y-1))])
-                g1.nodes[g1.modulate((new_x, new_y-1))].\
-                    add_direction(south=g1.nodes[(new_x, new_y)])
-
-            if g1.modulate((new_x+1, new_y)) in g1.nodes:
-                g1.nodes[(new_x, new_y)].add_direction(
-                    east=g1.nodes[g1.modulate((new_x+1, new_y))])
-                g1.nodes[g1.modulate((new_x+1, new_y))].\
-                    add_direction(west=g1.nodes[(new_x, new_y)])
-
-            if g1.modulate((new_x, new_y+1)) in g1.nodes:
-                g1.nodes[(new_x, new_y)].add_direction(
-                    south=g1.nodes[g1.modulate((new_x, new_y+1))])
-                g1.nodes[g1.modulate((new_x, new_y+1))].\
-                    add_direction(north=g1.nodes[(new_x, new_y)])
-
-            if g1.modulate((new_x-1, new_y)) in g1.nodes:
-                g1.nodes[(new_x, new_y)].add_direction(
-                    west=g1.nodes[g1.modulate((new_x-1, new_y))])
-                g1.nodes[g1.modulate((new_x-1, new_y))].\
-                    add_direction(east=g1.nodes[(new_x, new_y)])
+    # The terrain in the previous visions may have been replaced by the
+    # (more recent) terrain of the second graph.
+    g1._last_vision = {}
 
     for agent, location in temp:
         g1.current[agent] = g1.nodes[g1.modulate((location[0] + rx,
                                                   location[1] + ry))]
+        if agent in g2.agent_steps:
+            g1.agent_steps[agent] = g2.agent_steps[agent]
 
     for thing in g2.things:
         if thing == 'dispensers':
@@ -968,6 +1188,11 @@ def merge_graphs(g1, agent1, g2, agent2, offset):
                 if (new_x, new_y) not in g1.things[thing]:
                     g1.things[thing].append((new_x, new_y))
 
+    # The fields did not know about the terrain of the second graph.
+    g1.clear_distance_fields()
+
+    g1.merge_stats = {'time': time.perf_counter() - start,
+                      'nodes': n_nodes, 'merged_nodes': len(g1.nodes)}
     return g1
 
 
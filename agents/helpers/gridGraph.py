@@ -0,0 +1,440 @@
+from collections.abc import MutableMapping
+import numpy as np
+
+if __name__ == "__main__":
+    from graph import Graph, Node, TERRAIN, TERRAIN_CODES
+else:
+    from .graph import Graph, Node, TERRAIN, TERRAIN_CODES
+
+
+# Bits of the thing-occupancy layer.
+THING_BITS = {'block': 1, 'entity': 2, 'dispenser': 4, 'taskboard': 8,
+              'marker': 16}
+
+
+class GridNode(Node):
+    """
+    View on a single cell of a GridNodes store. It behaves like a Node, but
+    all information is read from and written to the arrays of the store.
+    """
+    __slots__ = ('_store',)
+
+    def __init__(self, store, location):
+        """
+        Arguments
+        ---------
+        store: GridNodes
+            The store which contains the information of the node.
+        location: tuple(int, int)
+            The x, y coordinate of the node.
+        """
+        self._store = store
+        self.location = location
+
+    def __reduce__(self):
+        # A view is pickled as its store and location, the information of
+        # the node is in the arrays of the store.
+        return (GridNode, (self._store, self.location))
+
+    @property
+    def terrain(self):
+        return self._store.get_terrain(self.location)
+
+    @terrain.setter
+    def terrain(self, terrain):
+        self._store.set_terrain(self.location, *terrain)
+
+    @property
+    def _terrain(self):
+        return self._store.get_terrain_code(self.location)
+
+    @property
+    def surr_obstacles(self):
+        return self._store.get_surr_obstacles(self.location)
+
+    @surr_obstacles.setter
+    def surr_obstacles(self, count):
+        self._store.set_surr_obstacles(self.location, count)
+
+    @property
+    def things(self):
+        return self._store.things.get(self.location, {})
+
+    def _writable_things(self):
+        return self._store.things.setdefault(self.location, {})
+
+    def add_things(self, step, objects):
+        """
+        Add things to the node at a specific step and update the
+        thing-occupancy layer of the store.
+
+        Arguments
+        ---------
+        objects: tuple or list
+            the objects can either be a single thing or a list of things.
+        step: int
+            The step on which the things need to be added.
+        """
+        Node.add_things(self, step, objects)
+        things = self._store.things.get(self.location, {})
+        if step in things:
+            self._store.set_occupancy(self.location, step, things[step])
+
+    def _is_thing(self, step, agent_location, attached,
+                  things=['block', 'entity']):
+        """
+        Determine if a node is a given thing using the thing-occupancy layer.
+        By default looking for blocks and entities.
+        Parameters
+        ---------
+        step: int
+            Current game step.
+        agent_location: (int, int)
+            The location of the agent itself.
+        attached: list of tuples
+            The location of the blocks attached to the agent.
+        things: list of str
+            List of things to include from {block, entity, dispenser, marker}.
+        """
+        if agent_location == self.location:
+            return False
+
+        if self.location in attached:
+            return False
+
+        occupancy = self._store.get_occupancy(self.location, step)
+        if occupancy is None:
+            return Node._is_thing(self, step, agent_location, attached,
+                                  things)
+
+        return bool(occupancy & sum(THING_BITS[thing] for thing in things))
+
+
+class GridNodes(MutableMapping):
+    """
+    Compact replacement of the node dictionary of a graph, which maps
+    (x, y) coordinates to nodes. The terrain, last-seen step, number of
+    surrounding obstacles and thing occupancy are stored in NumPy arrays.
+    The arrays grow automatically while the dimensions of the map are
+    unknown and become a fixed toroidal grid once they are known.
+    """
+    # Maximum number of node views that are kept for reuse.
+    max_views = 1 << 16
+
+    def __init__(self, size=16):
+        """
+        Arguments
+        ---------
+        size: int
+            The initial number of cells in both directions.
+        """
+        self.origin = (-(size // 2), -(size // 2))
+        self.width = None
+        self.height = None
+        self._allocate((size, size))
+
+        # {location: {step: things}}, only for nodes which contain things.
+        self.things = {}
+
+        # The views returned by __getitem__ by location, so a lookup does
+        # not create a new view every time. Only views of existing nodes
+        # are kept.
+        self._views = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_views'] = {}
+        return state
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        """
+        Create a store containing the given nodes.
+
+        Arguments
+        ---------
+        nodes: dict
+            A dictionary of locations and nodes.
+        """
+        store = cls()
+        for location, node in nodes.items():
+            store[location] = node
+        return store
+
+    def _allocate(self, shape):
+        self._terrain = np.zeros(shape, dtype=np.uint8)
+        self._terrain_step = np.zeros(shape, dtype=np.int32)
+        self._surr_obstacles = np.zeros(shape, dtype=np.int8)
+        self._occupancy = np.zeros(shape, dtype=np.uint8)
+        self._occupancy_step = np.full(shape, -1, dtype=np.int32)
+
+    def _arrays(self):
+        return [self._terrain, self._terrain_step, self._surr_obstacles,
+                self._occupancy, self._occupancy_step]
+
+    def _index(self, location, grow=False):
+        """
+        Return the array index of the location. If the location lies outside
+        the arrays, grow them if grow is True and return None otherwise.
+        """
+        ix, iy = location[0] - self.origin[0], location[1] - self.origin[1]
+        shape = self._terrain.shape
+        if 0 <= ix < shape[0] and 0 <= iy < shape[1]:
+            return ix, iy
+        if not grow:
+            return None
+
+        self._grow(location)
+        return self._index(location)
+
+    def _grow(self, location):
+        """
+        Grow the arrays (at least doubling them in the required direction)
+        so the location fits.
+        """
+        (x0, y0), (nx, ny) = self.origin, self._terrain.shape
+        x, y = location
+        new_x0, new_nx = self._grow_axis(x, x0, nx)
+        new_y0, new_ny = self._grow_axis(y, y0, ny)
+
+        old = self._arrays()
+        self._allocate((new_nx, new_ny))
+        dx, dy = x0 - new_x0, y0 - new_y0
+        for new, array in zip(self._arrays(), old):
+            new[dx:dx + nx, dy:dy + ny] = array
+        self.origin = (new_x0, new_y0)
+
+    @staticmethod
+    def _grow_axis(coord, start, size):
+        """
+        Return the new start and size of a single axis so coord fits.
+        """
+        if coord < start:
+            grow = max(size, start - coord)
+            return start - grow, size + grow
+        if coord >= start + size:
+            grow = max(size, coord - start - size + 1)
+            return start, size + grow
+        return start, size
+
+    def fix_dimensions(self, width=None, height=None):
+        """
+        Turn the known dimensions into a fixed toroidal grid, which runs from
+        0 to width (or height). All nodes must already be modulated.
+
+        Arguments
+        ---------
+        width, height: int
+            The dimensions of the map, None if unknown.
+        """
+        self.width, self.height = width, height
+        (x0, y0), (nx, ny) = self.origin, self._terrain.shape
+        new_x0, new_nx = (0, width) if width else (x0, nx)
+        new_y0, new_ny = (0, height) if height else (y0, ny)
+        if (new_x0, new_y0, new_nx, new_ny) == (x0, y0, nx, ny):
+            return
+
+        ix, iy = np.nonzero(self._terrain)
+        old = self._arrays()
+        self._allocate((new_nx, new_ny))
+        self._views = {}
+        self.origin = (new_x0, new_y0)
+        new_ix, new_iy = ix + x0 - new_x0, iy + y0 - new_y0
+        for new, array in zip(self._arrays(), old):
+            new[new_ix, new_iy] = array[ix, iy]
+
+    def merge(self, other, rx, ry):
+        """
+        Add the cells of another store, translated by (rx, ry), to this
+        store in one vectorized pass. Cells that are new to this store are
+        copied, for the other cells the most recent terrain is kept. The
+        things are combined per cell.
+
+        Arguments
+        ---------
+        other: GridNodes
+            The store whose cells are added.
+        rx, ry: int
+            The translation from the coordinates of the other store to the
+            coordinates of this store.
+        """
+        ix, iy = np.nonzero(other._terrain)
+        if not len(ix):
+            return
+
+        # Apply the cells in order of their step, so the most recent one
+        # is kept if cells coincide after applying the dimensions.
+        order = np.argsort(other._terrain_step[ix, iy], kind='stable')
+        ix, iy = ix[order], iy[order]
+        x, y = ix + other.origin[0] + rx, iy + other.origin[1] + ry
+        if self.width:
+            x = x % self.width
+        if self.height:
+            y = y % self.height
+
+        # Grow the arrays once so all cells fit.
+        self._index((int(x.min()), int(y.min())), grow=True)
+        self._index((int(x.max()), int(y.max())), grow=True)
+        jx, jy = x - self.origin[0], y - self.origin[1]
+
+        step = other._terrain_step[ix, iy]
+        new = self._terrain[jx, jy] == 0
+        newer = new | (self._terrain_step[jx, jy] < step)
+        self._surr_obstacles[jx[new], jy[new]] = \
+            other._surr_obstacles[ix[new], iy[new]]
+        self._terrain[jx[newer], jy[newer]] = other._terrain[ix[newer],
+                                                             iy[newer]]
+        self._terrain_step[jx[newer], jy[newer]] = step[newer]
+
+        for (x, y), things in other.things.items():
+            view = GridNode(self, self.modulate((x + rx, y + ry)))
+            for step, step_things in sorted(things.items()):
+                view.add_things(step, list(step_things))
+
+    def modulate(self, location):
+        """
+        Apply the fixed dimensions of the store to the coordinates.
+        """
+        x, y = location
+        if self.width:
+            x = x % self.width
+        if self.height:
+            y = y % self.height
+        return (x, y)
+
+    # Access to the arrays. Single cells are read with item, which returns
+    # a Python int and is much faster than indexing a NumPy array.
+
+    def get_terrain(self, location):
+        ix, iy = self._index(location)
+        return (TERRAIN[self._terrain.item(ix, iy)],
+                self._terrain_step.item(ix, iy))
+
+    def get_terrain_code(self, location):
+        return self._terrain.item(self._index(location))
+
+    def set_terrain(self, location, terrain, step):
+        ix, iy = self._index(location, grow=True)
+        self._terrain[ix, iy] = TERRAIN_CODES[terrain]
+        self._terrain_step[ix, iy] = step
+
+    def get_surr_obstacles(self, location):
+        return self._surr_obstacles.item(self._index(location))
+
+    def set_surr_obstacles(self, location, count):
+        ix, iy = self._index(location, grow=True)
+        self._surr_obstacles[ix, iy] = count
+
+    def get_occupancy(self, location, step):
+        """
+        Return the occupancy bits of the location at the given step, or None
+        if the layer only contains a later step.
+        """
+        index = self._index(location)
+        occupancy_step = self._occupancy_step.item(index)
+        if occupancy_step == step:
+            return self._occupancy.item(index)
+        # The layer holds the latest step with things, so there are no
+        # things on later steps.
+        if occupancy_step < step:
+            return 0
+        return None
+
+    def set_occupancy(self, location, step, things):
+        ix, iy = self._index(location, grow=True)
+        if self._occupancy_step[ix, iy] > step:
+            return
+        bits = 0
+        for thing in things:
+            bits |= THING_BITS.get(thing[0], 0)
+        self._occupancy[ix, iy] = bits
+        self._occupancy_step[ix, iy] = step
+
+    def obstacle_mask(self):
+        """
+        Return a boolean array of the obstacles and the origin of the array.
+        """
+        return self._terrain == TERRAIN_CODES['obstacle'], self.origin
+
+    # Mapping interface.
+
+    def __contains__(self, location):
+        ix, iy = location[0] - self.origin[0], location[1] - self.origin[1]
+        nx, ny = self._terrain.shape
+        return 0 <= ix < nx and 0 <= iy < ny and \
+            self._terrain.item(ix, iy) != 0
+
+    def __getitem__(self, location):
+        view = self._views.get(location)
+        if view is None:
+            if location not in self:
+                raise KeyError(location)
+            if len(self._views) >= self.max_views:
+                self._views = {}
+            view = self._views[location] = GridNode(self, location)
+        return view
+
+    def __setitem__(self, location, node):
+        if isinstance(node, GridNode) and node._store is self and \
+                node.location == location:
+            return
+
+        # Read everything before writing, the node might be a view on this
+        # store.
+        terrain, surr_obstacles = node.get_terrain(), node.surr_obstacles
+        things = node.get_things()
+
+        if location in self:
+            del self[location]
+        self.set_terrain(location, *terrain)
+        self.set_surr_obstacles(location, surr_obstacles)
+        view = GridNode(self, location)
+        for step, step_things in things:
+            view.add_things(step, list(step_things))
+
+    def __delitem__(self, location):
+        if location not in self:
+            raise KeyError(location)
+        index = self._index(location)
+        for array in self._arrays():
+            array[index] = -1 if array is self._occupancy_step else 0
+        self.things.pop(location, None)
+        self._views.pop(location, None)
+
+    def __iter__(self):
+        x0, y0 = self.origin
+        for ix, iy in zip(*np.nonzero(self._terrain)):
+            yield (int(ix) + x0, int(iy) + y0)
+
+    def __len__(self):
+        return int(np.count_nonzero(self._terrain))
+
+
+class GridGraph(Graph):
+    """
+    Graph which stores its nodes in a GridNodes store instead of a
+    dictionary of Node objects.
+    """
+    def __init__(self, agent_id):
+        super().__init__(agent_id)
+        self.nodes = GridNodes.from_nodes(self.nodes)
+        self.current = {agent_id: self.nodes[(0, 0)]}
+
+    def _merge_nodes(self, other, rx, ry):
+        """
+        Add the nodes of another graph, translated by (rx, ry), to this
+        graph. If both graphs use a GridNodes store, the arrays are merged
+        at once.
+        """
+        if isinstance(other.nodes, GridNodes):
+            self.nodes.merge(other.nodes, rx, ry)
+        else:
+            super()._merge_nodes(other, rx, ry)
+
+    def apply_dimensions_to_graph(self):
+        """
+        Apply the dimensions (width and height) to the nodes in the graph and
+        turn the store into a fixed toroidal grid.
+        """
+        super().apply_dimensions_to_graph()
+        self.nodes.fix_dimensions(self.width, self.height)
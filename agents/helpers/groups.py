@@ -0,0 +1,115 @@
+class BeliefGroups(object):
+    """
+    Union-find registry of the agents whose beliefs have been merged. All
+    agents in a group share the graph of the group, which uses the
+    coordinate system of the root of the group. For every agent the offset
+    from its parent's coordinate system is stored, so the coordinates of any
+    agent can be translated to the coordinates of its group or of another
+    agent in the same group.
+    """
+    def __init__(self):
+        self.parent = {}
+        self.offset = {}
+        self.size = {}
+        self.count = 0
+
+    def add(self, agent_id):
+        """
+        Add the agent as a group of its own, if it is not known yet.
+
+        Arguments
+        ---------
+        agent_id: int
+            The id of the agent.
+        """
+        if agent_id not in self.parent:
+            self.parent[agent_id] = agent_id
+            self.offset[agent_id] = (0, 0)
+            self.size[agent_id] = 1
+            self.count += 1
+
+    def find(self, agent_id):
+        """
+        Returns the root of the group of the agent and the offset that
+        translates coordinates of the agent to coordinates of the root.
+
+        Arguments
+        ---------
+        agent_id: int
+            The id of the agent.
+        """
+        self.add(agent_id)
+        path = []
+        while self.parent[agent_id] != agent_id:
+            path.append(agent_id)
+            agent_id = self.parent[agent_id]
+        root = agent_id
+
+        # Point every agent on the path directly to the root.
+        x, y = 0, 0
+        for agent_id in reversed(path):
+            dx, dy = self.offset[agent_id]
+            x, y = x + dx, y + dy
+            self.parent[agent_id] = root
+            self.offset[agent_id] = (x, y)
+
+        return root, self.offset[path[0]] if path else (0, 0)
+
+    def same(self, agent1, agent2):
+        """
+        Returns True if the beliefs of both agents have been merged.
+        """
+        return self.find(agent1)[0] == self.find(agent2)[0]
+
+    def union(self, agent1, agent2, offset):
+        """
+        Join the group of the second agent into the group of the first agent,
+        whose root stays the root. Returns the root.
+
+        Arguments
+        ---------
+        agent1, agent2: int
+            The ids of the agents.
+        offset: (int, int)
+            Translates coordinates of the graph of agent2 to coordinates of
+            the graph of agent1.
+        """
+        root1, offset1 = self.find(agent1)
+        root2, offset2 = self.find(agent2)
+        if root1 == root2:
+            return root1
+
+        # The coordinates of the graph of an agent are the coordinates of
+        # its root.
+        self.parent[root2] = root1
+        self.offset[root2] = offset
+        self.size[root1] += self.size.pop(root2)
+        self.count -= 1
+        return root1
+
+    def translate(self, location, agent1, agent2):
+        """
+        Translate a location from the coordinates of the first agent (when
+        it was the root of its group) to those of the second agent. Returns
+        None if the agents are not in the same group.
+
+        Arguments
+        ---------
+        location: (int, int)
+            The location in the coordinates of agent1.
+        agent1, agent2: int
+            The ids of the agents.
+        """
+        root1, (x1, y1) = self.find(agent1)
+        root2, (x2, y2) = self.find(agent2)
+        if root1 != root2:
+            return None
+        return (location[0] + x1 - x2, location[1] + y1 - y2)
+
+    def members(self, agent_id):
+        """
+        Returns the ids of the agents in the group of the agent.
+        """
+        root = self.find(agent_id)[0]
+        return [other for other in self.parent
+                if self.find(other)[0] == root]
@@ -0,0 +1,190 @@
+import itertools
+import os
+import threading
+import time
+
+
+class ModelService(object):
+    """
+    Process-wide service around the model that predicts the location of an
+    enemy from its last three locations. The model is loaded once (in the
+    background after preload, otherwise on the first prediction) and shared
+    by all agents in the process.
+
+    Agents submit their paths as soon as they are complete and collect the
+    prediction when they need it. The first agent that collects a prediction
+    runs all submitted paths through the model in one batch, so the paths
+    submitted by all attackers within a step cost a single model call.
+    """
+    # The path of the model, relative to the agents directory.
+    model_path = os.path.join("model", "t1-n=3")
+
+    # Run the model with the NumPy forward pass of the weights exported by
+    # tools/export_model.py ('numpy') or with Keras ('keras'). Without an
+    # export Keras is used.
+    backend = 'numpy'
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path=None):
+        """
+        Arguments
+        ---------
+        path: str
+            The path of the model. By default the model_path in the agents
+            directory.
+        """
+        if path is None:
+            path = os.path.join(os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__))), self.model_path)
+        self.path = path
+        self.model = None
+        self.lock = threading.Lock()
+        self._loader = None
+
+        # Submitted paths and predictions that were not collected yet, by
+        # ticket.
+        self.pending = {}
+        self.results = {}
+        self._tickets = itertools.count()
+
+        # The number of model calls and the number of predictions.
+        self.batches = 0
+        self.predictions = 0
+
+    @classmethod
+    def instance(cls):
+        """
+        Returns the service of this process, which is created on first use.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def load(self):
+        """
+        Load the model, if not loaded yet, and run a dummy prediction to
+        initialize it fully. Must be called with the lock held.
+        """
+        if self.model is None:
+            # NumPy and TensorFlow are only imported when the model is used,
+            # so agents without the attacker role start without them.
+            import numpy as np
+
+            start = time.time()
+            if self.backend == 'numpy' and os.path.exists(self.path + '.npz'):
+                if __name__ == "__main__":
+                    from numpyModel import NumpyModel
+                else:
+                    from .numpyModel import NumpyModel
+                self.model = NumpyModel.load(self.path + '.npz')
+            else:
+                from keras.models import load_model
+                self.model = load_model(self.path, compile=False)
+            self.model.predict_on_batch(np.zeros((1, 3, 2), dtype='float32'))
+            print(f"Model loaded in {time.time() - start:.1f} s "
+                  f"({type(self.model).__name__})")
+
+    def preload(self):
+        """
+        Start loading the model in a background thread, so it is ready
+        before the first prediction is needed. Only the first call starts
+        loading.
+        """
+        with self._instance_lock:
+            if self._loader is None:
+                # Not a daemon, TensorFlow aborts the process if it exits
+                # while the model is loading.
+                self._loader = threading.Thread(target=self._load_locked,
+                                                name="ModelLoader")
+                self._loader.start()
+
+    def _load_locked(self):
+        with self.lock:
+            self.load()
+
+    def submit(self, path):
+        """
+        Submit a path for prediction. Returns the ticket with which the
+        prediction is collected.
+
+        Arguments
+        ---------
+        path: list of (int, int)
+            The last three locations of the enemy.
+        """
+        with self.lock:
+            ticket = next(self._tickets)
+            self.pending[ticket] = [tuple(location) for location in path]
+            return ticket
+
+    def result(self, ticket):
+        """
+        Returns the predicted location (x, y) as floats for a ticket. If the
+        prediction is not made yet, all pending paths are predicted at once.
+
+        Arguments
+        ---------
+        ticket: int
+            The ticket returned by submit.
+        """
+        with self.lock:
+            if ticket in self.pending:
+                self._flush()
+            return self.results.pop(ticket)
+
+    def predict(self, path):
+        """
+        Returns the predicted location for a single path, together with all
+        other pending paths.
+
+        Arguments
+        ---------
+        path: list of (int, int)
+            The last three locations of the enemy.
+        """
+        return self.result(self.submit(path))
+
+    def _flush(self):
+        """
+        Predict all pending paths in one batch. Must be called with the lock
+        held.
+        """
+        import numpy as np
+
+        self.load()
+        tickets = list(self.pending)
+        batch = np.array([self.pending.pop(ticket) for ticket in tickets],
+                         dtype='float32')
+        predictions = np.asarray(self.model.predict_on_batch(batch))
+        for ticket, prediction in zip(tickets, predictions):
+            self.results[ticket] = (float(prediction[0]),
+                                    float(prediction[1]))
+        self.batches += 1
+        self.predictions += len(tickets)
+
+
+if __name__ == "__main__":
+    service = ModelService()
+    paths = [[(x, 0), (x + 1, 0), (x + 2, 0)] for x in range(20)]
+
+    start = time.time()
+    service.predict(paths[0])
+    print(f"First prediction (incl. loading): {time.time() - start:.2f} s")
+
+    start = time.time()
+    for path in paths:
+        service.predict(path)
+    print(f"20 single predictions: {time.time() - start:.3f} s")
+
+    # With Keras the first batch of a new size is slower, the model is traced
+    # again.
+    for _ in range(2):
+        start = time.time()
+        tickets = [service.submit(path) for path in paths]
+        results = [service.result(ticket) for ticket in tickets]
+        print(f"20 batched predictions: {time.time() - start:.3f} s")
+    print(f"{service.predictions} predictions in {service.batches} batches")
@@ -0,0 +1,137 @@
+import json
+
+import numpy as np
+
+
+def _sigmoid(x):
+    # Equal to 1 / (1 + exp(-x)), without overflow for large inputs.
+    return 0.5 * (np.tanh(0.5 * x) + 1)
+
+
+def _hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0, 1)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'relu': lambda x: np.maximum(x, 0),
+}
+
+
+class NumpyModel(object):
+    """
+    Forward pass of a sequential model of LSTM and Dense layers in NumPy,
+    with the weights exported from Keras by tools/export_model.py. Meant
+    for small models and inputs, for which calling Keras costs more than
+    the computation itself.
+    """
+    def __init__(self, layers):
+        """
+        Arguments
+        ---------
+        layers: list of (str, dict, dict)
+            The type ('lstm' or 'dense'), the configuration (activations)
+            and the weights (kernel, bias and for LSTM layers
+            recurrent_kernel) of every layer.
+        """
+        self.layers = layers
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a model exported by tools/export_model.py.
+
+        Arguments
+        ---------
+        path: str
+            The path of the .npz file.
+        """
+        with np.load(path) as data:
+            config = json.loads(str(data['config']))
+            layers = []
+            for i, (kind, layer_config) in enumerate(config):
+                weights = {name[len(f'{i}/'):]: data[name].astype(np.float32)
+                           for name in data.files
+                           if name.startswith(f'{i}/')}
+                layers.append((kind, layer_config, weights))
+        return cls(layers)
+
+    def save(self, path):
+        """
+        Save the model to a .npz file.
+
+        Arguments
+        ---------
+        path: str
+            The path of the .npz file.
+        """
+        arrays = {f'{i}/{name}': array
+                  for i, (_, _, weights) in enumerate(self.layers)
+                  for name, array in weights.items()}
+        config = [(kind, layer_config)
+                  for kind, layer_config, _ in self.layers]
+        np.savez(path, config=json.dumps(config), **arrays)
+
+    def predict_on_batch(self, x):
+        """
+        Returns the output of the model for a batch of inputs.
+
+        Arguments
+        ---------
+        x: array-like
+            The inputs, of shape (batch, steps, features) if the first
+            layer is an LSTM layer.
+        """
+        x = np.asarray(x, dtype=np.float32)
+        for kind, config, weights in self.layers:
+            if kind == 'lstm':
+                x = self._lstm(x, config, weights)
+            else:
+                x = ACTIVATIONS[config['activation']](
+                    x @ weights['kernel'] + weights['bias'])
+        return x
+
+    @staticmethod
+    def _lstm(x, config, weights):
+        """
+        Run an LSTM layer over the sequences and return the last output.
+        The gates are ordered input, forget, cell, output, like in Keras.
+        """
+        activation = ACTIVATIONS[config['activation']]
+        recurrent_activation = ACTIVATIONS[config['recurrent_activation']]
+        kernel, recurrent_kernel = weights['kernel'], \
+            weights['recurrent_kernel']
+        units = recurrent_kernel.shape[0]
+
+        # The input contributions of all steps at once.
+        inputs = x @ kernel + weights['bias']
+        h = np.zeros((x.shape[0], units), dtype=np.float32)
+        c = np.zeros((x.shape[0], units), dtype=np.float32)
+        for step in range(x.shape[1]):
+            z = inputs[:, step] + h @ recurrent_kernel
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            g = activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * activation(c)
+        return h
+
+
+if __name__ == "__main__":
+    import os
+    import time
+
+    path = os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), "model", "t1-n=3.npz")
+    model = NumpyModel.load(path)
+    x = [[[0, 0], [1, 0], [2, 0]]]
+    print(model.predict_on_batch(x))
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        model.predict_on_batch(x)
+    print(f"{(time.perf_counter() - start):.3f} ms per prediction")
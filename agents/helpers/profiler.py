@@ -0,0 +1,238 @@
+import contextlib
+import csv
+import json
+import os
+import time
+
+
+# Number of histogram buckets. Bucket i holds the durations below 2**i
+# microseconds (and at least 2**(i-1)), the last bucket holds the rest.
+N_BUCKETS = 32
+
+
+class PhaseStats(object):
+    """
+    Duration statistics of a single phase: the number of calls, the total
+    and maximum duration and a histogram with power-of-two buckets.
+    """
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * N_BUCKETS
+
+    def add(self, seconds):
+        """
+        Add the duration of one call, in seconds.
+        """
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[min(bucket, N_BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """
+        Returns an upper bound of the given percentile (as a fraction) of
+        the durations in seconds, taken from the histogram.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(2 ** bucket / 1e6, self.max)
+        return self.max
+
+    def row(self):
+        """
+        Returns the statistics as a dictionary with durations in ms.
+        """
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total * 1000 / max(self.count, 1), 3),
+            'p50_ms': round(self.percentile(0.5) * 1000, 3),
+            'p95_ms': round(self.percentile(0.95) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Phase(object):
+    """
+    Context manager that adds the time spent inside it to a phase.
+    """
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StepProfiler(object):
+    """
+    Collects the time an agent spends in every phase of a step (receiving,
+    decoding, updating the beliefs, planning, sending, ...). Every
+    summary_every steps the statistics since the previous summary are
+    printed as a table and appended to <directory>/<name>.<format>.
+    """
+    enabled = True
+
+    def __init__(self, name, directory, summary_every=100,
+                 file_format='jsonl', print_summary=True):
+        """
+        Arguments
+        ---------
+        name: str
+            The name of the agent.
+        directory: str
+            The directory of the exported statistics.
+        summary_every: int
+            The number of steps between two summaries.
+        file_format: str
+            The format of the exported statistics, 'jsonl' or 'csv'.
+        print_summary: bool
+            If the summary table should be printed.
+        """
+        self.name = name
+        self.directory = directory
+        self.summary_every = summary_every
+        self.file_format = file_format
+        self.print_summary = print_summary
+        self.phases = {}
+        self.steps = 0
+        self.last_step = None
+        self._file = None
+        self._writer = None
+
+    def phase(self, name):
+        """
+        Returns a context manager which measures a phase with the given name.
+        """
+        return Phase(self, name)
+
+    def add(self, name, seconds):
+        """
+        Add a measured duration, in seconds, to a phase.
+        """
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = PhaseStats()
+        stats.add(seconds)
+
+    def end_step(self, step):
+        """
+        Count a finished step and export the statistics every summary_every
+        steps.
+
+        Arguments
+        ---------
+        step: int
+            The step of the simulation that finished.
+        """
+        self.steps += 1
+        self.last_step = step
+        if self.steps % self.summary_every == 0:
+            self.export(step)
+
+    def export(self, step):
+        """
+        Print and write the statistics since the previous export and start
+        new ones.
+
+        Arguments
+        ---------
+        step: int
+            The current step of the simulation.
+        """
+        if not self.phases:
+            return
+
+        rows = [dict(agent=self.name, step=step, phase=name, **stats.row())
+                for name, stats in sorted(self.phases.items())]
+        self.phases = {}
+        if self.print_summary:
+            print(self.format_table(rows))
+        self._write(rows)
+
+    @staticmethod
+    def format_table(rows):
+        """
+        Returns the rows of an export as a table.
+        """
+        header = f"{'phase':24}{'count':>7}{'mean ms':>10}{'p50 ms':>10}" \
+                 f"{'p95 ms':>10}{'max ms':>10}{'total ms':>11}"
+        lines = [f"{rows[0]['agent']} up to step {rows[0]['step']}", header]
+        for row in rows:
+            lines.append(f"{row['phase']:24}{row['count']:7d}"
+                         f"{row['mean_ms']:10.3f}{row['p50_ms']:10.3f}"
+                         f"{row['p95_ms']:10.3f}{row['max_ms']:10.3f}"
+                         f"{row['total_ms']:11.1f}")
+        return "\n".join(lines)
+
+    def _write(self, rows):
+        """
+        Append the rows to the file of the agent.
+        """
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory,
+                                f"{self.name}.{self.file_format}")
+            self._file = open(path, "w", newline="")
+            if self.file_format == 'csv':
+                self._writer = csv.DictWriter(self._file,
+                                              fieldnames=list(rows[0]))
+                self._writer.writeheader()
+
+        for row in rows:
+            if self._writer:
+                self._writer.writerow(row)
+            else:
+                self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def close(self):
+        """
+        Export the remaining statistics and close the file.
+        """
+        if self.phases:
+            self.export(self.last_step)
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+
+class NullProfiler(object):
+    """
+    Profiler used when profiling is disabled. All methods do nothing, so
+    the instrumentation only costs a method call.
+    """
+    enabled = False
+    _phase = contextlib.nullcontext()
+
+    def phase(self, name):
+        return self._phase
+
+    def add(self, name, seconds):
+        pass
+
+    def end_step(self, step):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
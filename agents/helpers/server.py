@@ -1,13 +1,136 @@
 import socket
 import json
+import os
+import time
+from collections import deque
 from threading import Thread
 
+from .profiler import StepProfiler, NULL_PROFILER
+
+
+class FrameReader(object):
+    """
+    Incremental reader for the NUL-terminated JSON messages of the server.
+    Bytes are received into a reusable chunk and kept in a buffer between
+    calls, so messages that arrive in the same read or are split over
+    multiple reads are all returned, in order.
+    """
+    def __init__(self, sock=None, chunk_size=65536):
+        """
+        Create the (reusable) receive buffers.
+
+        parameters
+        ----------
+        sock: socket.socket
+            The socket to read from. Can be None if the bytes are provided
+            through feed().
+        chunk_size: int
+            The maximum number of bytes received per recv call.
+        """
+        self.socket = sock
+        self.chunk_size = chunk_size
+        self._chunk = bytearray(chunk_size)
+        self._view = memoryview(self._chunk)
+        self._buffer = bytearray()
+        self._scanned = 0
+        self._frames = deque()
+        self.closed = False
+
+        # Statistics, both in total and since the last call to pop_stats.
+        self.bytes_read = 0
+        self.frames_read = 0
+        self._step_bytes = 0
+        self._step_frames = 0
+
+    def feed(self, data):
+        """
+        Add received bytes to the buffer and split off all complete frames.
+        Returns the number of new complete frames.
+
+        parameters
+        ----------
+        data: bytes, bytearray or memoryview
+            The received bytes.
+        """
+        self._buffer += data
+        self.bytes_read += len(data)
+        self._step_bytes += len(data)
+
+        # Only scan the bytes that have not been scanned before. Frames are
+        # copied once, through a view of the buffer, which is released
+        # before the buffer is resized.
+        start, n_frames = 0, 0
+        end = self._buffer.find(b'\0', self._scanned)
+        with memoryview(self._buffer) as view:
+            while end != -1:
+                self._frames.append(bytes(view[start:end]))
+                n_frames += 1
+                start = end + 1
+                end = self._buffer.find(b'\0', start)
+
+        # Drop all complete frames from the buffer at once.
+        if start:
+            del self._buffer[:start]
+        self._scanned = len(self._buffer)
+
+        self.frames_read += n_frames
+        self._step_frames += n_frames
+        return n_frames
+
+    def read_frame(self):
+        """
+        Return the next complete frame (without the NUL terminator) as bytes.
+        Blocks until a frame is available. Returns None if the connection
+        is closed.
+        """
+        while not self._frames:
+            n_bytes = self.socket.recv_into(self._view)
+            if not n_bytes:
+                self.closed = True
+                return None
+            self.feed(self._view[:n_bytes])
+
+        return self._frames.popleft()
+
+    def pending(self):
+        """
+        Return the number of complete frames that have not been read yet.
+        """
+        return len(self._frames)
+
+    def pop_stats(self):
+        """
+        Return the number of bytes and frames read since the previous call
+        as a tuple (bytes, frames) and reset the counters.
+        """
+        stats = (self._step_bytes, self._step_frames)
+        self._step_bytes, self._step_frames = 0, 0
+        return stats
+
 
 class Server(Thread):
     """
     Class used to connect, authorize, receive and send messages
     with/to the server
     """
+    # Connect and authorize while initialising. Disabled by agents that
+    # connect in another way, e.g. through asyncio streams.
+    connect_on_init = True
+
+    # The address of the MASSim server.
+    host, port = "localhost", 12300
+
+    # Directory in which every agent writes the messages it receives and the
+    # actions it sends to <record_dir>/<user>.jsonl. None disables recording.
+    record_dir = None
+
+    # Directory in which every agent writes the time spent in the phases of
+    # its steps to <profile_dir>/<user>.<profile_format>, every
+    # profile_every steps. None disables the profiler.
+    profile_dir = None
+    profile_every = 100
+    profile_format = 'jsonl'
+
     def __init__(self, user, pw='1', print_json=False):
         """
         Store some information about the agent and connect and authorize with
@@ -26,6 +149,13 @@ class Server(Thread):
         self._user = user
         self._pw = pw
         self._print_json = print_json
+        self._record_file = None
+        if self.profile_dir:
+            self.profiler = StepProfiler(user, self.profile_dir,
+                                         self.profile_every,
+                                         self.profile_format)
+        else:
+            self.profiler = NULL_PROFILER
         self._COLORS = ['\033[1;31m', '\033[1;32m', '\033[1;33m', '\033[1;34m',
                         '\033[1;35m', '\033[1;36m', '\033[1;37m', '\033[1;90m',
                         '\033[1;91m', '\033[1;92m', '\033[1;93m', '\033[1;94m',
@@ -38,13 +168,15 @@ class Server(Thread):
             self._user_id = int((user[-2] if user[-2].isdigit() else "") +
                                 user[-1])
             # Create, connect and authorize socket connection
-            self.connect_socket()
-            self.authorize_socket()
+            if self.connect_on_init:
+                self.connect_socket()
+                self.authorize_socket()
 
     def connect_socket(self):
         # Create socket object.
-        host, port = "localhost", 12300
+        host, port = self.host, self.port
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._reader = FrameReader(self.socket)
 
         # Connect to server.
         try:
@@ -58,7 +190,17 @@ class Server(Thread):
         """
         Authorize socket by sending auth-request to server
         """
-        auth_request = {
+        # Create and send authentication request.
+        self.send_request(self._auth_request())
+
+        # Parse response.
+        self._check_auth_response(self.receive_msg())
+
+    def _auth_request(self):
+        """
+        Returns the auth-request of the agent.
+        """
+        return {
             "type": "auth-request",
             "content": {
                 "user": self._user,
@@ -66,13 +208,16 @@ class Server(Thread):
             }
         }
 
-        # Create and send authentication request.
-        self.send_request(auth_request)
-
-        # Parse response.
-        response = self.receive_msg()
+    def _check_auth_response(self, response):
+        """
+        Prints if the authentication succeeded.
 
-        if response["content"]["result"] == "ok":
+        parameters
+        ----------
+        response: dict
+            The auth-response of the server.
+        """
+        if response and response["content"]["result"] == "ok":
             self.pretty_print("connection succesful")
         else:
             self.pretty_print("connection failed")
@@ -83,11 +228,36 @@ class Server(Thread):
         """
         if self.socket:
             self.socket.close()
+        self.close_record()
+        self.profiler.close()
 
     def send_request(self, request):
         """
         Takes request as input and sends binary-encoded json block to server.
 
+        parameters
+        ----------
+        request: dict
+            The request to send to the server.
+        """
+        # Send the request to the server.
+        with self.profiler.phase('send_request'):
+            self.socket.sendall(self._encode_request(request))
+
+    def receive_msg(self):
+        """
+        Returns message from server, if no message is received return None.
+        The time spent in receiving includes waiting for the server.
+        """
+        with self.profiler.phase('receive_msg'):
+            frame = self._reader.read_frame()
+        return self._decode_msg(frame)
+
+    def _encode_request(self, request):
+        """
+        Prints the request if required and returns it as a NUL-terminated
+        binary-encoded json block.
+
         parameters
         ----------
         request: dict
@@ -103,14 +273,29 @@ class Server(Thread):
         if self._print_json:
             print(request)
 
-        # Send the request to the server.
-        self.socket.sendall((json.dumps(request) + "\0").encode())
+        msg = json.dumps(request)
 
-    def receive_msg(self):
+        # Do not record the password.
+        if request['type'] != "auth-request":
+            self._record("out", msg)
+
+        return (msg + "\0").encode()
+
+    def _decode_msg(self, frame):
         """
-        Returns message from server, if no message is received return None
+        Returns the message in the given frame as a dictionary, or None if
+        the frame does not contain a message.
+
+        parameters
+        ----------
+        frame: bytes
+            A frame as returned by the FrameReader (None if the connection
+            was closed).
         """
-        msg = self.socket.recv(65536).decode().split("\0")[0]
+        if frame is None:
+            return None
+        msg = frame.decode()
+        self._record("in", msg)
 
         # In case a message is received, parse it into a dictionary.
         if len(msg) > 1:
@@ -118,10 +303,50 @@ class Server(Thread):
                 # print(json.loads(msg))
                 print(json.dumps(json.loads(msg), indent=2))
 
-            return json.loads(msg)
+            with self.profiler.phase('decode'):
+                return json.loads(msg)
         else:
             return None
 
+    def _record(self, direction, msg):
+        """
+        Append a message to the record of the agent, if recording is
+        enabled. Every line holds the local time in ms, the direction and
+        the message.
+
+        parameters
+        ----------
+        direction: str
+            "in" for received messages, "out" for sent requests.
+        msg: str
+            The json-encoded message.
+        """
+        if not self.record_dir or len(msg) <= 1:
+            return
+
+        if self._record_file is None:
+            os.makedirs(self.record_dir, exist_ok=True)
+            self._record_file = open(os.path.join(self.record_dir,
+                                                  f"{self._user}.jsonl"), "w")
+
+        self._record_file.write(f'{{"t":{int(time.time() * 1000)},'
+                                f'"dir":"{direction}","msg":{msg}}}\n')
+
+    def close_record(self):
+        """
+        Close the record of the agent, if any.
+        """
+        if self._record_file:
+            self._record_file.close()
+            self._record_file = None
+
+    def read_stats(self):
+        """
+        Returns the number of bytes and frames received from the server
+        since the previous call as a tuple (bytes, frames).
+        """
+        return self._reader.pop_stats()
+
     def pretty_print(self, msg, request_id=""):
         """
         Prints a well formatted message including the agent
@@ -0,0 +1,130 @@
+from collections import namedtuple
+import time
+
+from .agent import DeadlineExceeded
+
+
+# A planned route: the total path cost, the taskboard (or None), the
+# dispensers as (block type, location) in the order they are visited and
+# the goal (or None).
+Tour = namedtuple('Tour', ['cost', 'taskboard', 'dispensers', 'goal'])
+
+
+class TourPlanner(object):
+    """
+    Plans the route of a builder past a taskboard, one dispenser of every
+    required block type and a goal, in that order. The costs are the path
+    costs of the distance fields of the beliefs (which wrap around the map
+    when its dimensions are known), so obstacles are taken into account.
+
+    The taskboard and the dispensers are chosen and the dispensers ordered
+    by dynamic programming over the subsets of block types. The nearest
+    goal from the last dispenser is found with a single field that has all
+    goals as sources. Plans are remembered until the step or the terrain of
+    the beliefs changes. The fields are kept by the beliefs, so planning
+    again in a later step and navigating to the stops reuse them.
+    """
+    # The number of dispensers per block type and of taskboards considered,
+    # the nearest by Manhattan distance. Every candidate costs a distance
+    # field.
+    max_candidates = 4
+
+    def __init__(self):
+        self._beliefs = None
+        self._key = None
+        self._plans = {}
+
+    def plan(self, beliefs, start, taskboards=(), dispensers=None,
+             goals=(), deadline=None):
+        """
+        Returns the cheapest Tour from the start, or None if a stage has no
+        reachable candidate. Stages without candidates are skipped, e.g.
+        without taskboards the tour starts at the dispensers. Raises
+        DeadlineExceeded if the deadline passed before the tour was planned,
+        the next call continues the search where it stopped.
+
+        Arguments
+        ---------
+        beliefs: Graph
+            The beliefs of the agent.
+        start: (int, int)
+            The current location of the agent.
+        taskboards: list of (int, int)
+            The known taskboards, one of which is visited first.
+        dispensers: dict
+            The known dispensers by block type, for every required type.
+        goals: list of (int, int)
+            The known goal cells, the nearest of which ends the tour.
+        deadline: float
+            The local time in seconds at which planning is stopped.
+        """
+        dispensers = dispensers or {}
+        key = (beliefs.step, beliefs.version)
+        if beliefs is not self._beliefs or key != self._key:
+            self._beliefs, self._key, self._plans = beliefs, key, {}
+
+        query = (start, tuple(taskboards),
+                 tuple((block_type, tuple(locations)) for block_type,
+                       locations in sorted(dispensers.items())),
+                 tuple(goals))
+        if query not in self._plans:
+            self._plans[query] = self._plan(beliefs, start, taskboards,
+                                            dispensers, goals, deadline)
+        return self._plans[query]
+
+    def _plan(self, beliefs, start, taskboards, dispensers, goals, deadline):
+        def cost(location, stop):
+            # Cost of the cheapest path from the location to the stop.
+            field = beliefs.get_distance_field(stop)
+            distance = field.distance(location, deadline)
+            if deadline and time.time() > deadline:
+                raise DeadlineExceeded()
+            return distance
+
+        # The partial tours by the visited block types (as a bit mask) and
+        # the current location, as (cost, taskboard, dispensers).
+        tours = {}
+        for taskboard in self._nearest(start, taskboards) or [None]:
+            location = taskboard or start
+            tour = (cost(start, location) if taskboard else 0, taskboard, ())
+            if tour[0] < tours.get((0, location), (float('inf'),))[0]:
+                tours[(0, location)] = tour
+
+        block_types = sorted(dispensers)
+        candidates = [self._nearest(start, dispensers[block_type])
+                      for block_type in block_types]
+        for _ in block_types:
+            extended = {}
+            for (visited, location), (total, taskboard, route) in \
+                    tours.items():
+                for i, block_type in enumerate(block_types):
+                    if visited & (1 << i):
+                        continue
+                    for dispenser in candidates[i]:
+                        state = (visited | (1 << i), dispenser)
+                        tour = (total + cost(location, dispenser), taskboard,
+                                route + ((block_type, dispenser),))
+                        if tour[0] < extended.get(state,
+                                                  (float('inf'),))[0]:
+                            extended[state] = tour
+            tours = extended
+
+        best = None
+        for (_, location), (total, taskboard, route) in tours.items():
+            goal = None
+            if goals:
+                total += cost(location, goals)
+                goal = beliefs.get_distance_field(goals).nearest_goal(
+                    location)
+            if total < float('inf') and (best is None or total < best.cost):
+                best = Tour(total, taskboard, list(route), goal)
+        return best
+
+    def _nearest(self, start, locations):
+        """
+        Returns the max_candidates locations nearest to the start by
+        Manhattan distance.
+        """
+        return sorted(locations, key=lambda location:
+                      abs(location[0] - start[0]) +
+                      abs(location[1] - start[1]))[:self.max_candidates]
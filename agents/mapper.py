@@ -1,11 +1,8 @@
-from .helpers import Agent
+from .role import Role
 import random
 
 
-class Mapper(Agent):
-    def __init__(self, user, pw, print_json=False):
-        Agent.__init__(self, user, pw, print_json)
-
+class Mapper(Role):
     def get_intention(self):
         """
         Gets intentions of this type of agent.
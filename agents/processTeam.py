@@ -0,0 +1,522 @@
+from . import asyncTeam
+from .strategist import Strategist
+from .helpers import Agent
+from .helpers import Server
+from .helpers.graph import merge_graphs
+from .helpers.modelService import ModelService
+
+from collections import deque
+from queue import Empty
+from queue import Queue
+import asyncio
+import multiprocessing
+import pickle
+
+
+class ShardAgent(asyncTeam.AsyncSuperAgent):
+    """
+    Agent of a worker process, which keeps its latest request-action message
+    so the strategist of the worker can share it with the other workers.
+    """
+    percept = None
+
+    def update_beliefs(self, msg):
+        super().update_beliefs(msg)
+        self.percept = msg
+
+
+class ShardStrategist(Strategist):
+    """
+    Strategist of a single worker process. The agents are not identified
+    here but by the strategist of the hub in the main process, which sees
+    the observations of the agents of all workers. This strategist sends the
+    percept and local observation of its agents to the hub, and carries out
+    the merges and dimensions the hub decides on.
+
+    A graph of a group with agents in multiple workers is kept by each of
+    these workers, which update it with the percepts of the agents of the
+    other workers forwarded by the hub.
+    """
+    # Maximum number of percepts kept of an agent of another worker whose
+    # graph has not arrived yet.
+    max_remote_percepts = 16
+
+    def __init__(self, worker_id, inbox, outbox, print_json=False):
+        """
+        Arguments
+        ---------
+        worker_id: int
+            The index of the worker process.
+        inbox: multiprocessing.Queue
+            Queue with messages from the hub to this worker.
+        outbox: multiprocessing.Queue
+            Queue with messages from all workers to the hub.
+        print_json: bool
+            If the communication jsons should be printed.
+        """
+        super().__init__("Strategist", [Queue(), Queue()], print_json)
+        self.worker_id = worker_id
+        self.inbox = inbox
+        self.outbox = outbox
+
+        # The merges ordered by the hub as (merge id, large root, small
+        # root, translation), which are carried out in order, and the
+        # graphs they need from other workers by (merge id, root).
+        self.merges = deque()
+        self.shipments = {}
+
+        # Percepts of agents of other workers whose graph is not in this
+        # worker yet, by agent id.
+        self.remote_percepts = {}
+
+        # The dimensions of the map received from the hub.
+        self.width = None
+        self.height = None
+
+    def merge(self, agent):
+        """
+        Apply the messages of the hub and send the percept and local
+        observation of the agent to the hub. The location of the agent is
+        in the coordinates of the root of its group in this worker, which
+        is sent along.
+        """
+        self.poll_hub()
+        user_id = agent._user_id
+        local_agents, cells = agent.beliefs.get_local_observation(user_id)
+        self.outbox.put(('step', self.worker_id,
+                         (agent.name, user_id, agent.percept,
+                          self.locate(agent), self.groups.find(user_id)[0],
+                          local_agents, cells, len(agent.beliefs.nodes))))
+
+    def poll_hub(self):
+        """
+        Apply all messages received from the hub without waiting.
+        """
+        while True:
+            try:
+                task, payload = self.inbox.get_nowait()
+            except Empty:
+                break
+
+            if task == 'dimensions':
+                width, height = payload
+                self.width = self.width or width
+                self.height = self.height or height
+                self.apply_dimensions(width=width, height=height)
+            elif task == 'percept':
+                self.update_remote(*payload)
+            elif task == 'send_graph':
+                merge_id, root, targets = payload
+                self.outbox.put(('graph', self.worker_id,
+                                 (merge_id, root,
+                                  pickle.dumps(self.find_graph(root)),
+                                  targets)))
+            elif task == 'graph':
+                merge_id, root, data = payload
+                self.shipments[(merge_id, root)] = pickle.loads(data)
+            elif task == 'merge':
+                self.merges.append(payload)
+
+        self.execute_merges()
+
+    def find_graph(self, agent_id):
+        """
+        Returns the graph in this worker that contains the agent, None if
+        there is none.
+
+        Arguments
+        ---------
+        agent_id: int
+            The id of the agent, which may play in another worker.
+        """
+        for agent in self.get_agents():
+            if agent_id in agent.beliefs.current:
+                return agent.beliefs
+        return None
+
+    def update_remote(self, agent_id, msg):
+        """
+        Update the graph of the agent of another worker with its percept.
+        The percept is kept until the graph arrives if it is not in this
+        worker yet.
+
+        Arguments
+        ---------
+        agent_id: int
+            The id of the agent of the other worker.
+        msg: dict
+            The request-action message of the agent.
+        """
+        graph = self.find_graph(agent_id)
+        if graph:
+            graph.update_remote(msg, agent_id)
+        else:
+            self.remote_percepts.setdefault(
+                agent_id, deque(maxlen=self.max_remote_percepts)).append(msg)
+
+    def execute_merges(self):
+        """
+        Carry out the merges ordered by the hub, in order, until a merge
+        waits for a graph of another worker. The agents of the folded group
+        use the merged graph, and the hub is told the merge is done.
+        """
+        while self.merges:
+            merge_id, large, small, translation = self.merges[0]
+            graphs = [self.shipments.get((merge_id, root)) or
+                      self.find_graph(root) for root in (large, small)]
+            if None in graphs:
+                return
+            self.merges.popleft()
+            for root in (large, small):
+                self.shipments.pop((merge_id, root), None)
+
+            large_graph, small_graph = graphs
+            new_graph = merge_graphs(large_graph, large, small_graph, small,
+                                     None, translation=translation)
+
+            # A graph of another worker may have been sent before the
+            # dimensions arrived there.
+            if (self.width and not new_graph.width) or \
+                    (self.height and not new_graph.height):
+                new_graph.width = new_graph.width or self.width
+                new_graph.height = new_graph.height or self.height
+                new_graph.apply_dimensions_to_graph()
+            self.groups.union(large, small, translation)
+            for agent in self.get_agents():
+                if agent.beliefs is small_graph or \
+                        agent.beliefs is large_graph:
+                    agent.beliefs = new_graph
+
+            for agent_id in list(self.remote_percepts):
+                if agent_id in new_graph.current:
+                    for msg in self.remote_percepts.pop(agent_id):
+                        new_graph.update_remote(msg, agent_id)
+
+            self.outbox.put(('merged', self.worker_id, merge_id))
+
+
+class AgentProxy(object):
+    """
+    Stands in for an agent of a worker process in the strategist of the
+    hub.
+    """
+    def __init__(self, name, user_id, worker_id):
+        """
+        Arguments
+        ---------
+        name: str
+            The name of the agent.
+        user_id: int
+            The id of the agent.
+        worker_id: int
+            The index of the worker process the agent plays in.
+        """
+        self.name = name
+        self._user = name
+        self._user_id = user_id
+        self.worker_id = worker_id
+
+        # The root of the group whose coordinates the latest observation of
+        # the agent uses, and the number of nodes of the graph of the agent.
+        self.coordinates = user_id
+        self.n_nodes = 0
+
+
+class HubStrategist(Strategist):
+    """
+    Strategist of the hub in the main process, which identifies the agents
+    of all workers with the observations the workers send. It orders the
+    workers that keep the graphs of two groups to merge them, after the
+    graph of each group is sent to the workers that do not have it. Only
+    one merge is carried out at a time, until all these workers are done.
+    """
+    def __init__(self, inboxes, print_json=False):
+        """
+        Arguments
+        ---------
+        inboxes: dict
+            The queue with messages from the hub to a worker, by the index
+            of the worker.
+        print_json: bool
+            If the communication jsons should be printed.
+        """
+        super().__init__("Strategist", [Queue(), Queue()], print_json)
+        self.inboxes = inboxes
+        self.width = None
+        self.height = None
+
+        # The workers that did not finish a merge yet, by merge id.
+        self.merging = {}
+        self.n_merges = 0
+
+    def receive_step(self, worker_id, name, user_id, msg, location,
+                     coordinates, local_agents, cells, n_nodes):
+        """
+        Store the observation of an agent of a worker, forward its percept
+        to the other workers that keep the graph of its group, and identify
+        the agents it sees.
+
+        Arguments
+        ---------
+        worker_id: int
+            The index of the worker process of the agent.
+        name: str
+            The name of the agent.
+        user_id: int
+            The id of the agent.
+        msg: dict
+            The request-action message of the agent.
+        location: (int, int)
+            The location of the agent in its graph.
+        coordinates: int
+            The root of the group whose coordinates the graph uses.
+        local_agents: list of tuples
+            The relative locations of the agents the agent sees.
+        cells: dict
+            The terrain and things the agent sees by relative location.
+        n_nodes: int
+            The number of nodes of the graph of the agent.
+        """
+        if name not in self.agents:
+            self.register(AgentProxy(name, user_id, worker_id))
+        agent = self.agents[name]
+        agent.coordinates, agent.n_nodes = coordinates, n_nodes
+        self.store_observation(name, (msg['content']['step'], location),
+                               local_agents, cells)
+
+        for other in self.get_workers(user_id) - {worker_id}:
+            self.inboxes[other].put(('percept', (user_id, msg)))
+
+        self.merge(agent)
+
+    def receive_merged(self, worker_id, merge_id):
+        """
+        Register that the worker finished the merge.
+        """
+        if merge_id in self.merging:
+            self.merging[merge_id].discard(worker_id)
+            if not self.merging[merge_id]:
+                del self.merging[merge_id]
+
+    def remove_worker(self, worker_id):
+        """
+        Stop waiting for a worker that stopped, to finish its merges.
+        """
+        for merge_id in list(self.merging):
+            self.receive_merged(worker_id, merge_id)
+
+    def get_workers(self, agent_id):
+        """
+        Returns the workers that keep the graph of the group of the agent.
+        """
+        return {self.agents[name].worker_id
+                for name in self.agents
+                if self.groups.same(agent_id, self.agents[name]._user_id)}
+
+    def observe(self, agent):
+        """
+        Returns the latest observation the worker of the agent sent.
+        """
+        return self.observations[agent.name]
+
+    def merge_agent_graphs(self, main_agent, potential_agents):
+        """
+        Identify the agents observed in the same step as the main agent.
+        The other workers may not have sent the observations of this step
+        yet, the agents are identified again when they did.
+        """
+        step = self.observations[main_agent.name][0][0]
+        for location, agents in potential_agents.items():
+            if any(self.observations[agent.name][0][0] != step
+                   for agent in agents):
+                potential_agents[location] = []
+        super().merge_agent_graphs(main_agent, potential_agents)
+
+    def fold_graphs(self, main_agent, agent, location):
+        """
+        Order the workers to fold the graph of the smaller group into the
+        graph of the larger group, unless a merge is still going on.
+        """
+        if self.merging:
+            return
+        if main_agent.n_nodes >= agent.n_nodes:
+            large, small, offset = main_agent, agent, location
+        else:
+            large, small, offset = agent, main_agent, \
+                (-location[0], -location[1])
+
+        large_x, large_y = self.locate(large)
+        small_x, small_y = self.locate(small)
+        translation = (large_x + offset[0] - small_x,
+                       large_y + offset[1] - small_y)
+
+        merge_id = self.n_merges
+        self.n_merges += 1
+        large_root = self.groups.find(large._user_id)[0]
+        small_root = self.groups.find(small._user_id)[0]
+        large_workers = self.get_workers(large._user_id)
+        small_workers = self.get_workers(small._user_id)
+
+        # The graph of each group is sent by one of its workers, before it
+        # merges itself.
+        for workers, root, targets in (
+                (large_workers, large_root, small_workers - large_workers),
+                (small_workers, small_root, large_workers - small_workers)):
+            if targets:
+                self.inboxes[min(workers)].put(
+                    ('send_graph', (merge_id, root, sorted(targets))))
+
+        self.merging[merge_id] = large_workers | small_workers
+        for worker_id in self.merging[merge_id]:
+            self.inboxes[worker_id].put(
+                ('merge', (merge_id, large_root, small_root, translation)))
+
+        self.groups.union(large._user_id, small._user_id, translation)
+        print(f'{small._user} merged with {large._user} '
+              f'({small.n_nodes} into {large.n_nodes} nodes, worker '
+              f'{small.worker_id} into {large.worker_id})')
+
+    def locate(self, agent):
+        """
+        Returns the location of the latest observation of the agent in the
+        coordinates of its group.
+        """
+        (_, location), _, _ = self.observations[agent.name]
+        root = self.groups.find(agent._user_id)[0]
+        x, y = self.groups.translate(location, agent.coordinates, root)
+        return (x % self.width if self.width else x,
+                y % self.height if self.height else y)
+
+    def get_dimensions(self, agent):
+        """
+        Returns the dimensions known to the hub, which are those of all
+        graphs once the workers applied them.
+        """
+        return self.width, self.height
+
+    def apply_dimensions(self, width=0, height=0):
+        """
+        Send the dimensions that were not known yet to all workers.
+        """
+        width = width if not self.width else 0
+        height = height if not self.height else 0
+        if not width and not height:
+            return
+        self.width = self.width or width
+        self.height = self.height or height
+        for inbox in self.inboxes.values():
+            inbox.put(('dimensions', (width, height)))
+
+
+# Class attributes of the Server that configure recording and profiling.
+SERVER_SETTINGS = ('record_dir', 'profile_dir', 'profile_every',
+                   'profile_format')
+
+# Seconds the hub waits for a message before it checks whether the workers
+# are still alive.
+HUB_POLL_INTERVAL = 1.0
+
+
+def _run_worker(worker_id, names, pw, inbox, outbox, belief_class,
+                server_settings, model_backend):
+    """
+    Entry point of a worker process, runs the given agents in an event loop.
+    """
+    try:
+        # Class attributes are not inherited by spawned processes.
+        Agent.belief_class = belief_class
+        for setting, value in server_settings.items():
+            setattr(Server, setting, value)
+        ModelService.backend = model_backend
+        strategist = ShardStrategist(worker_id, inbox, outbox)
+        asyncio.run(asyncTeam.run_team(names, pw, strategist=strategist,
+                                       agent_class=ShardAgent))
+    finally:
+        outbox.put(('done', worker_id, None))
+
+
+def shard(names, n_workers):
+    """
+    Split the names into (at most) n_workers contiguous shards of almost
+    equal size.
+
+    Arguments
+    ---------
+    names: list of str
+        The usernames of the agents.
+    n_workers: int
+        The number of worker processes.
+    """
+    n_workers = max(1, min(n_workers, len(names)))
+    size, rest = divmod(len(names), n_workers)
+    shards, start = [], 0
+    for i in range(n_workers):
+        end = start + size + (1 if i < rest else 0)
+        shards.append(names[start:end])
+        start = end
+    return shards
+
+
+def run_team(names, n_workers, pw="1"):
+    """
+    Run the agents with the given names in n_workers processes. The main
+    process acts as hub: its strategist identifies the agents of all
+    workers and orders the merges, and it forwards the percepts, graphs and
+    dimensions between the workers, until all workers are done or stopped.
+
+    Arguments
+    ---------
+    names: list of str
+        The usernames of the agents.
+    n_workers: int
+        The number of worker processes.
+    pw: str
+        The password of the agents.
+    """
+    # Spawn instead of fork, TensorFlow does not survive a fork.
+    context = multiprocessing.get_context("spawn")
+    outbox = context.Queue()
+    workers = {}
+    for worker_id, names_shard in enumerate(shard(names, n_workers)):
+        inbox = context.Queue()
+        process = context.Process(target=_run_worker,
+                                  args=(worker_id, names_shard, pw,
+                                        inbox, outbox, Agent.belief_class,
+                                        {setting: getattr(Server, setting)
+                                         for setting in SERVER_SETTINGS},
+                                        ModelService.backend),
+                                  name=f"Worker{worker_id}")
+        process.start()
+        workers[worker_id] = (process, inbox)
+        print(f'Worker {worker_id} runs {", ".join(names_shard)}')
+
+    strategist = HubStrategist({worker_id: inbox for worker_id, (_, inbox)
+                                in workers.items()})
+    done = set()
+    while len(done) < len(workers):
+        try:
+            task, worker_id, payload = outbox.get(timeout=HUB_POLL_INTERVAL)
+        except Empty:
+            # A worker that was killed can not say it is done.
+            for worker_id, (process, _) in workers.items():
+                if worker_id not in done and not process.is_alive():
+                    print(f'Worker {worker_id} stopped with exit code '
+                          f'{process.exitcode}')
+                    done.add(worker_id)
+                    strategist.remove_worker(worker_id)
+            continue
+
+        if task == 'step':
+            strategist.receive_step(worker_id, *payload)
+        elif task == 'graph':
+            merge_id, root, data, targets = payload
+            for target in targets:
+                workers[target][1].put(('graph', (merge_id, root, data)))
+        elif task == 'merged':
+            strategist.receive_merged(worker_id, payload)
+        elif task == 'done':
+            done.add(worker_id)
+            strategist.remove_worker(worker_id)
+
+    for process, _ in workers.values():
+        process.join()
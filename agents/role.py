@@ -0,0 +1,60 @@
+import importlib
+
+
+# The roles an agent can play by name, as (module, class). A module is only
+# imported when its role is first assigned.
+ROLES = {
+    'attacker': ('.attacker', 'Attacker'),
+    'builder': ('.builder', 'Builder'),
+    'defender': ('.defender', 'Defender'),
+    'mapper': ('.mapper', 'Mapper'),
+    'spy': ('.spy', 'Spy'),
+}
+
+
+def load_role(name):
+    """
+    Returns the class of the role with the given name.
+
+    Arguments
+    ---------
+    name: str
+        The name of the role, one of ROLES.
+    """
+    if name not in ROLES:
+        raise ValueError(f"Unknown role {name!r}, expected one of "
+                         f"{', '.join(ROLES)}")
+    module, cls = ROLES[name]
+    return getattr(importlib.import_module(module, __package__), cls)
+
+
+class Role(object):
+    """
+    The behaviour of an agent in the team. An agent plays one role at a
+    time and the strategist can assign another role while playing.
+
+    The role object only holds the state of the role, all other attributes
+    (the beliefs, the actions, the user id, ...) are those of the agent, so
+    the methods of a role are written like methods of the agent.
+    """
+    def __init__(self, agent):
+        """
+        Arguments
+        ---------
+        agent: SuperAgent
+            The agent that plays the role.
+        """
+        self.agent = agent
+
+    def __getattr__(self, name):
+        # Only called for attributes the role itself does not have.
+        if name == 'agent':
+            raise AttributeError(name)
+        return getattr(self.agent, name)
+
+    def get_intention(self):
+        """
+        Returns the intentions of the role as (intentions, args, contexts,
+        descriptions, primitives), or None if it has nothing to do.
+        """
+        return None
@@ -1,7 +1,7 @@
-from .helpers import Agent
+from .role import Role
 
 
-class Spy(Agent):
+class Spy(Role):
 
     def get_intention(self):
         """
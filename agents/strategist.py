@@ -1,7 +1,12 @@
 from .helpers import Server
 from .helpers.graph import Graph
 from .helpers.graph import merge_graphs
+from .helpers.graph import VISION_OFFSETS
+from .helpers.groups import BeliefGroups
+from .role import ROLES
 
+from contextlib import contextmanager
+from functools import lru_cache
 from queue import Queue
 import threading
 
@@ -11,7 +16,7 @@ class Strategist(Server):
     The strategist agent uses game information to decide which agent plays
     what role.
     """
-    def __init__(self, user, queue, print_json=False):
+    def __init__(self, user, queue, print_json=False, team_size=None):
         """
         Initialize the stratagist as a child of the server. Add an input_queue,
         which is used for task from the agents to the strategist, and an
@@ -25,57 +30,130 @@ class Strategist(Server):
         pw: str
             The password of the agent.
         queue: (Queue, Queue)
-            A tuple containing both the input and output queue. The size of
-            both queues is equal the the number of agents playing.
+            A tuple containing both the input and output queue.
         print_json: bool
             If the communication jsons should be printed.
+        team_size: int
+            The number of agents playing. If given, the agents wait for each
+            other on a barrier after updating their beliefs.
         """
         super().__init__(user, print_json)
         self.input_queue = queue[0]
         self.output_queue = queue[1]
+        self.agents = {}
+
+        # The latest local observation of every agent by name, as a tuple
+        # ((step, location), local agents, cells), and the names of the
+        # agents that see an agent at a relative location.
+        self.observations = {}
+        self.seen_index = {}
+
+        # The groups of agents that share their beliefs.
+        self.groups = BeliefGroups()
+
+        # Merges are done in the strategist thread while the agents act. The
+        # graph of every group has a lock, which the agents and the
+        # strategist hold to access it, by the ids of the agents of the
+        # group.
+        self.locks = {}
+        self.barrier = StepBarrier(team_size) if team_size else None
         print(f'\033[1;34m{self._user}\033[0;0m running')
 
     def run(self):
         """
-        The function that runs the strategist.
+        The function that runs the strategist. Blocks until an agent sends a
+        task.
         """
-        lock = threading.Lock()
         while True:
-            task = self.peek_queue()
-            if task == 'update':
-                if self.input_queue.full():
-                    print(f'Number of graphs: {self.get_number_graphs()}')
-                    x = self.get_agent(1).beliefs
-                    print(f'Width: {x.width}\nHeight: {x.height}')
-                    while not self.input_queue.empty():
-                        task, agent = self.input_queue.get()
-                        self.input_queue.task_done()
+            task, agent = self.input_queue.get()
+            if task == 'merge':
+                self.merge(agent)
 
             elif task == 'print':
                 print(agent.name)
-                self.input_queue.task_done()
 
-            elif task == 'merge':
-                task, agent = self.input_queue.get()
-                potential_agents = self.identifying_agents(agent)
-                self.merge_agent_graphs(agent, potential_agents)
-                self.input_queue.task_done()
+            self.input_queue.task_done()
 
-    def peek_queue(self):
+    def register(self, agent):
         """
-        Identify task and return item to queue. Returns the task as a str.
+        Register an agent with the strategist. Registered agents are used
+        instead of the running threads, e.g. when the agents are not threads
+        but run in an event loop.
+
+        Arguments
+        ---------
+        agent: SuperAgent
+            The agent to register.
         """
-        if not self.input_queue.empty():
-            task, agent = self.input_queue.get()
-            self.input_queue.task_done()
-            self.input_queue.put((task, agent))
-            return task
-        return ''
+        self.agents[agent.name] = agent
+
+    def merge(self, agent):
+        """
+        Identify the agents in the vision of the given agent and merge their
+        graphs with the graph of the agent.
+
+        Arguments
+        ---------
+        agent: SuperAgent
+            The agent whose beliefs have been updated.
+        """
+        potential_agents = self.identifying_agents(agent)
+        self.merge_agent_graphs(agent, potential_agents)
+
+    def observe(self, agent):
+        """
+        Store the local observation of the agent in the current step and
+        index the agent by the relative locations of the agents it sees.
+        The observation is only computed once per step.
+
+        Arguments
+        ---------
+        agent: SuperAgent
+            The agent whose beliefs have been updated.
+        """
+        with self.lock_groups(agent):
+            key = (agent.beliefs.get_step(),
+                   agent.beliefs.get_current(agent._user_id).location)
+            if agent.name in self.observations and \
+                    self.observations[agent.name][0] == key:
+                return self.observations[agent.name]
+
+            local_agents, cells = agent.beliefs.\
+                get_local_observation(agent._user_id)
+        return self.store_observation(agent.name, key, local_agents, cells)
+
+    def store_observation(self, name, key, local_agents, cells):
+        """
+        Store a local observation of an agent, which replaces its previous
+        observation, and index it by the relative locations of the agents
+        it sees. Returns the observation.
+
+        Arguments
+        ---------
+        name: str
+            The name of the agent.
+        key: (int, (int, int))
+            The step and the location of the agent.
+        local_agents: list of tuples
+            The relative locations of the agents the agent sees.
+        cells: dict
+            The terrain and things by relative location.
+        """
+        if name in self.observations:
+            for location in self.observations[name][1]:
+                self.seen_index[location].discard(name)
+
+        self.observations[name] = (key, local_agents, cells)
+        for location in local_agents:
+            self.seen_index.setdefault(location, set()).add(name)
+        return self.observations[name]
 
     def identifying_agents(self, main_agent, agent_name=False):
         """
         Determine the identities of the agents in the main agent's local
-        vision.
+        vision. An agent seen at a location is a candidate if it sees an
+        agent at the opposite location, which is looked up in the index of
+        observations.
 
         Arguments
         ---------
@@ -85,20 +163,20 @@ class Strategist(Server):
             If True, the agent IDs are returned in potential agents instead
             of the agent objects.
         """
+        # Observations are only computed again after an agent moved or a
+        # step passed.
+        agents = {agent.name: agent for agent in self.get_agents()}
+        for agent in agents.values():
+            self.observe(agent)
+
         potential_agents = {}
-        main_local_agents = main_agent.beliefs.\
-            get_local_agent_locations(main_agent._user_id)
-
-        for agent in self.get_agents(main_agent.name):
-            local_agents = [(-x, -y) for (x, y) in
-                            agent.beliefs.
-                            get_local_agent_locations(agent._user_id)]
-            for location in main_local_agents:
-                if location in local_agents:
-                    if location in potential_agents.keys():
-                        potential_agents[location].append(agent)
-                    else:
-                        potential_agents[location] = [agent]
+        _, main_local_agents, _ = self.observe(main_agent)
+        for location in main_local_agents:
+            for name in self.seen_index.get((-location[0], -location[1]),
+                                            ()):
+                if name != main_agent.name and name in agents:
+                    potential_agents.setdefault(location, []).\
+                        append(agents[name])
 
         potential_agents = self.eliminate_agents(main_agent, potential_agents)
         if agent_name:
@@ -109,8 +187,9 @@ class Strategist(Server):
 
     def eliminate_agents(self, main_agent, potential_agents):
         """
-        Eliminate potential agents based on the information their intersecting
-        nodes hold.
+        Eliminate potential agents based on the terrain and things they
+        observe in the part of their vision that overlaps with the vision
+        of the main agent.
 
         Arguments
         ---------
@@ -120,39 +199,28 @@ class Strategist(Server):
             A dictionary where each key is a location and each value is a list
             containing potential agents in that location.
         """
-        main_local_nodes = main_agent.beliefs.\
-            get_local_node_locations(main_agent._user_id, offset=(0, 0))
-        main_current_node = main_agent.beliefs.get_current(main_agent.
-                                                           _user_id).location
-        for location in potential_agents:
-            new_list = potential_agents[location][:]
-            intersect = [(x + location[0], y + location[1]) for (x, y) in
-                         main_local_nodes if (x + location[0], y + location[1])
-                         in main_local_nodes]
-
-            for agent in potential_agents[location]:
-                agent_current_node = agent.beliefs.\
-                    get_current(agent._user_id).location
-                for node in intersect:
-                    # node + current location
-                    main_agent_node = (node[0] + main_current_node[0],
-                                       node[1] + main_current_node[1])
-
-                    # node - location + current location
-                    agent_node = (node[0]-location[0] + agent_current_node[0],
-                                  node[1]-location[1] + agent_current_node[1])
-
-                    if not self._compare_nodes(main_agent.beliefs.
-                                               nodes[main_agent_node],
-                                               agent.beliefs.nodes[agent_node],
-                                               main_agent.beliefs.get_step()):
-                        new_list.remove(agent)
-                        break
-
-            potential_agents[location] = new_list
+        _, _, main_cells = self.observe(main_agent)
+        for location, agents in potential_agents.items():
+            overlap = self._overlap(location)
+            potential_agents[location] = [
+                agent for agent in agents
+                if all(main_cells[(x, y)] == self.observations[agent.name][2]
+                       [(x - location[0], y - location[1])]
+                       for x, y in overlap)]
 
         return potential_agents
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _overlap(location):
+        """
+        Returns the locations in the local vision that are also in the local
+        vision of an agent at the given relative location.
+        """
+        vision = set(VISION_OFFSETS)
+        return [(x, y) for x, y in VISION_OFFSETS
+                if (x - location[0], y - location[1]) in vision]
+
     def merge_agent_graphs(self, main_agent, potential_agents):
         """
         If the agent identified the other agent they will merge their graphs.
@@ -168,94 +236,245 @@ class Strategist(Server):
         for location, agent in potential_agents.items():
             if len(agent) == 1:
                 agent = agent[0]
-                if agent._user_id not in main_agent.beliefs.current.keys():
-                    if main_agent._user_id < agent._user_id:
-                        new_graph = merge_graphs(main_agent.beliefs,
-                                                 main_agent._user_id,
-                                                 agent.beliefs,
-                                                 agent._user_id,
-                                                 location)
-                        print(f'{agent._user} merged with {main_agent._user}')
-                    else:
-                        new_graph = merge_graphs(agent.beliefs,
-                                                 agent._user_id,
-                                                 main_agent.beliefs,
-                                                 main_agent._user_id,
-                                                 (-location[0], -location[1]))
-                        print(f'{main_agent._user} merged with {agent._user}')
-
-                    for agent in new_graph.current:
-                        self.get_agent(agent).beliefs = new_graph
-
+                if not self.groups.same(main_agent._user_id, agent._user_id):
+                    self.fold_graphs(main_agent, agent, location)
                 else:
                     self.calculate_dimensions(main_agent, agent, location)
 
-    def calculate_dimensions(self, main_agent, agent, location):
-        location = list(location)
-        main_location = main_agent.beliefs.\
-            get_current(main_agent._user_id).location
-        agent_location = agent.beliefs.\
-            get_current(agent._user_id).location
+    def fold_graphs(self, main_agent, agent, location):
+        """
+        Fold the smaller graph of the two agents into the larger one, and
+        let all agents of the smaller graph's group use the merged graph.
 
-        if main_location[0] + location[0] != agent_location[0]:
-            if main_location[0] <= 0:
-                location[0] = -location[0]
+        Arguments
+        ---------
+        main_agent: SuperAgent
+            The agent who identified the other agent.
+        agent: SuperAgent
+            The identified agent.
+        location: (int, int)
+            The location of the identified agent relative to the main agent.
+        """
+        with self.lock_groups(main_agent, agent):
+            if len(main_agent.beliefs.nodes) >= len(agent.beliefs.nodes):
+                large, small, offset = main_agent, agent, location
+            else:
+                large, small, offset = agent, main_agent, \
+                    (-location[0], -location[1])
+
+            large_x, large_y = self.locate(large)
+            small_x, small_y = self.locate(small)
+            translation = (large_x + offset[0] - small_x,
+                           large_y + offset[1] - small_y)
+
+            small_root = self.groups.find(small._user_id)[0]
+            folded = self.groups.members(small._user_id)
+            new_graph = merge_graphs(large.beliefs, large._user_id,
+                                     small.beliefs, small._user_id, offset)
+            self.groups.union(large._user_id, small._user_id, translation)
+            stats = new_graph.merge_stats
+            print(f'{small._user} merged with {large._user} '
+                  f'({stats["nodes"][1]} into {stats["nodes"][0]} '
+                  f'nodes in {stats["time"] * 1000:.1f} ms)')
+
+            # The agents of the folded group use the graph, and the lock, of
+            # the other group.
+            for agent_id in folded:
+                self.locks[agent_id] = self.get_lock(large._user_id)
+                member = self.get_agent(agent_id)
+                if member:
+                    member.beliefs = new_graph
+                    self.translate_observation(member, small_root)
+
+    def get_lock(self, agent_id):
+        """
+        Returns the lock of the graph of the agent. The lock changes when
+        the group of the agent is merged into another group.
 
-            width = abs(main_location[0]) + location[0] + \
-                abs(agent_location[0])
+        Arguments
+        ---------
+        agent_id: int
+            The id of the agent.
+        """
+        return self.locks.setdefault(agent_id, threading.RLock())
 
-            if not main_agent.beliefs.width or \
-                    main_agent.beliefs.width/width == \
-                    round(main_agent.beliefs.width/width):
-                self.apply_dimensions(width=width)
+    @contextmanager
+    def lock_groups(self, *agents):
+        """
+        Context manager which holds the locks of the graphs of the agents.
+        An agent only holds the lock of its own graph, the strategist
+        acquires the locks in a fixed order.
+        """
+        locks = sorted({self.get_lock(agent._user_id) for agent in agents},
+                       key=id)
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def translate_observation(self, agent, old_root):
+        """
+        Translate the location of the latest observation of an agent whose
+        graph was folded into the graph of another group. The observation
+        itself is relative to the agent and stays valid, so it does not have
+        to be computed again.
 
-        if main_location[1] + location[1] != agent_location[1]:
-            if main_location[1] <= 0:
-                location[1] = -location[1]
+        Arguments
+        ---------
+        agent: SuperAgent
+            The agent whose graph was folded.
+        old_root: int
+            The root of the group of the agent before the merge, whose
+            coordinates the observation uses.
+        """
+        if agent.name not in self.observations:
+            return
+        (step, location), local_agents, cells = self.observations[agent.name]
+        root = self.groups.find(agent._user_id)[0]
+        location = agent.beliefs.modulate(
+            self.groups.translate(location, old_root, root))
+        self.observations[agent.name] = ((step, location), local_agents,
+                                         cells)
+
+    def locate(self, agent):
+        """
+        Returns the location of the agent in the coordinates of its graph.
+        """
+        return agent.beliefs.get_current(agent._user_id).location
 
-            height = abs(main_location[1]) + location[1] + \
-                abs(agent_location[1])
+    def get_dimensions(self, agent):
+        """
+        Returns the width and height known to the graph of the agent, None
+        if not known.
+        """
+        return agent.beliefs.width, agent.beliefs.height
 
-            if not main_agent.beliefs.height or \
-                    main_agent.beliefs.height/height == \
-                    round(main_agent.beliefs.height/height):
-                self.apply_dimensions(height=height)
+    def calculate_dimensions(self, main_agent, agent, location):
+        """
+        Find the dimensions of the map from two agents of the same group.
+        If the agent is not seen where the graph believes it is, the agents
+        went around the map, so the difference is the width or height.
+
+        Arguments
+        ---------
+        main_agent: SuperAgent
+            The agent who identified the other agent.
+        agent: SuperAgent
+            The identified agent.
+        location: (int, int)
+            The location of the identified agent relative to the main agent.
+        """
+        main_location = self.locate(main_agent)
+        agent_location = self.locate(agent)
+        known_width, known_height = self.get_dimensions(main_agent)
+
+        width = abs(agent_location[0] - main_location[0] - location[0])
+        if width and known_width and \
+                known_width/width != round(known_width/width):
+            width = 0
+
+        height = abs(agent_location[1] - main_location[1] - location[1])
+        if height and known_height and \
+                known_height/height != round(known_height/height):
+            height = 0
+
+        if width or height:
+            self.apply_dimensions(width=width, height=height)
 
     def apply_dimensions(self, width=0, height=0):
+        """
+        Apply the dimensions to the graphs of all agents. Agents in the same
+        belief group share their graph, so the dimensions are applied once
+        per group, and only to graphs which did not know them yet.
+
+        Arguments
+        ---------
+        width, height: int
+            The dimensions of the map, 0 if not found.
+        """
+        groups = {}
         for agent in self.get_agents():
-            if width != 0 and not agent.beliefs.width:
-                print(f'Width of {width} applied')
-                agent.beliefs.width = width
-            if height != 0 and not agent.beliefs.height:
-                print(f'Height of {height} applied')
-                agent.beliefs.height = height
-            agent.beliefs.apply_dimensions_to_graph()
+            root = self.groups.find(agent._user_id)[0]
+            groups.setdefault(root, agent)
+
+        applied = set()
+        for agent in groups.values():
+            with self.lock_groups(agent):
+                graph = agent.beliefs
+                changed = False
+                if width != 0 and not graph.width:
+                    graph.width = width
+                    applied.add(f'Width of {width}')
+                    changed = True
+                if height != 0 and not graph.height:
+                    graph.height = height
+                    applied.add(f'Height of {height}')
+                    changed = True
+                if changed:
+                    graph.apply_dimensions_to_graph()
+
+        for dimension in sorted(applied, reverse=True):
+            print(f'{dimension} applied')
+
+    def assign_role(self, agent, role):
+        """
+        Assign a role to an agent. The agent switches to the role when it
+        selects its next action, so roles can be rebalanced while playing.
+
+        Arguments
+        ---------
+        agent: SuperAgent, str or int
+            The agent, or its name or user_id.
+        role: str
+            The name of the role, one of ROLES.
+        """
+        if role not in ROLES:
+            raise ValueError(f"Unknown role {role!r}, expected one of "
+                             f"{', '.join(ROLES)}")
+        if isinstance(agent, (str, int)):
+            name, agent = agent, self.get_agent(agent)
+            if not agent:
+                raise ValueError(f"Unknown agent {name!r}")
+        agent.assigned_role = role
+
+    def get_roles(self):
+        """
+        Returns the names of the roles assigned to the agents, by the name
+        of the agent.
+        """
+        return {agent.name: agent.assigned_role
+                for agent in self.get_agents()}
 
     def get_number_graphs(self):
         """
         Returns the total number of graphs used by all the agents combined.
         """
-        agents = [agent._user_id for agent in self.get_agents()]
-        pairs = []
-        while agents != []:
-            temp = list(self.get_agent(agents[0]).beliefs.current.keys())
-            pairs.append(temp)
-            agents = [x for x in agents if x not in temp]
-        return len(pairs)
+        for agent in self.get_agents():
+            self.groups.add(agent._user_id)
+        return self.groups.count
 
     def get_agents(self, name=''):
         """
         Return a list of all active agents/threads.
-        (Minus the MainThread and the Strategist).
+        (Minus the Strategist and threads that are no agents).
+        If agents are registered, the registered agents are returned instead.
 
         Arguments
         ---------
         name: str
             The name of the agent which will not be returned. Default is ''
         """
-        ex = ['MainThread', 'Strategist', name]
-        agents = [thread for thread in threading.enumerate() if thread.name
-                  not in ex]
+        if self.agents:
+            return [agent for agent in self.agents.values()
+                    if agent.name != name]
+
+        # Other threads, e.g. the one loading the model, are no agents.
+        ex = ['Strategist', name]
+        agents = [thread for thread in threading.enumerate()
+                  if isinstance(thread, Server) and thread.name not in ex]
         return agents
 
     def get_agent(self, name):
@@ -278,24 +497,67 @@ class Strategist(Server):
                 return agent[0]
         return False
 
-    @staticmethod
-    def _compare_nodes(node_1, node_2, step):
+
+class StepBarrier(object):
+    """
+    Barrier on which agent threads wait until all agents reached the same
+    step, or until the timeout expires.
+    """
+    def __init__(self, parties, timeout=1.0):
+        """
+        Arguments
+        ---------
+        parties: int
+            The number of agents that take part.
+        timeout: float
+            The default maximum number of seconds an agent waits for the
+            others.
+        """
+        self.parties = parties
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self._arrived = {}
+
+        # The latest step of which the barrier released the agents, agents
+        # that arrive late for it do not wait.
+        self._released = -1
+
+    def wait(self, step, timeout=None):
         """
-        Compare two nodes based of their information about the terrain and
-        things.
+        Wait until all agents arrived at the given step. Returns False if
+        the timeout expired first or if the barrier of the step was released
+        before the agent arrived.
 
         Arguments
         ---------
-        node_1, node_2: Node
-            The nodes in question
         step: int
-            The current game step (used when comparing things).
+            The step of the arriving agent.
+        timeout: float
+            The maximum number of seconds to wait, by default the timeout of
+            the barrier.
         """
-        if node_1.get_terrain()[0] != node_2.get_terrain()[0]:
-            return False
-        if set(node_1.get_things(step)) != set(node_2.get_things(step)):
-            return False
-        return True
+        with self._condition:
+            if step <= self._released:
+                return False
+
+            # Forget the barriers of older steps, which releases the agents
+            # that are still waiting on them.
+            old_steps = [s for s in self._arrived if s < step]
+            for old_step in old_steps:
+                del self._arrived[old_step]
+            if old_steps:
+                self._condition.notify_all()
+            self._released = max(self._released, step - 1)
+
+            self._arrived[step] = self._arrived.get(step, 0) + 1
+            if self._arrived[step] >= self.parties:
+                self._released = step
+                self._condition.notify_all()
+                return True
+
+            return self._condition.wait_for(
+                lambda: self._arrived.get(step, self.parties) >= self.parties,
+                self.timeout if timeout is None else max(timeout, 0))
 
 
 if __name__ == "__main__":
@@ -1,111 +1,80 @@
+from .helpers import Agent
 from .helpers import BDIAgent
-from .attacker import Attacker
-from .builder import Builder
-from .defender import Defender
-from .mapper import Mapper
-from .spy import Spy
+from .helpers.agent import DeadlineExceeded
+from .role import load_role
 
 import json
 import time
 import threading
 
-AGENTS = [Attacker, Builder, Defender, Mapper, Spy]
 
+class SuperAgent(Agent, BDIAgent):
+    # The role an agent plays until the strategist assigns another one.
+    default_role = 'attacker'
 
-class SuperAgent(*AGENTS, BDIAgent):
+    # Seconds reserved before the deadline for sending the action and
+    # seconds of the budget that must be left to select an action by
+    # planning, otherwise the fallback action is used.
+    deadline_margin = 0.1
+    min_planning_time = 0.05
+
+    # Hold the lock of the graph while updating the beliefs and selecting an
+    # action, so merges and the other agents sharing the graph can not change
+    # it meanwhile. The strategist keeps a lock per graph, without the
+    # strategist the agent uses a lock of its own.
+    lock_beliefs = True
+    beliefs_lock = None
+    strategist = None
+    barrier = None
 
     def __init__(self, user, pw, print_json=False,
-                 timer=False, print_queue=False):
+                 timer=False, print_queue=False, role=None):
         super().__init__(user, pw, print_json)
         BDIAgent.__init__(self)
         self._timer = timer
         self._print_queue = print_queue
 
+        # The role the agent plays and the name of the role assigned to it.
+        # Roles are assigned by the strategist from its own thread, the
+        # agent switches when it selects its next action.
+        self.role = None
+        self.role_name = None
+        self.assigned_role = role or self.default_role
+
+        # The number of steps in which the action was sent after the
+        # deadline and in which the fallback action was used.
+        self.missed_deadlines = 0
+        self.fallback_actions = 0
+
+        # The percepts of which the beliefs were not updated yet, because a
+        # merge held the beliefs until the deadline.
+        self.pending_percepts = []
+
     def run(self):
         """
         Function that runs the agents.
         """
-        strategist = [agent for agent in threading.enumerate()
-                      if agent.name == 'Strategist'][0]
+        strategist = next((agent for agent in threading.enumerate()
+                           if agent.name == 'Strategist'), None)
         if strategist:
             self.input_queue = strategist.input_queue
             self.output_queue = strategist.output_queue
+            self.barrier = strategist.barrier
+            if self.lock_beliefs:
+                self.strategist = strategist
         else:
             print('Agents play without the strategist.')
+        if self.strategist is None:
+            self.beliefs_lock = threading.Lock()
 
         while True:
             # Receive a message.
             msg = self.receive_msg()
 
-            time.sleep(0.6)  # uncomment to add delay per step in agent.
-
             if msg:
                 # Parse the response.
                 if msg["type"] == "request-action":
-                    # Get the request id
-                    request_id = self._get_request_id(msg)
-                    agent_id = self._user_id
-                    # Update beliefs
-                    self.beliefs.update(msg, agent_id)
-
-                    # Send a message to the strategist that the agent's beliefs
-                    # have been updated. The agents will continue when all
-                    # agents updated their belief.
-                    if hasattr(self, 'input_queue'):
-                        self.input_queue.put(('update', self))
-                        self.input_queue.join()
-
-                        self.input_queue.put(('merge', self))
-
-                    # TODO: Listen to strategist thread for role
-                    # TODO: Set role as chosen by strategist
-                    agent_type = AGENTS[0]
-
-                    # # Read last action if it randomly failed
-                    if msg['content']['percept']['lastActionResult'] == \
-                            'failed_random' and self.last_intention:
-                        if self.last_intention.method.__name__ != "nav_to":
-                            self.add_last_intention()
-
-                    if self._print_queue:
-                        self.pretty_print([x.description
-                                           for x in self.intention_queue])
-
-                    # If intention queue is empty, add intention (temporary)
-                    # TODO: Check if it can be removed
-                    if not self.intention_queue:
-                        # Get intention from agent_type
-                        intention_addition = agent_type.get_intention(self)
-
-                        if intention_addition:
-                            print("Got intention")
-                            self.add_intention(*intention_addition)
-
-                    # Check if the first intention should be dropped
-                    dropped = self.drop_intention(self.beliefs)
-
-                    print("Dropped:", dropped)
-
-                    request_id = self._get_request_id(msg)
-
-                    action = self.execute_intention()
-
-                    if action and not dropped:
-                        self.send_request(self._add_request_id(action,
-                                          request_id))
-                    else:
-                        action = self.skip()
-                        self.send_request(
-                            self._add_request_id(action, request_id))
-                        self.pretty_print("Done with action", request_id)
-
-                    # Provide timing information
-                    if self._timer:
-                        end_ms = int(round(time.time() * 1000))
-                        diff = msg["content"]["deadline"] - end_ms
-                        time_relation = 'before' if diff >= 0 else 'after'
-                        self.pretty_print(f"done {abs(diff)} ms \
-                                        {time_relation} deadline", request_id)
+                    self.play_step(msg)
 
                 elif msg["type"] == "sim-start":
                     pass
@@ -113,5 +82,259 @@ class SuperAgent(*AGENTS, BDIAgent):
                     pass
                 elif msg["type"] == "bye":
                     self.close_socket()
+                    return
                 else:
                     print(f"Unknown message from the server: {msg['type']}")
+
+    def play_step(self, msg):
+        """
+        Update the beliefs, let the strategist merge them and send the
+        action for a request-action message. The graph is locked while the
+        beliefs are updated and while the action is selected. If a merge or
+        another agent sharing the graph holds the lock until the deadline,
+        the agent acts without waiting for it.
+
+        parameters
+        ----------
+        msg: dict
+            The request-action message from the server.
+        """
+        self.start_step(msg)
+        request_id = self._get_request_id(msg)
+
+        # Every percept is applied, in order, because the location of the
+        # agent follows from its previous actions. Until then the agent does
+        # not know where it is and skips.
+        self.pending_percepts.append(msg)
+        if not self.acquire_beliefs():
+            # Arrive at the barrier without waiting, so the other agents do
+            # not wait for this agent.
+            if self.barrier:
+                self.barrier.wait(msg["content"]["step"], 0)
+            self.fallback_actions += 1
+            self.send_request(self._add_request_id(self.skip(), request_id))
+            self.finish_step(msg)
+            return
+
+        try:
+            while self.pending_percepts:
+                self.update_beliefs(self.pending_percepts.pop(0))
+        finally:
+            self.beliefs_lock.release()
+        with self.profiler.phase('sync_strategist'):
+            self.sync_strategist(msg)
+
+        if self.acquire_beliefs():
+            try:
+                action = self.select_action(msg)
+            finally:
+                self.beliefs_lock.release()
+        else:
+            # The fallback action only reads single entries of the beliefs,
+            # which is safe while they are merged.
+            self.fallback_actions += 1
+            action = self._add_request_id(self.fallback_action(), request_id)
+        self.send_request(action)
+        self.finish_step(msg)
+
+    def acquire_beliefs(self):
+        """
+        Acquire the lock on the beliefs, waiting at most until the local
+        deadline. Returns False if the deadline passed first. The lock of
+        the graph is looked up again if the strategist merged the graph
+        into another graph while the agent waited.
+        """
+        while True:
+            lock = self.get_beliefs_lock()
+            timeout = self.time_left()
+            if timeout == float('inf'):
+                acquired = lock.acquire()
+            else:
+                acquired = lock.acquire(timeout=max(timeout, 0))
+            if not acquired:
+                return False
+            if lock is self.get_beliefs_lock():
+                self.beliefs_lock = lock
+                return True
+            lock.release()
+
+    def get_beliefs_lock(self):
+        """
+        Returns the lock of the graph of the agent.
+        """
+        if self.strategist:
+            return self.strategist.get_lock(self._user_id)
+        return self.beliefs_lock
+
+    def start_step(self, msg):
+        """
+        Set the local deadline of the step. The time budget is the time
+        between the moment the server sent the message and the deadline,
+        minus a margin, and starts when the message is received. This way
+        differences between the clocks of the server and agent do not
+        matter.
+
+        parameters
+        ----------
+        msg: dict
+            The request-action message from the server.
+        """
+        content = msg["content"]
+        if "deadline" in content and "time" in content:
+            budget = (content["deadline"] - content["time"]) / 1000
+            self.deadline = time.time() + budget - self.deadline_margin
+        else:
+            self.deadline = None
+
+    def time_left(self):
+        """
+        Returns the number of seconds left until the local deadline.
+        """
+        if self.deadline is None:
+            return float('inf')
+        return self.deadline - time.time()
+
+    def finish_step(self, msg):
+        """
+        Count the step if the action was sent too late, report the timing
+        if required and let the profiler count the step.
+
+        parameters
+        ----------
+        msg: dict
+            The request-action message from the server.
+        """
+        if self.time_left() < -self.deadline_margin:
+            self.missed_deadlines += 1
+        self.report_timing(msg)
+        self.profiler.end_step(msg["content"]["step"])
+
+    def update_beliefs(self, msg):
+        """
+        Update the beliefs of the agent with the percept of a request-action
+        message.
+
+        parameters
+        ----------
+        msg: dict
+            The request-action message from the server.
+        """
+        with self.profiler.phase('update_beliefs'):
+            self.beliefs.update(msg, self._user_id)
+
+    def sync_strategist(self, msg):
+        """
+        Wait until all agents updated their beliefs (or until the barrier
+        times out) and let the strategist merge the beliefs of the agent.
+        The merge is done in the strategist thread, the agent does not wait
+        for it and acts on its current beliefs.
+
+        parameters
+        ----------
+        msg: dict
+            The request-action message from the server.
+        """
+        if hasattr(self, 'input_queue'):
+            if self.barrier:
+                self.barrier.wait(msg["content"]["step"],
+                                  min(self.barrier.timeout, self.time_left() -
+                                      self.min_planning_time))
+
+            self.input_queue.put(('merge', self))
+
+    def select_action(self, msg):
+        """
+        Returns the action (with request id) the agent performs in response
+        to the given request-action message.
+
+        parameters
+        ----------
+        msg: dict
+            The request-action message from the server.
+        """
+        role = self.update_role()
+
+        # # Read last action if it randomly failed
+        if msg['content']['percept']['lastActionResult'] == \
+                'failed_random' and self.last_intention:
+            if self.last_intention.method.__name__ != "nav_to":
+                self.add_last_intention()
+
+        request_id = self._get_request_id(msg)
+
+        # Use a cheap action if planning could make the action late.
+        if self.time_left() < self.min_planning_time:
+            self.fallback_actions += 1
+            return self._add_request_id(self.fallback_action(), request_id)
+
+        if self._print_queue:
+            self.pretty_print([x.description
+                               for x in self.intention_queue])
+
+        # If intention queue is empty, add intention (temporary)
+        # TODO: Check if it can be removed
+        if not self.intention_queue:
+            # Get intention from the role
+            intention_addition = role.get_intention()
+
+            if intention_addition:
+                print("Got intention")
+                self.add_intention(*intention_addition)
+
+        # Check if the first intention should be dropped
+        with self.profiler.phase('drop_intention'):
+            dropped = self.drop_intention(self.beliefs)
+
+        print("Dropped:", dropped)
+
+        try:
+            with self.profiler.phase('execute_intention'):
+                action = self.execute_intention()
+        except DeadlineExceeded:
+            # Retry the intention in the next step.
+            self.add_last_intention()
+            self.fallback_actions += 1
+            return self._add_request_id(self.fallback_action(), request_id)
+
+        if not action or dropped:
+            action = self.skip()
+            self.pretty_print("Done with action", request_id)
+
+        return self._add_request_id(action, request_id)
+
+    def update_role(self):
+        """
+        Switch to the assigned role if it changed and return the active
+        role. The role and its state are created when switching, the
+        intentions of the previous role are dropped.
+        """
+        name = self.assigned_role
+        if name != self.role_name:
+            self.role = load_role(name)(self)
+            self.role_name = name
+            self.intention_queue.clear()
+            self.last_intention = None
+        return self.role
+
+    def report_timing(self, msg):
+        """
+        Provide timing information if the timer is enabled.
+
+        parameters
+        ----------
+        msg: dict
+            The request-action message from the server.
+        """
+        if self._timer:
+            request_id = self._get_request_id(msg)
+            end_ms = int(round(time.time() * 1000))
+            diff = msg["content"]["deadline"] - end_ms
+            time_relation = 'before' if diff >= 0 else 'after'
+            self.pretty_print(f"done {abs(diff)} ms \
+                            {time_relation} deadline", request_id)
+            n_bytes, n_frames = self.read_stats()
+            self.pretty_print(f"read {n_bytes} bytes in "
+                              f"{n_frames} messages", request_id)
+            self.pretty_print(f"{self.missed_deadlines} deadlines missed, "
+                              f"{self.fallback_actions} fallback actions",
+                              request_id)
@@ -1,26 +1,58 @@
 import sys
 import socket
 import json
+import argparse
+import asyncio
+import os
 from agents import SuperAgent
 from agents import Strategist
+from agents.asyncTeam import run_team
+from agents import processTeam
+from agents.helpers import Agent
+from agents.helpers import Server
+from agents.helpers.modelService import ModelService
+from agents.helpers.server import FrameReader
 from queue import Queue
 
 
 def main():
+    args = parse_args()
+    if args.beliefs == "grid":
+        # Imported here, so NumPy is only loaded for the grid beliefs.
+        from agents.helpers import GridGraph
+        Agent.belief_class = GridGraph
+    if args.record:
+        Server.record_dir = args.record
+    ModelService.backend = args.model_backend
+    if args.profile:
+        Server.profile_dir = args.profile
+        Server.profile_every = args.profile_every
+        Server.profile_format = args.profile_format
+
     teamSize = get_teamSize()
 
     # In case teamSize is returned and not None, start up the agents
-    if teamSize:
+    names = [f"agentA{i}" for i in range(1, (teamSize or 0) + 1)]
+    if teamSize and args.runtime == "async":
+        # Run all agents as tasks in a single event loop.
+        asyncio.run(run_team(names, "1"))
+
+    elif teamSize and args.runtime == "process":
+        # Run the agents in multiple processes, each with an event loop.
+        processTeam.run_team(names, args.workers, "1")
+
+    elif teamSize:
         a_list = []
 
         # The input queue is used to send requests from the agents to
         # the strategist. The output queue for the other way around.
-        input_queue = Queue(maxsize=teamSize)
-        output_queue = Queue(maxsize=teamSize)
+        input_queue = Queue()
+        output_queue = Queue()
 
         # The strategist helps update and merge the graphs.
         # Comment the next 2 lines if you don't want to use a strategist.
-        strategist = Strategist(f"Strategist", [input_queue, output_queue])
+        strategist = Strategist(f"Strategist", [input_queue, output_queue],
+                                team_size=teamSize)
         strategist.start()
 
         for i in range(1, teamSize + 1):
@@ -28,6 +60,43 @@ def main():
             a_list[-1].start()
 
 
+def parse_args():
+    """
+    Returns the parsed command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Run the agents of the team.")
+    parser.add_argument("--runtime", choices=["thread", "async", "process"],
+                        default="thread",
+                        help="Run every agent in its own thread (default), "
+                             "all agents in a single asyncio event loop or "
+                             "the agents in multiple worker processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="The number of worker processes of the process "
+                             "runtime. Defaults to the number of cores.")
+    parser.add_argument("--beliefs", choices=["dict", "grid"], default="dict",
+                        help="Store the beliefs in a dictionary of nodes "
+                             "(default) or in NumPy arrays.")
+    parser.add_argument("--record", metavar="DIR", default=None,
+                        help="Record the messages of every agent in DIR, "
+                             "to replay them with tools/replay.py.")
+    parser.add_argument("--model-backend", choices=["numpy", "keras"],
+                        default="numpy",
+                        help="Predict the paths of enemies with the NumPy "
+                             "export of the model (default) or with Keras.")
+    parser.add_argument("--profile", metavar="DIR", default=None,
+                        help="Measure the time every agent spends in the "
+                             "phases of a step and write the statistics to "
+                             "DIR.")
+    parser.add_argument("--profile-every", metavar="N", type=int,
+                        default=100,
+                        help="The number of steps between two profile "
+                             "summaries.")
+    parser.add_argument("--profile-format", choices=["jsonl", "csv"],
+                        default="jsonl",
+                        help="The format of the profile statistics.")
+    return parser.parse_args()
+
+
 def get_teamSize():
     """
     Returns the configuration of the server as
@@ -59,8 +128,11 @@ def get_teamSize():
     # Send status-request and listen for response
     sock.sendall((json.dumps(request) + "\0").encode())
 
-    msg = sock.recv(65536).decode().split("\0")[0]
-    msg = json.loads(msg)
+    msg = FrameReader(sock).read_frame()
+    if msg is None:
+        print("Connection closed by the server")
+        return
+    msg = json.loads(msg.decode())
     # print(msg)
 
     # If message is received, parse it and return it otherwise return None
@@ -0,0 +1,122 @@
+"""
+Microbenchmark of the priority queue used by D* Lite. Plans a path on a
+toroidal map with scattered obstacles, once with the indexed heap of
+agents/helpers/agent.py and once with the previous list-based queue, which
+rebuilds the heap on every delete. Afterwards obstacles are added on the
+path and the path is repaired. On the default 200x200 map the list-based
+queue needs a couple of minutes.
+
+Usage: python3 tools/benchmark_dstar.py [--size 200] [--density 0.1]
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import time
+
+# get the prefix of the agents directory
+agents_prefix = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, "agents")
+sys.path.insert(0, agents_prefix)
+
+from helpers import agent  # noqa: E402
+from helpers.graph import Graph, Node  # noqa: E402
+
+
+class ListPriorityQueue:
+    """
+    The previous priority queue: O(n) delete and first_key.
+    """
+    def __init__(self):
+        self.elements = []
+
+    def __len__(self):
+        return len(self.elements)
+
+    def put(self, item, priority):
+        heapq.heappush(self.elements, (priority, item))
+
+    def pop(self):
+        return heapq.heappop(self.elements)[1]
+
+    def first_key(self):
+        return heapq.nsmallest(1, self.elements)[0][0]
+
+    def delete(self, node):
+        self.elements = [e for e in self.elements if e[1] != node]
+        heapq.heapify(self.elements)
+
+
+def create_beliefs(size, density, seed=0):
+    """
+    Returns a graph of a size by size map with a fraction density of
+    obstacles. The agent is located at (0, 0).
+    """
+    rnd = random.Random(seed)
+    beliefs = Graph(0)
+    beliefs.width, beliefs.height = size, size
+    beliefs.apply_dimensions_to_graph()
+    for x in range(size):
+        for y in range(size):
+            if (x, y) not in beliefs.nodes:
+                beliefs.nodes[(x, y)] = Node((x, y))
+            if rnd.random() < density and (x, y) != (0, 0):
+                beliefs.nodes[(x, y)].set_terrain('obstacle', 0)
+    return beliefs
+
+
+def run(queue_class, beliefs, goal, new_obstacles):
+    """
+    Plan a path to the goal and repair it after adding obstacles.
+    Returns the time of both and the length of the path.
+    """
+    agent.PriorityQueue = queue_class
+
+    start = time.perf_counter()
+    dstar = agent.DStarLite(beliefs, goal, 0)
+    plan_time = time.perf_counter() - start
+    dstar.last_node = dstar.position
+
+    for node in new_obstacles:
+        beliefs.nodes[node].set_terrain('obstacle', 1)
+    beliefs.log_terrain_changes(new_obstacles)
+
+    start = time.perf_counter()
+    dstar.update(beliefs)
+    repair_time = time.perf_counter() - start
+
+    for node in new_obstacles:
+        beliefs.nodes[node].set_terrain('empty', 0)
+
+    return plan_time, repair_time, dstar.g(dstar.position)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--density", type=float, default=0.1)
+    args = parser.parse_args()
+
+    beliefs = create_beliefs(args.size, args.density)
+    goal = (args.size // 2, args.size // 2)
+    new_obstacles = [(i, i) for i in range(1, args.size // 2, 7)]
+    print(f"{args.size}x{args.size} map, {args.density:.0%} obstacles, "
+          f"goal {goal}")
+
+    results = {}
+    for name, queue_class in [("indexed heap", agent.PriorityQueue),
+                              ("list queue", ListPriorityQueue)]:
+        results[name] = run(queue_class, beliefs, goal, new_obstacles)
+        plan_time, repair_time, cost = results[name]
+        print(f"{name:<13} plan {plan_time * 1000:9.1f} ms   "
+              f"repair {repair_time * 1000:9.1f} ms   path cost {cost:.1f}")
+
+    print(f"speedup       plan "
+          f"{results['list queue'][0] / results['indexed heap'][0]:9.1f} x"
+          f"    repair "
+          f"{results['list queue'][1] / results['indexed heap'][1]:9.1f} x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Memory benchmark of the nodes of a graph. Fills a graph with 10k and 100k
+nodes, of which a fraction contains things on a couple of steps, and
+reports the memory used per node by the compact Node of
+agents/helpers/graph.py, by the previous node layout (a __dict__ per node,
+a dict of neighbour references, a terrain tuple and a things dict per
+node) and by the NumPy arrays of GridNodes.
+
+Usage: python3 tools/benchmark_nodes.py [--sizes 10000 100000]
+                                        [--things 0.1]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+# get the prefix of the agents directory
+agents_prefix = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, "agents")
+sys.path.insert(0, agents_prefix)
+
+from helpers.graph import Node  # noqa: E402
+from helpers.gridGraph import GridNodes  # noqa: E402
+
+
+class DictNode:
+    """
+    The previous node layout.
+    """
+    def __init__(self, location, terrain='empty', step=0):
+        self.location = location
+        self.surr_obstacles = 0
+        self.terrain = (terrain, step)
+        self.things = {}
+        self.directions = {'n': None, 'e': None, 's': None, 'w': None}
+
+    def add_things(self, step, objects):
+        things = self.things.setdefault(step, [])
+        things.extend(objects)
+        self.things[step] = list(dict.fromkeys(things))
+
+
+def observations(n, things, seed=0):
+    """
+    Returns the locations of n nodes on a square map and the things seen on
+    them, as {location: [(step, [(type, details)])]}.
+    """
+    rnd = random.Random(seed)
+    side = int(n ** 0.5) + 1
+    locations = [(x, y) for x in range(side) for y in range(side)][:n]
+    seen = {}
+    for location in locations:
+        if rnd.random() < things:
+            seen[location] = [(step, [(rnd.choice(['entity', 'block']),
+                                       rnd.choice(['A', 'B', 'b0', 'b1']))])
+                              for step in rnd.sample(range(100), 3)]
+    return locations, seen
+
+
+def fill(nodes, node_class, locations, seen):
+    """
+    Add a node for every location, with things, to the mapping.
+    """
+    for location in locations:
+        node = node_class(location, 'empty', 0)
+        for step, objects in seen.get(location, []):
+            node.add_things(step, [tuple(thing) for thing in objects])
+        nodes[location] = node
+    return nodes
+
+
+def measure(create):
+    """
+    Returns the memory in bytes held by the object returned by create.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = create()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10000, 100000])
+    parser.add_argument("--things", type=float, default=0.1,
+                        help="Fraction of the nodes which contain things.")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        locations, seen = observations(n, args.things)
+        results = [
+            ("previous node", measure(
+                lambda: fill({}, DictNode, locations, seen))),
+            ("compact node", measure(
+                lambda: fill({}, Node, locations, seen))),
+            ("grid nodes", measure(
+                lambda: fill(GridNodes(), Node, locations, seen))),
+        ]
+        print(f"{n} nodes, {len(seen)} with things")
+        for name, size in results:
+            print(f"  {name:14} {size / 2 ** 20:8.2f} MiB "
+                  f"{size / n:8.1f} bytes/node")
@@ -0,0 +1,139 @@
+"""
+Measure how fast a team starts: the cold import of the agents and the time
+from launching the Python process until all agents are authenticated with
+a server (tools/mock_server.py, run in this process). Every run starts a
+fresh interpreter, so nothing is cached in memory between runs.
+
+The variants import a module before the agents, to compare with agents
+that load it at startup, e.g. `--variants none keras` shows what importing
+TensorFlow on startup costs.
+
+Usage: python3 tools/benchmark_startup.py [--agents 15] [--runs 5]
+                                          [--variants none numpy keras]
+                                          [--port 12310]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from mock_server import MockServer, Simulation
+
+ROOT = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# Modules of which the benchmark reports if the agents loaded them.
+HEAVY_MODULES = ["numpy", "keras", "tensorflow"]
+
+# Runs in the fresh interpreter: import the variant and the agents, connect
+# and authorize the agents and print the times since launching.
+CHILD = """
+import asyncio, json, sys, time
+launched = float(sys.argv[1])
+started = time.time()
+if sys.argv[2] != "none":
+    __import__(sys.argv[2])
+from agents.asyncTeam import AsyncSuperAgent
+from agents.helpers import Server
+imported = time.time()
+
+Server.port = int(sys.argv[3])
+
+async def authenticate(names):
+    agents = [AsyncSuperAgent(name, "1") for name in names]
+    await asyncio.gather(*[agent.connect_socket() for agent in agents])
+    await asyncio.gather(*[agent.authorize_socket() for agent in agents])
+    authenticated = time.time()
+    for agent in agents:
+        agent.close_socket()
+    return authenticated
+
+authenticated = asyncio.run(authenticate(sys.argv[4:]))
+print("RESULT", json.dumps({
+    "interpreter": started - launched,
+    "import": imported - started,
+    "authenticate": authenticated - launched,
+    "modules": [m for m in %r if m in sys.modules]}))
+""" % HEAVY_MODULES
+
+
+class AuthServer(object):
+    """
+    Runs the connection handling of a MockServer in a background event
+    loop. A new MockServer is used for every run, so every run can
+    authenticate the same agents.
+    """
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.mock = None
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle, host, port))
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    async def handle(self, reader, writer):
+        await self.mock.handle(reader, writer)
+
+    def reset(self, names):
+        self.mock = MockServer(Simulation(names, 70, 70, 0.1),
+                               host=self.host, port=self.port)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def run(server, names, variant):
+    """
+    Launch the agents in a new interpreter and return their times.
+    """
+    server.reset(names)
+    launched = time.time()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, repr(launched), variant,
+         str(server.port)] + names,
+        cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    line = next(line for line in output.splitlines()
+                if line.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--agents", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--variants", nargs="+", default=["none", "keras"],
+                        help="Modules to import before the agents, 'none' "
+                             "for the agents only.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=12310)
+    args = parser.parse_args()
+
+    names = [f"agentA{i}" for i in range(1, args.agents + 1)]
+    server = AuthServer(args.host, args.port)
+    print(f"{args.agents} agents, median of {args.runs} runs (ms)")
+    print(f"{'variant':12}{'interpreter':>13}{'import':>10}"
+          f"{'authenticated':>15}  loaded")
+    try:
+        for variant in args.variants:
+            results = [run(server, names, variant) for _ in range(args.runs)]
+            medians = [statistics.median(result[key] for result in results)
+                       * 1000 for key in ("interpreter", "import",
+                                          "authenticate")]
+            print(f"{variant:12}{medians[0]:13.0f}{medians[1]:10.0f}"
+                  f"{medians[2]:15.0f}  "
+                  f"{', '.join(results[-1]['modules']) or '-'}")
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark of the tour planner of the builder. On a toroidal map with
+scattered obstacle walls it plans random tasks (a taskboard, one dispenser
+for every required block type and a goal) and compares the path cost of
+the planned tours with the tours of the previous greedy choice of the
+nearest stop by Manhattan distance. Both are also checked against all
+orderings and choices of stops. The time of the first plan (which computes
+the distance fields), of planning again in a new step (with the fields
+computed before) and of a repeated query within a step are reported.
+
+Usage: python3 tools/benchmark_tour.py [--size 70] [--density 0.2]
+                                       [--tasks 20] [--types 3]
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+
+# get the prefix of the agents directory
+agents_prefix = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, "agents")
+sys.path.insert(0, agents_prefix)
+
+from helpers.graph import Graph, Node  # noqa: E402
+from helpers.tourPlanner import TourPlanner  # noqa: E402
+
+
+def create_beliefs(size, density, seed=0):
+    """
+    Returns a graph of a size by size map in which a fraction density of
+    the cells is covered by short horizontal and vertical walls.
+    """
+    rnd = random.Random(seed)
+    beliefs = Graph(0)
+    beliefs.width, beliefs.height = size, size
+    beliefs.apply_dimensions_to_graph()
+    for x in range(size):
+        for y in range(size):
+            if (x, y) not in beliefs.nodes:
+                beliefs.nodes[(x, y)] = Node((x, y))
+    for _ in range(int(density * size * size / 6)):
+        x, y = rnd.randrange(size), rnd.randrange(size)
+        dx, dy = rnd.choice([(1, 0), (0, 1)])
+        for i in range(6):
+            location = ((x + i * dx) % size, (y + i * dy) % size)
+            beliefs.nodes[location].set_terrain('obstacle', 0)
+    return beliefs
+
+
+def free_cells(beliefs, rnd, n):
+    """
+    Returns n random cells that are no obstacle.
+    """
+    cells = [location for location, node in beliefs.nodes.items()
+             if not node._is_obstacle()]
+    return rnd.sample(cells, n)
+
+
+def tour_cost(beliefs, start, stops):
+    """
+    Returns the path cost from the start past all stops.
+    """
+    total = 0
+    for stop in stops:
+        total += beliefs.get_distance_field(stop).distance(start)
+        start = stop
+    return total
+
+
+def greedy_tour(start, taskboards, dispensers, goals):
+    """
+    The previous choice: the stop nearest to the agent by Manhattan distance
+    for every stage, the block types in the order of the task.
+    """
+    def nearest(locations):
+        return min(locations, key=lambda location:
+                   abs(location[0] - start[0]) + abs(location[1] - start[1]))
+
+    return [nearest(taskboards)] + \
+        [nearest(locations) for locations in dispensers.values()] + \
+        [nearest(goals)]
+
+
+def best_tour(beliefs, start, taskboards, dispensers, goals):
+    """
+    Returns the cheapest cost over all orderings and choices of stops.
+    """
+    best = float('inf')
+    for order in itertools.permutations(dispensers):
+        for taskboard in taskboards:
+            for choice in itertools.product(*(dispensers[block_type]
+                                              for block_type in order)):
+                for goal in goals:
+                    best = min(best, tour_cost(
+                        beliefs, start, [taskboard, *choice, goal]))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=70)
+    parser.add_argument("--density", type=float, default=0.2)
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--types", type=int, default=3,
+                        help="The number of block types of every task.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    beliefs = create_beliefs(args.size, args.density, args.seed)
+    planner = TourPlanner()
+
+    greedy_costs, planned_costs, optimal_costs = [], [], []
+    first, replan, repeat = [], [], []
+    for task in range(args.tasks):
+        cells = free_cells(beliefs, rnd, 1 + 2 + 3 * args.types + 3)
+        start, taskboards = cells[0], cells[1:3]
+        dispensers = {f"b{i}": cells[3 + 3 * i:6 + 3 * i]
+                      for i in range(args.types)}
+        goals = cells[-3:]
+
+        # Every task is planned in a new step without distance fields.
+        beliefs.clear_distance_fields()
+        beliefs.step = 3 * task
+        query = (beliefs, start, taskboards, dispensers, goals)
+        for times in (first, replan, repeat):
+            if times is replan:
+                beliefs.step += 1
+            begin = time.perf_counter()
+            tour = planner.plan(*query)
+            times.append(time.perf_counter() - begin)
+
+        stops = [tour.taskboard] + [location for _, location in
+                                    tour.dispensers] + [tour.goal]
+        planned_costs.append(tour_cost(beliefs, start, stops))
+        greedy_costs.append(tour_cost(beliefs, start, greedy_tour(
+            start, taskboards, dispensers, goals)))
+        optimal_costs.append(best_tour(*query))
+        assert abs(planned_costs[-1] - optimal_costs[-1]) < 1e-6, \
+            (planned_costs[-1], optimal_costs[-1])
+
+    print(f"{args.tasks} tasks of {args.types} block types on a "
+          f"{args.size}x{args.size} map")
+    print(f"Mean path cost: greedy {statistics.mean(greedy_costs):.1f}, "
+          f"planned {statistics.mean(planned_costs):.1f}, "
+          f"optimal {statistics.mean(optimal_costs):.1f}")
+    for name, times in (("First plan", first),
+                        ("Plan in a new step", replan),
+                        ("Repeated query", repeat)):
+        print(f"{name + ':':20}median {statistics.median(times) * 1000:8.3f}"
+              f" ms, max {max(times) * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
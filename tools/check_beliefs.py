@@ -0,0 +1,251 @@
+"""
+Consistency checks of the beliefs and the planners on small hand-made
+scenarios, e.g. that the path planner of an agent takes into account the
+terrain observed by other agents sharing its graph. Every check raises an
+AssertionError if it fails.
+
+Usage: python3 tools/check_beliefs.py
+"""
+import os
+import pickle
+import sys
+
+# get the prefix of the agents directory
+agents_prefix = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, "agents")
+sys.path.insert(0, agents_prefix)
+
+from helpers.agent import DStarLite, DeadlineExceeded  # noqa: E402
+from helpers.graph import Graph, Node, merge_graphs  # noqa: E402
+
+
+def request_action(step, obstacles=(), things=(), last_action="skip"):
+    """
+    Returns a request-action message with the given obstacles and things
+    relative to the agent, for an agent whose last action was successful.
+    """
+    return {"type": "request-action", "content": {
+        "step": step, "id": step, "percept": {
+            "lastAction": last_action, "lastActionResult": "success",
+            "lastActionParams": ["e"] if last_action == "move" else [],
+            "terrain": {"obstacle": [list(cell) for cell in obstacles]},
+            "things": [{"x": x, "y": y, "type": kind, "details": details}
+                       for (x, y), kind, details in things],
+            "attached": [], "energy": 300, "tasks": [], "score": 0,
+            "task": "", "disabled": False}}}
+
+
+def create_shared_graph(locations, size=30):
+    """
+    Returns a graph of the agents 1, 2, ... at the given locations (as after
+    a merge), in which all cells within size of the origin are known.
+    """
+    beliefs = Graph(1)
+    for x in range(-size, size + 1):
+        for y in range(-size, size + 1):
+            if (x, y) not in beliefs.nodes:
+                beliefs.nodes[(x, y)] = Node((x, y))
+    for agent_id, location in enumerate(locations, 1):
+        beliefs.current[agent_id] = beliefs.nodes[location]
+    return beliefs
+
+
+def check_shared_terrain_changes():
+    """
+    An obstacle observed by one agent changes the path of another agent
+    that shares the graph, like it does for a new planner.
+    """
+    beliefs = create_shared_graph([(0, 0), (10, 0)])
+    beliefs.update(request_action(0), 1)
+    beliefs.update(request_action(0), 2)
+    dstar = DStarLite(beliefs, (20, 0), 1)
+    dstar.last_node = dstar.position
+
+    # Agent 2 sees an obstacle on the path of agent 1, agent 1 itself sees
+    # nothing new.
+    beliefs.update(request_action(1, obstacles=[(5, 0)]), 2)
+    beliefs.update(request_action(1), 1)
+    assert not beliefs.new_obs['obstacles']
+    dstar.update(beliefs)
+
+    fresh = DStarLite(beliefs, (20, 0), 1)
+    assert dstar.terrain_cost((15, 0)) == fresh.terrain_cost((15, 0)) > 1, \
+        (dstar.terrain_cost((15, 0)), fresh.terrain_cost((15, 0)))
+    assert dstar.g(dstar.position) == fresh.g(fresh.position), \
+        (dstar.g(dstar.position), fresh.g(fresh.position))
+
+
+def check_merge_incremental_update():
+    """
+    The first update after a merge finds the same new obstacles and empty
+    cells as an update that rescans the whole vision, also when the merge
+    changed the terrain the agent saw in its previous update.
+    """
+    new_obs = []
+    for rescan in (False, True):
+        # Agent 2, three cells east of agent 1, saw an obstacle in the
+        # vision of agent 1 after agent 1 saw it empty.
+        g1, g2 = Graph(1), Graph(2)
+        g1.update(request_action(0), 1)
+        g2.update(request_action(1, obstacles=[(-1, 0)]), 2)
+        g1 = merge_graphs(g1, 1, g2, 2, (3, 0))
+        assert g1.nodes[(2, 0)].get_terrain()[0] == 'obstacle'
+
+        # Agent 1 did not move and sees the cell empty.
+        if rescan:
+            g1._last_vision = {}
+        g1.update(request_action(2), 1)
+        new_obs.append(g1.new_obs)
+
+    assert new_obs[0] == new_obs[1], new_obs
+    assert new_obs[0]['empty'] == [(2, 0)], new_obs[0]
+
+
+def check_move_after_merge():
+    """
+    After a merge in either direction the agents of both graphs can move on
+    in the merged graph, also past the cells of the other graph.
+    """
+    for offset in ((3, 0), (-3, 0), (0, 3), (0, -3)):
+        for larger in (1, 2):
+            graphs = {1: Graph(1), 2: Graph(2)}
+            for agent_id, graph in graphs.items():
+                graph.update(request_action(0), agent_id)
+
+            # The larger agent walked east and has seen more of the map.
+            for step in range(1, 9):
+                graphs[larger].update(
+                    request_action(step, last_action='move'), larger)
+            # Fold the smaller graph into the larger one, like the
+            # strategist does.
+            smaller = 3 - larger
+            if larger == 2:
+                offset = (-offset[0], -offset[1])
+            x, y = graphs[larger].get_current(larger).location
+            beliefs = merge_graphs(graphs[larger], larger, graphs[smaller],
+                                   smaller, offset)
+            assert beliefs.get_current(smaller).location == \
+                (x + offset[0], y + offset[1])
+
+            for agent_id in (1, 2):
+                for step in range(9, 20):
+                    x, y = beliefs.get_current(agent_id).location
+                    beliefs.update(request_action(step, last_action='move'),
+                                   agent_id)
+                    assert beliefs.get_current(agent_id).location == \
+                        (x + 1, y), (offset, larger, agent_id, step)
+
+
+def check_field_energy():
+    """
+    A distance field is only shared by agents with (about) the same energy,
+    the cost of clearing obstacles depends on it.
+    """
+    beliefs = create_shared_graph([(0, 0)])
+    beliefs.energy = 300
+    full = beliefs.get_distance_field((10, 0))
+    beliefs.energy = 10
+    empty = beliefs.get_distance_field((10, 0))
+    assert empty is not full and empty.obstacle_cost > full.obstacle_cost
+    assert beliefs.get_distance_field((10, 0), create=False) is empty
+    beliefs.energy = 310
+    assert beliefs.get_distance_field((10, 0), create=False) is full
+
+
+def check_field_blocked_step():
+    """
+    If the next step on the cheapest path is blocked, the distance field
+    takes the cheapest path through another neighbour.
+    """
+    beliefs = create_shared_graph([(0, 0)])
+    field = beliefs.get_distance_field((10, 0))
+    assert field.next_step((0, 0)) == (1, 0)
+    step = field.next_step((0, 0), blocked=lambda node: node == (1, 0))
+    assert step in [(0, -1), (0, 1)], step
+
+
+def check_dstar_attached():
+    """
+    D* Lite plans again when blocks are attached, which changes the costs
+    of all nodes, like a new planner does.
+    """
+    beliefs = create_shared_graph([(0, 0)])
+    beliefs.nodes[(5, 0)].set_terrain('obstacle', 0)
+    beliefs.update(request_action(0), 1)
+    dstar = DStarLite(beliefs, (10, 0), 1)
+
+    beliefs.attached = [(1, 0)]
+    dstar.update(beliefs)
+    fresh = DStarLite(beliefs, (10, 0), 1)
+    assert dstar.g(dstar.position) == fresh.g(fresh.position), \
+        (dstar.g(dstar.position), fresh.g(fresh.position))
+
+
+def check_dstar_deadline():
+    """
+    A D* Lite search stopped by the deadline raises DeadlineExceeded in
+    the next update if the deadline passed again, and otherwise finishes
+    the same path as a new planner.
+    """
+    beliefs = create_shared_graph([(0, 0)])
+    beliefs.update(request_action(0), 1)
+    dstar = DStarLite(beliefs, (28, 28), 1, deadline=1)
+    assert dstar.searching
+
+    try:
+        dstar.update(beliefs, deadline=1)
+    except DeadlineExceeded:
+        pass
+    else:
+        raise AssertionError("the search did not stop at the deadline")
+
+    dstar.update(beliefs)
+    fresh = DStarLite(beliefs, (28, 28), 1)
+    assert not dstar.searching
+    assert dstar.g(dstar.position) == fresh.g(fresh.position), \
+        (dstar.g(dstar.position), fresh.g(fresh.position))
+
+
+def check_remote_replica():
+    """
+    A copy of a shared graph in another process, updated with the forwarded
+    percepts, follows the agent like the original graph, skips percepts it
+    already has and keeps the observations of its own agents.
+    """
+    graph = create_shared_graph([(0, 0), (2, 0)])
+    graph.update(request_action(0), 1)
+    replica = pickle.loads(pickle.dumps(graph))
+    replica.update(request_action(0, obstacles=[(1, 1)]), 2)
+    new_obs = replica.new_obs
+
+    for step in range(1, 5):
+        msg = request_action(step, obstacles=[(2, 2)], last_action='move')
+        graph.update(msg, 1)
+        replica.update_remote(msg, 1)
+        replica.update_remote(msg, 1)
+        assert replica.get_current(1).location == \
+            graph.get_current(1).location == (step, 0), step
+    assert replica.new_obs is new_obs
+    assert replica.nodes[(6, 2)].get_terrain()[0] == 'obstacle'
+
+
+CHECKS = [
+    check_shared_terrain_changes,
+    check_merge_incremental_update,
+    check_move_after_merge,
+    check_field_energy,
+    check_field_blocked_step,
+    check_dstar_attached,
+    check_dstar_deadline,
+    check_remote_replica,
+]
+
+
+def main():
+    for check in CHECKS:
+        check()
+        print(f"{check.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Export the weights of a Keras model of LSTM and Dense layers (by default
+the enemy path model of the attacker, agents/model/t1-n=3) to a .npz file
+for the NumPy forward pass of agents/helpers/numpyModel.py. The outputs of
+both are compared on random paths and the export fails if they differ more
+than the tolerance.
+
+Usage: python3 tools/export_model.py [MODEL] [--output FILE]
+                                     [--samples 1000] [--tolerance 1e-4]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# get the prefix of the agents directory
+agents_prefix = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "agents"))
+sys.path.insert(0, agents_prefix)
+
+from helpers.numpyModel import NumpyModel  # noqa: E402
+
+
+def convert(model):
+    """
+    Returns a NumpyModel with the layers and weights of a Keras model.
+
+    Arguments
+    ---------
+    model: keras.Model
+        A sequential model of LSTM and Dense layers.
+    """
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__.lower()
+        config = layer.get_config()
+        if kind == 'lstm':
+            if config['return_sequences'] or config['go_backwards'] or \
+                    config['stateful']:
+                raise ValueError(f"Unsupported LSTM layer {layer.name}")
+            kernel, recurrent_kernel, bias = layer.get_weights()
+            layers.append(('lstm', {
+                'activation': config['activation'],
+                'recurrent_activation': config['recurrent_activation'],
+            }, {'kernel': kernel, 'recurrent_kernel': recurrent_kernel,
+                'bias': bias}))
+        elif kind == 'dense':
+            kernel, bias = layer.get_weights()
+            layers.append(('dense', {'activation': config['activation']},
+                           {'kernel': kernel, 'bias': bias}))
+        elif kind != 'inputlayer':
+            raise ValueError(f"Unsupported layer {layer.name} ({kind})")
+    return NumpyModel(layers)
+
+
+def compare(model, numpy_model, samples, seed=0):
+    """
+    Returns the maximum absolute difference between the outputs of both
+    models on random paths, together with the time per single prediction
+    of both.
+    """
+    rnd = np.random.default_rng(seed)
+    steps, features = model.input_shape[1:]
+    starts = rnd.integers(-50, 50, (samples, 1, features))
+    moves = rnd.integers(-2, 3, (samples, steps, features))
+    paths = (starts + np.cumsum(moves, axis=1)).astype(np.float32)
+
+    expected = model.predict_on_batch(paths)
+    difference = np.abs(numpy_model.predict_on_batch(paths) - expected).max()
+
+    timing = []
+    for predict in (model.predict_on_batch, numpy_model.predict_on_batch):
+        predict(paths[:1])
+        start = time.perf_counter()
+        for path in paths[:100]:
+            predict(path[None])
+        timing.append((time.perf_counter() - start) / 100)
+    return difference, timing
+
+
+def main():
+    default = os.path.join(agents_prefix, "model", "t1-n=3")
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("model", nargs="?", default=default,
+                        help="The Keras model to export.")
+    parser.add_argument("--output", default=None,
+                        help="The .npz file, by default MODEL.npz.")
+    parser.add_argument("--samples", type=int, default=1000,
+                        help="The number of random paths to compare.")
+    parser.add_argument("--tolerance", type=float, default=1e-4,
+                        help="The maximum absolute difference allowed.")
+    args = parser.parse_args()
+
+    from keras.models import load_model
+    model = load_model(args.model, compile=False)
+    numpy_model = convert(model)
+
+    difference, (keras_time, numpy_time) = \
+        compare(model, numpy_model, args.samples)
+    print(f"Maximum difference on {args.samples} paths: {difference:.2e}")
+    print(f"Single prediction: Keras {keras_time * 1000:.3f} ms, "
+          f"NumPy {numpy_time * 1000:.3f} ms")
+    if not difference <= args.tolerance:
+        sys.exit(f"The outputs differ more than {args.tolerance}, "
+                 f"nothing exported")
+
+    output = args.output or args.model + ".npz"
+    numpy_model.save(output)
+    print(f"Exported to {output}")
+
+
+if __name__ == "__main__":
+    main()
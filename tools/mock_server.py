@@ -0,0 +1,447 @@
+"""
+Lightweight stand-in for the MASSim server, to load test the agents without
+the Java server. It speaks the same NUL-terminated JSON protocol
+(status-request, auth-request, sim-start, request-action and bye) and
+simulates a single team on a toroidal grid with obstacles, goals,
+dispensers, blocks and taskboards. Only the actions the agents currently use
+are simulated (move, clear, request, attach, detach, rotate and skip) and
+in a simplified way, e.g. a clear action removes an obstacle at once.
+
+After the last step the throughput of the team, the response times and the
+deadline misses per agent are reported.
+
+Usage: python3 tools/mock_server.py [--agents 10] [--steps 100]
+                                    [--step-time 4000] [--step-interval 0]
+                                    [--width 70] [--height 70]
+                                    [--port 12300] [--seed 0]
+Then run e.g. `python3 main.py --runtime async` in another terminal.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+# get the prefix of the agents directory
+agents_prefix = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, "agents")
+sys.path.insert(0, agents_prefix)
+
+from helpers.server import FrameReader  # noqa: E402
+from helpers.graph import VISION_OFFSETS  # noqa: E402
+
+DIRECTIONS = {'n': (0, -1), 'e': (1, 0), 's': (0, 1), 'w': (-1, 0)}
+
+
+class Simulation(object):
+    """
+    The state of the world: the terrain, the things and the positions of the
+    agents of the team.
+    """
+    def __init__(self, names, width=70, height=70, obstacles=0.1,
+                 dispensers=6, blocks=10, goals=12, taskboards=3,
+                 block_types=3, fail_rate=0.0, seed=0):
+        """
+        Arguments
+        ---------
+        names: list of str
+            The names of the agents.
+        width, height: int
+            The dimensions of the toroidal grid.
+        obstacles: float
+            The fraction of cells that are obstacles.
+        dispensers, blocks, goals, taskboards: int
+            The number of things of each kind placed on the grid.
+        block_types: int
+            The number of block types.
+        fail_rate: float
+            The probability that an action fails randomly.
+        seed: int
+            Seed of the random generator.
+        """
+        self.width, self.height = width, height
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        types = [f"b{i}" for i in range(block_types)]
+
+        cells = [(x, y) for x in range(width) for y in range(height)]
+        self.random.shuffle(cells)
+        free = iter(cells)
+
+        self.obstacles = set(next(free) for _ in
+                             range(int(obstacles * width * height)))
+        self.goals = set(next(free) for _ in range(goals))
+        self.taskboards = set(next(free) for _ in range(taskboards))
+        self.dispensers = {next(free): self.random.choice(types)
+                           for _ in range(dispensers)}
+        self.blocks = {next(free): self.random.choice(types)
+                       for _ in range(blocks)}
+        self.positions = {name: next(free) for name in names}
+        self.entities = {pos: name for name, pos in self.positions.items()}
+
+        # The absolute positions of the blocks attached to every agent.
+        self.attached = {name: set() for name in names}
+        self.last_action = {name: ("no_action", [], "success")
+                            for name in names}
+
+    def modulate(self, location):
+        return (location[0] % self.width, location[1] % self.height)
+
+    def relative(self, location, origin):
+        """
+        Returns the shortest toroidal offset of the location from the origin.
+        """
+        dx = (location[0] - origin[0] + self.width // 2) % self.width - \
+            self.width // 2
+        dy = (location[1] - origin[1] + self.height // 2) % self.height - \
+            self.height // 2
+        return (dx, dy)
+
+    def is_free(self, location):
+        return location not in self.obstacles and \
+            location not in self.entities and location not in self.blocks
+
+    def percept(self, name):
+        """
+        Returns the percept of the agent, like the request-action message
+        of the MASSim server.
+        """
+        x, y = self.positions[name]
+        things, terrain = [], {}
+        for dx, dy in VISION_OFFSETS:
+            cell = self.modulate((x + dx, y + dy))
+            if cell in self.obstacles:
+                terrain.setdefault("obstacle", []).append([dx, dy])
+            elif cell in self.goals:
+                terrain.setdefault("goal", []).append([dx, dy])
+
+            if cell in self.entities:
+                things.append({"x": dx, "y": dy, "details": "A",
+                               "type": "entity"})
+            if cell in self.blocks:
+                things.append({"x": dx, "y": dy, "details": self.blocks[cell],
+                               "type": "block"})
+            if cell in self.dispensers:
+                things.append({"x": dx, "y": dy,
+                               "details": self.dispensers[cell],
+                               "type": "dispenser"})
+            if cell in self.taskboards:
+                things.append({"x": dx, "y": dy, "details": "",
+                               "type": "taskboard"})
+
+        action, params, result = self.last_action[name]
+        return {"lastActionParams": params, "score": 0, "task": "",
+                "lastAction": action, "things": things,
+                "attached": [list(self.relative(block, (x, y)))
+                             for block in self.attached[name]],
+                "disabled": False, "terrain": terrain,
+                "lastActionResult": result, "tasks": [], "energy": 300}
+
+    def execute(self, name, action):
+        """
+        Execute the action of the agent and store its result. An action of
+        None means the agent did not respond in time.
+        """
+        if action is None:
+            self.last_action[name] = ("no_action", [], "success")
+            return
+
+        action_type = action["content"]["type"]
+        params = list(action["content"].get("p", []))
+        if action_type != "skip" and self.random.random() < self.fail_rate:
+            result = "failed_random"
+        else:
+            handler = getattr(self, f"_{action_type}", None)
+            try:
+                result = handler(name, *params) if handler else "failed"
+            except (TypeError, KeyError, ValueError):
+                result = "failed_parameter"
+        self.last_action[name] = (action_type, params, result)
+
+    def _skip(self, name):
+        return "success"
+
+    def _move(self, name, direction):
+        return self._displace(name, shift=DIRECTIONS[direction])
+
+    def _rotate(self, name, rotation):
+        return self._displace(name, rotation=rotation)
+
+    def _displace(self, name, shift=(0, 0), rotation=None):
+        """
+        Move the agent and rotate its attached blocks around it, if all
+        new locations are free.
+        """
+        position = self.positions[name]
+        new_position = self.modulate((position[0] + shift[0],
+                                      position[1] + shift[1]))
+        new_blocks = {}
+        for block in self.attached[name]:
+            x, y = self.relative(block, position)
+            if rotation == "cw":
+                x, y = -y, x
+            elif rotation == "ccw":
+                x, y = y, -x
+            new_blocks[block] = self.modulate((new_position[0] + x,
+                                               new_position[1] + y))
+
+        own = self.attached[name] | {position}
+        for cell in list(new_blocks.values()) + [new_position]:
+            if cell not in own and not self.is_free(cell):
+                return "failed_path"
+
+        types = {block: self.blocks.pop(block) for block in new_blocks}
+        for block, cell in new_blocks.items():
+            self.blocks[cell] = types[block]
+        self.attached[name] = set(new_blocks.values())
+
+        del self.entities[position]
+        self.entities[new_position] = name
+        self.positions[name] = new_position
+        return "success"
+
+    def _clear(self, name, x, y):
+        cell = self.modulate((self.positions[name][0] + int(x),
+                              self.positions[name][1] + int(y)))
+        if cell not in self.obstacles:
+            return "failed_target"
+        self.obstacles.discard(cell)
+        return "success"
+
+    def _adjacent(self, name, direction):
+        dx, dy = DIRECTIONS[direction]
+        x, y = self.positions[name]
+        return self.modulate((x + dx, y + dy))
+
+    def _request(self, name, direction):
+        cell = self._adjacent(name, direction)
+        if cell not in self.dispensers:
+            return "failed_target"
+        if not self.is_free(cell):
+            return "failed_blocked"
+        self.blocks[cell] = self.dispensers[cell]
+        return "success"
+
+    def _attach(self, name, direction):
+        cell = self._adjacent(name, direction)
+        if cell not in self.blocks or \
+                any(cell in blocks for blocks in self.attached.values()):
+            return "failed_target"
+        self.attached[name].add(cell)
+        return "success"
+
+    def _detach(self, name, direction):
+        cell = self._adjacent(name, direction)
+        if cell not in self.attached[name]:
+            return "failed_target"
+        self.attached[name].discard(cell)
+        return "success"
+
+
+class MockServer(object):
+    """
+    Accepts the connections of the agents and runs the match when the whole
+    team is authenticated.
+    """
+    def __init__(self, simulation, steps=100, step_time=4000,
+                 step_interval=0, host="localhost", port=12300):
+        """
+        Arguments
+        ---------
+        simulation: Simulation
+            The world in which the match is played.
+        steps: int
+            The number of steps of the match.
+        step_time: int
+            The time in ms the agents have to respond (the deadline).
+        step_interval: int
+            The minimal time in ms between the start of two steps, 0 to
+            start the next step as soon as all agents responded.
+        """
+        self.simulation = simulation
+        self.steps = steps
+        self.step_time = step_time
+        self.step_interval = step_interval
+        self.host, self.port = host, port
+        self.team_size = len(simulation.positions)
+
+        self.writers = {}
+        self.actions = {}
+        self.step = -1
+        self.all_responded = asyncio.Event()
+        self.authenticated = asyncio.Event()
+        self.done = asyncio.Event()
+
+        # Statistics
+        self.response_times = []
+        self.missed = {name: 0 for name in simulation.positions}
+
+    @staticmethod
+    def _encode(msg):
+        return (json.dumps(msg) + "\0").encode()
+
+    async def handle(self, stream_reader, writer):
+        """
+        Handle the messages of a single connection until it is closed.
+        """
+        try:
+            await self._handle(stream_reader, writer)
+        except (asyncio.CancelledError, ConnectionError):
+            # The connection is still open when the server shuts down.
+            pass
+        writer.close()
+
+    async def _handle(self, stream_reader, writer):
+        reader, name = FrameReader(), None
+        while True:
+            while not reader.pending():
+                data = await stream_reader.read(reader.chunk_size)
+                if not data:
+                    return
+                reader.feed(data)
+            msg = json.loads(reader.read_frame().decode())
+
+            if msg["type"] == "status-request":
+                writer.write(self._encode({
+                    "type": "status-response",
+                    "content": {"teams": ["A"], "teamSizes": [self.team_size],
+                                "currentSimulation": -1,
+                                "time": int(time.time() * 1000)}}))
+
+            elif msg["type"] == "auth-request":
+                user = msg["content"]["user"]
+                ok = user in self.simulation.positions and \
+                    user not in self.writers
+                writer.write(self._encode({
+                    "type": "auth-response",
+                    "content": {"result": "ok" if ok else "fail"}}))
+                if ok:
+                    name = user
+                    self.writers[name] = writer
+                    if len(self.writers) == self.team_size:
+                        self.authenticated.set()
+
+            elif msg["type"] == "action" and name:
+                # Late actions are ignored, like by the MASSim server.
+                if msg["content"]["id"] == self.step and \
+                        name not in self.actions:
+                    self.actions[name] = msg
+                    self.response_times.append(
+                        time.time() - self.step_start)
+                    if len(self.actions) == self.team_size:
+                        self.all_responded.set()
+
+    async def broadcast(self, create_msg):
+        for name, writer in self.writers.items():
+            writer.write(self._encode(create_msg(name)))
+        await asyncio.gather(*[writer.drain() for writer in
+                               self.writers.values()],
+                             return_exceptions=True)
+
+    async def run_match(self):
+        """
+        Play all steps of the match and say bye.
+        """
+        await self.authenticated.wait()
+        print(f"{self.team_size} agents connected, starting the match")
+
+        await self.broadcast(lambda name: {
+            "type": "sim-start",
+            "content": {"time": int(time.time() * 1000), "percept": {
+                "name": name, "team": "A", "teamSize": self.team_size,
+                "steps": self.steps, "vision": 5}}})
+
+        match_start = time.time()
+        for step in range(self.steps):
+            self.actions = {}
+            self.all_responded.clear()
+            self.step = step
+            self.step_start = time.time()
+            now = int(self.step_start * 1000)
+
+            await self.broadcast(lambda name: {
+                "type": "request-action",
+                "content": {"id": step, "step": step, "time": now,
+                            "deadline": now + self.step_time,
+                            "percept": self.simulation.percept(name)}})
+
+            try:
+                await asyncio.wait_for(self.all_responded.wait(),
+                                       self.step_time / 1000)
+            except asyncio.TimeoutError:
+                pass
+
+            for name in self.simulation.positions:
+                if name not in self.actions:
+                    self.missed[name] += 1
+                self.simulation.execute(name, self.actions.get(name))
+
+            remaining = self.step_interval / 1000 - \
+                (time.time() - self.step_start)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+        self.duration = time.time() - match_start
+        await self.broadcast(lambda name: {"type": "bye", "content": {}})
+        for writer in self.writers.values():
+            writer.close()
+        self.done.set()
+
+    def report(self):
+        """
+        Print the throughput, response times and deadline misses.
+        """
+        n_actions = len(self.response_times)
+        times = sorted(self.response_times) or [0]
+        print(f"{self.steps} steps of {self.team_size} agents in "
+              f"{self.duration:.2f} s: {self.steps / self.duration:.1f} "
+              f"steps/s, {n_actions / self.duration:.1f} actions/s")
+        print(f"response time mean {sum(times) / len(times) * 1000:.1f} ms, "
+              f"p95 {times[int(0.95 * (len(times) - 1))] * 1000:.1f} ms, "
+              f"max {times[-1] * 1000:.1f} ms")
+        missed = sum(self.missed.values())
+        print(f"deadline misses {missed} of {self.steps * self.team_size} "
+              f"actions")
+        for name, count in self.missed.items():
+            if count:
+                print(f"  {name:<10} {count}")
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"Listening on {self.host}:{self.port}")
+        async with server:
+            await self.run_match()
+        self.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--step-time", type=int, default=4000,
+                        help="Time in ms until the deadline of a step.")
+    parser.add_argument("--step-interval", type=int, default=0,
+                        help="Minimal time in ms between two steps.")
+    parser.add_argument("--width", type=int, default=70)
+    parser.add_argument("--height", type=int, default=70)
+    parser.add_argument("--obstacles", type=float, default=0.1,
+                        help="Fraction of the cells that are obstacles.")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Probability that an action fails randomly.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=12300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    names = [f"agentA{i}" for i in range(1, args.agents + 1)]
+    simulation = Simulation(names, args.width, args.height, args.obstacles,
+                            fail_rate=args.fail_rate, seed=args.seed)
+    server = MockServer(simulation, args.steps, args.step_time,
+                        args.step_interval, args.host, args.port)
+    asyncio.run(server.serve())
+
+
+if __name__ == "__main__":
+    main()
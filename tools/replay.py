@@ -0,0 +1,201 @@
+"""
+Replay the messages recorded with `python3 main.py --record DIR` without a
+server. The recorded percepts of every step are fed to the agents, the
+strategist merges their beliefs and the agents select their actions, in the
+same order as the async runtime. The time spent on updating the beliefs,
+merging and selecting actions (which includes the planning) is reported, so
+the agents can be benchmarked and profiled reproducibly.
+
+Usage: python3 tools/replay.py DIR [--steps N] [--beliefs {dict,grid}]
+                               [--no-strategist] [--profile FILE]
+                               [--phases DIR] [--verbose]
+"""
+import argparse
+import contextlib
+import cProfile
+import glob
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from queue import Queue
+
+# get the prefix of the root directory
+root_prefix = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir)
+sys.path.insert(0, root_prefix)
+
+from agents import SuperAgent, Strategist  # noqa: E402
+from agents.helpers import Agent, GridGraph  # noqa: E402
+
+
+class ReplayAgent(SuperAgent):
+    """
+    SuperAgent which reads the recorded messages instead of connecting to
+    the server. Sent actions are kept in sent.
+    """
+    connect_on_init = False
+    record_dir = None
+
+    def __init__(self, user, records, print_json=False):
+        """
+        parameters
+        ----------
+        user: str
+            The username of the agent.
+        records: list
+            The recorded lines of the agent.
+        """
+        super().__init__(user, "1", print_json)
+        self.received = deque(line["msg"] for line in records
+                              if line["dir"] == "in")
+        self.recorded = [line["msg"] for line in records
+                         if line["dir"] == "out"]
+        self.sent = []
+
+    def receive_msg(self):
+        return self.received.popleft() if self.received else None
+
+    def send_request(self, request):
+        self.sent.append(request)
+
+    def close_socket(self):
+        pass
+
+
+def load_records(directory):
+    """
+    Returns a dictionary of the username and the recorded lines of every
+    agent in the directory.
+    """
+    records = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.jsonl"))):
+        user = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as f:
+            records[user] = [json.loads(line) for line in f if line.strip()]
+    return records
+
+
+def replay(records, steps=None, use_strategist=True):
+    """
+    Replay the records step by step. Returns the agents and the time spent
+    per phase in seconds.
+
+    Arguments
+    ---------
+    records: dict
+        The recorded lines of every agent as returned by load_records.
+    steps: int
+        The maximum number of steps to replay, all if None.
+    use_strategist: bool
+        If the strategist merges the beliefs of the agents.
+    """
+    # Sort on the agent number, like the names given by main.py.
+    names = sorted(records, key=lambda name: (len(name), name))
+    agents = [ReplayAgent(name, records[name]) for name in names]
+
+    strategist = None
+    if use_strategist:
+        strategist = Strategist("Strategist", [Queue(), Queue()])
+        for agent in agents:
+            strategist.register(agent)
+
+    timing = {"update": 0.0, "merge": 0.0, "action": 0.0}
+    step = 0
+    while steps is None or step < steps:
+        messages = []
+        for agent in agents:
+            msg = agent.receive_msg()
+            while msg and msg["type"] != "request-action":
+                msg = agent.receive_msg()
+            if msg:
+                messages.append((agent, msg))
+        if not messages:
+            break
+
+        start = time.perf_counter()
+        for agent, msg in messages:
+            agent.start_step(msg)
+            agent.update_beliefs(msg)
+        timing["update"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        if strategist:
+            for agent, msg in messages:
+                strategist.merge(agent)
+        timing["merge"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for agent, msg in messages:
+            agent.send_request(agent.select_action(msg))
+            agent.finish_step(msg)
+        timing["action"] += time.perf_counter() - start
+
+        step += 1
+
+    return agents, step, timing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("directory", help="Directory with the records.")
+    parser.add_argument("--steps", type=int, default=None,
+                        help="The maximum number of steps to replay.")
+    parser.add_argument("--beliefs", choices=["dict", "grid"],
+                        default="dict")
+    parser.add_argument("--no-strategist", action="store_true",
+                        help="Replay without merging the beliefs.")
+    parser.add_argument("--profile", default=None,
+                        help="Write cProfile statistics to this file.")
+    parser.add_argument("--phases", metavar="DIR", default=None,
+                        help="Write the time spent in the phases of every "
+                             "step per agent to DIR.")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Show the output of the agents.")
+    args = parser.parse_args()
+
+    if args.beliefs == "grid":
+        Agent.belief_class = GridGraph
+    if args.phases:
+        ReplayAgent.profile_dir = args.phases
+
+    records = load_records(args.directory)
+    if not records:
+        print(f"No records found in {args.directory}")
+        return
+
+    profiler = cProfile.Profile() if args.profile else None
+    output = contextlib.nullcontext() if args.verbose else \
+        contextlib.redirect_stdout(io.StringIO())
+    with output:
+        if profiler:
+            profiler.enable()
+        agents, steps, timing = replay(records, args.steps,
+                                       not args.no_strategist)
+        if profiler:
+            profiler.disable()
+        for agent in agents:
+            agent.profiler.close()
+
+    if profiler:
+        profiler.dump_stats(args.profile)
+
+    print(f"Replayed {steps} steps of {len(agents)} agents")
+    for phase, seconds in timing.items():
+        print(f"{phase:<8} {seconds * 1000:10.1f} ms total  "
+              f"{seconds * 1000 / max(steps, 1):8.2f} ms per step")
+
+    # Actions that differ from the recorded ones, e.g. after a change in the
+    # agents or because the recorded run merged at other moments.
+    same = sum(sent == recorded for agent in agents
+               for sent, recorded in zip(agent.sent, agent.recorded))
+    total = sum(min(len(agent.sent), len(agent.recorded)) for agent in agents)
+    print(f"{same}/{total} actions equal to the recorded actions")
+    print(f"{sum(agent.fallback_actions for agent in agents)} fallback "
+          f"actions")
+
+
+if __name__ == "__main__":
+    main()